@@ -0,0 +1,93 @@
+"""
+Цена сжатия ответов: время CPU на ответ против сэкономленных байт.
+
+Запуск из корня репозитория:
+
+    python benchmarks/compression.py
+
+Тело - список тендеров или предложений, как в GET /api/tenders и
+GET /api/bids/{tenderId}/list: UUID, описания до 500 символов. Для каждой
+доступной кодировки и уровня печатается время сжатия одного ответа, размер
+и доля сэкономленных байт. Отдельно - потоковая отдача по частям со сбросом
+после каждой части. По этим числам подбирается COMPRESSION_LEVELS для маршрутов.
+"""
+
+import json
+import os
+import random
+import string
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+from compression import ENCODERS  # noqa: E402
+
+LEVELS = (1, 3, 6, 9)
+
+
+def words(rng: random.Random, length: int) -> str:
+    text = []
+    while sum(map(len, text)) < length:
+        text.append("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))))
+    return " ".join(text)[:length]
+
+
+def payload(items: int, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    rows = [
+        {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": words(rng, 40),
+            "description": words(rng, rng.randint(100, 500)),
+            "status": rng.choice(["Created", "Published", "Closed"]),
+            "serviceType": rng.choice(["Construction", "Delivery", "Manufacture"]),
+            "organizationId": str(uuid.UUID(int=rng.getrandbits(128))),
+            "version": rng.randint(1, 5),
+            "createdAt": "2024-09-10T12:00:00+03:00",
+        }
+        for _ in range(items)
+    ]
+    return json.dumps(rows).encode()
+
+
+def measure(encoder_cls, level: int, body: bytes, chunk: int | None, repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoder = encoder_cls(level)
+        size = 0
+        if chunk is None:
+            size = len(encoder.compress(body)) + len(encoder.finish())
+        else:
+            for i in range(0, len(body), chunk):
+                size += len(encoder.compress(body[i : i + chunk])) + len(encoder.flush())
+            size += len(encoder.finish())
+        best = min(best, time.perf_counter() - start)
+    return best, size
+
+
+def main() -> None:
+    for items in (5, 50, 500):
+        body = payload(items)
+        print(f"\n{items} items, {len(body)} bytes")
+        print(f"{'encoding':>8} {'level':>5} {'us/resp':>9} {'bytes':>8} {'saved':>6} {'MB/s':>7}")
+        for name, encoder_cls in ENCODERS.items():
+            for level in LEVELS:
+                seconds, size = measure(encoder_cls, level, body, None, repeat=20)
+                print(
+                    f"{name:>8} {level:>5} {seconds * 1e6:9.0f} {size:8} "
+                    f"{1 - size / len(body):6.1%} {len(body) / seconds / 1e6:7.1f}"
+                )
+
+    body = payload(500)
+    print("\nstreaming 500 items in 4 KiB chunks with flush after each chunk")
+    print(f"{'encoding':>8} {'level':>5} {'us/resp':>9} {'bytes':>8} {'saved':>6}")
+    for name, encoder_cls in ENCODERS.items():
+        seconds, size = measure(encoder_cls, 6, body, 4096, repeat=10)
+        print(f"{name:>8} {6:>5} {seconds * 1e6:9.0f} {size:8} {1 - size / len(body):6.1%}")
+
+
+if __name__ == "__main__":
+    main()
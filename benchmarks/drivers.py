@@ -0,0 +1,105 @@
+"""
+psycopg2 против psycopg 3 на запросах трех обработчиков: страница тендеров
+(список), статус тендера (проверка автора и статус - в psycopg 3 одним
+pipeline, см. database/driver.py) и редактирование предложения.
+
+psycopg 3 гоняется дважды: без подготовленных запросов и с
+prepare_threshold = --prepare-threshold. Круг до базы задерживается через
+TCP-прокси из write_round_trips.py. Запуск из корня репозитория (нужен extra
+psycopg3):
+
+    POSTGRES_CONN=postgresql://... python benchmarks/drivers.py --rtt-ms 1 --requests 2000
+
+Печатается скорость и задержки для каждой пары (драйвер, операция). После
+замера тестовые данные удаляются.
+"""
+
+import argparse
+import os
+import sys
+
+os.environ.setdefault("SERVER_ADDRESS", "127.0.0.1:8080")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+import database.queries as queries  # noqa: E402
+from config import setings  # noqa: E402
+from database.driver import execute_pipelined  # noqa: E402
+from sqlalchemy import create_engine, make_url  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from write_round_trips import DelayProxy, bid_values, create_fixtures, drop_fixtures, run, run_edits  # noqa: E402
+
+
+def list_tenders(engine, ids: dict) -> None:
+    with Session(engine) as session:
+        session.execute(queries.tenders_page(None, ids["username"], 10, 0)).all()
+
+
+def tender_status(engine, ids: dict) -> None:
+    with Session(engine) as session:
+        creator, current = execute_pipelined(
+            session, queries.tender_creator(ids["tender"]), queries.tender_status(ids["tender"])
+        )
+        creator.one()
+        current.one()
+
+
+def edit_bid(engine, ids: dict, bid_id) -> None:
+    with Session(engine) as session:
+        session.execute(queries.edit_bid(bid_id, ids["username"], "bench", "bench")).one()
+        session.commit()
+
+
+def create_bids(engine, ids: dict, count: int) -> list:
+    with Session(engine) as session:
+        bids = [
+            session.execute(
+                queries.create_bid(bid_values(ids), {"name": "bench", "description": "bench"})
+            ).one()[0]
+            for _ in range(count)
+        ]
+        session.commit()
+    return bids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=1.0, help="добавочная задержка круга до базы")
+    parser.add_argument("--prepare-threshold", type=int, default=setings.db_prepare_threshold or 5)
+    args = parser.parse_args()
+
+    url = make_url(setings.postgress_conn)
+    direct = create_engine(url)
+    ids = create_fixtures(direct)
+    try:
+        bids = create_bids(direct, ids, args.concurrency)
+        if args.rtt_ms > 0:
+            proxy = DelayProxy(url.host or "127.0.0.1", url.port or 5432, args.rtt_ms / 2000)
+            url = url.set(host="127.0.0.1", port=proxy.start())
+        variants = [
+            ("psycopg2", "postgresql+psycopg2", {}),
+            ("psycopg", "postgresql+psycopg", {"prepare_threshold": None}),
+            ("psycopg prepare", "postgresql+psycopg", {"prepare_threshold": args.prepare_threshold}),
+        ]
+        for name, drivername, connect_args in variants:
+            engine = create_engine(
+                url.set(drivername=drivername),
+                pool_size=args.concurrency,
+                max_overflow=0,
+                pool_timeout=300,
+                connect_args=connect_args,
+            )
+            run("warmup", lambda: engine.connect().close(), args.concurrency, args.concurrency)
+            run(f"{name} list", lambda: list_tenders(engine, ids), args.requests, args.concurrency)
+            run(f"{name} status", lambda: tender_status(engine, ids), args.requests, args.concurrency)
+            run_edits(
+                f"{name} edit", lambda bid: edit_bid(engine, ids, bid), bids, args.requests, args.concurrency
+            )
+            engine.dispose()
+    finally:
+        drop_fixtures(direct, ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Создание предложений пачкой запросов: коммит на каждый запрос против
+группового коммита (BID_GROUP_COMMIT).
+
+Запуск из корня репозитория на базе со схемой из posgresql/create.sql:
+
+    POSTGRES_CONN=postgresql://... python benchmarks/group_commit.py --requests 5000 --concurrency 200
+
+Скрипт создает сотрудника, организацию и тендер, затем concurrency потоков
+одновременно создают requests предложений - так же, как это делает
+POST /api/bids/new, - и печатает пропускную способность и задержки. После
+замера тестовые данные удаляются.
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("SERVER_ADDRESS", "127.0.0.1:8080")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+import database.queries as queries  # noqa: E402
+from config import setings  # noqa: E402
+from database.coalescer import BidCoalescer  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+
+def create_fixtures(engine) -> dict:
+    ids = {
+        "employee": str(uuid.uuid4()),
+        "organization": str(uuid.uuid4()),
+        "tender": str(uuid.uuid4()),
+        "username": f"bench_{uuid.uuid4().hex[:12]}",
+    }
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO employee (id, username) VALUES (:employee, :username)"), ids
+        )
+        conn.execute(
+            text("INSERT INTO organization (id, name) VALUES (:organization, 'bench')"), ids
+        )
+        conn.execute(
+            text(
+                "INSERT INTO organization_responsible (organization_id, user_id) "
+                "VALUES (:organization, :employee)"
+            ),
+            ids,
+        )
+        conn.execute(
+            text(
+                "INSERT INTO tender (id, status, organization_id, creator_username) "
+                "VALUES (:tender, 'Published', :organization, :username)"
+            ),
+            ids,
+        )
+        conn.execute(
+            text(
+                "INSERT INTO tender_version (tender_id, name, description, service_type) "
+                "VALUES (:tender, 'bench', 'bench', 'Delivery')"
+            ),
+            ids,
+        )
+    return ids
+
+
+def drop_fixtures(engine, ids: dict) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM bid WHERE tender_id = :tender"), ids)
+        conn.execute(text("DELETE FROM tender WHERE id = :tender"), ids)
+        conn.execute(text("DELETE FROM organization WHERE id = :organization"), ids)
+        conn.execute(text("DELETE FROM employee WHERE id = :employee"), ids)
+
+
+def bid_values(ids: dict) -> tuple[dict, dict]:
+    bid = {
+        "status": "Created",
+        "tender_id": ids["tender"],
+        "organization_id": ids["organization"],
+        "creator_username": ids["username"],
+    }
+    return bid, {"name": "bench", "description": "bench"}
+
+
+def create_direct(engine, ids: dict) -> None:
+    """Тот же путь, что create_bid без группового коммита"""
+    bid, version = bid_values(ids)
+    with Session(engine) as session:
+        session.execute(queries.create_bid(bid, version)).one()
+        session.commit()
+
+
+def run(name: str, call, requests: int, concurrency: int) -> None:
+    latencies = []
+
+    def timed(_):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{name:>14}: {requests / elapsed:8.0f} bids/s  "
+        f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=setings.pool_size)
+    parser.add_argument("--window", type=float, default=setings.bid_group_commit_window)
+    parser.add_argument("--max-batch", type=int, default=setings.bid_group_commit_max_batch)
+    args = parser.parse_args()
+
+    engine = create_engine(
+        setings.postgress_conn,
+        pool_size=args.pool_size,
+        max_overflow=0,
+        pool_timeout=300,
+    )
+    ids = create_fixtures(engine)
+    try:
+        run("per-request", lambda: create_direct(engine, ids), args.requests, args.concurrency)
+        writer = BidCoalescer(engine, args.window, args.max_batch, wait_timeout=300)
+        bid, version = bid_values(ids)
+        run(
+            "group commit",
+            lambda: writer.submit(dict(bid), dict(version)),
+            args.requests,
+            args.concurrency,
+        )
+        stats = writer.stats()
+        print(f"group commit: {stats['batches']} batches, {stats['rows'] / stats['batches']:.1f} rows/batch")
+    finally:
+        drop_fixtures(engine, ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Пропускная способность сервера в dev-режиме (reload, один процесс) и в
+продакшн-режиме (пул воркеров, uvloop/httptools если установлены).
+
+Запуск из корня репозитория (нужны SERVER_ADDRESS и POSTGRES_CONN):
+
+    python benchmarks/launcher.py --workers 4 --duration 10 --path /api/ping
+
+Для каждого режима поднимается `core/main.py`, нагрузка подается из
+отдельных процессов по keep-alive соединениям, результат - запросы в секунду
+и запросы в секунду на ядро.
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_ready(host: str, port: int, path: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", path)
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def client(host: str, port: int, path: str, duration: float, connections: int, out) -> None:
+    conns = [http.client.HTTPConnection(host, port, timeout=10) for _ in range(connections)]
+    done = 0
+    stop = time.monotonic() + duration
+    while time.monotonic() < stop:
+        for conn in conns:
+            conn.request("GET", path)
+            conn.getresponse().read()
+            done += 1
+    out.put(done)
+
+
+def run_mode(name: str, env: dict, args) -> float:
+    host, port = args.address.split(":")
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "core", "main.py")],
+        env={**os.environ, **env, "SERVER_ADDRESS": args.address},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    try:
+        wait_ready(host, int(port), args.path)
+        out = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(
+                target=client,
+                args=(host, int(port), args.path, args.duration, args.connections, out),
+            )
+            for _ in range(args.clients)
+        ]
+        for proc in clients:
+            proc.start()
+        total = sum(out.get() for _ in clients)
+        for proc in clients:
+            proc.join()
+    finally:
+        # reload-режим держит дочерний процесс, гасим всю группу
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+    rps = total / args.duration
+    cores = int(env.get("WEB_CONCURRENCY", 1))
+    print(f"{name:<6} workers={cores:<3} {rps:10.0f} req/s {rps / cores:10.0f} req/s/core")
+    return rps
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", default="127.0.0.1:8099")
+    parser.add_argument("--path", default="/api/ping")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--connections", type=int, default=8)
+    args = parser.parse_args()
+
+    dev = run_mode("dev", {"RELOAD": "true", "UVICORN_LOOP": "asyncio", "UVICORN_HTTP": "h11"}, args)
+    prod = run_mode("prod", {"RELOAD": "false", "WEB_CONCURRENCY": str(args.workers)}, args)
+    print(f"speedup x{prod / dev:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Редактирование и откат предложений до и после миграции
+posgresql/migrations/004_membership_triggers.sql.
+
+До миграции триггеры validate_*_organization на каждом UPDATE считают
+COUNT(*) по organization_responsible без индекса, после - срабатывают только
+при смене organization_id или creator_username. Запуск из корня репозитория:
+
+    POSTGRES_CONN=postgresql://... python benchmarks/membership_triggers.py --requests 5000 --concurrency 50
+    psql "$POSTGRES_CONN" -f posgresql/migrations/004_membership_triggers.sql
+    POSTGRES_CONN=postgresql://... python benchmarks/membership_triggers.py --requests 5000 --concurrency 50
+
+Скрипт создает организацию с --members ответственными, по предложению на
+каждый поток и выполняет те же запросы, что PATCH /api/bids/{bidId}/edit и
+PUT /api/bids/{bidId}/rollback/{version}. После замера тестовые данные
+удаляются.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("SERVER_ADDRESS", "127.0.0.1:8080")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+import database.queries as queries  # noqa: E402
+from config import setings  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+
+def create_fixtures(engine, members: int, bids: int) -> dict:
+    prefix = f"bench_{uuid.uuid4().hex[:8]}"
+    ids = {
+        "organization": str(uuid.uuid4()),
+        "tender": str(uuid.uuid4()),
+        "prefix": prefix,
+        "username": f"{prefix}_0",
+        "members": members,
+    }
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO organization (id, name) VALUES (:organization, 'bench')"), ids)
+        conn.execute(
+            text(
+                "INSERT INTO employee (username) "
+                "SELECT :prefix || '_' || i FROM generate_series(0, :members - 1) i"
+            ),
+            ids,
+        )
+        conn.execute(
+            text(
+                "INSERT INTO organization_responsible (organization_id, user_id) "
+                "SELECT :organization, id FROM employee WHERE username LIKE :prefix || '\\_%'"
+            ),
+            ids,
+        )
+        conn.execute(
+            text(
+                "INSERT INTO tender (id, status, organization_id, creator_username) "
+                "VALUES (:tender, 'Published', :organization, :username)"
+            ),
+            ids,
+        )
+        conn.execute(
+            text(
+                "INSERT INTO tender_version (tender_id, name, description, service_type) "
+                "VALUES (:tender, 'bench', 'bench', 'Delivery')"
+            ),
+            ids,
+        )
+        ids["bids"] = []
+        for _ in range(bids):
+            row = conn.execute(
+                queries.create_bid(
+                    {
+                        "status": "Created",
+                        "tender_id": ids["tender"],
+                        "organization_id": ids["organization"],
+                        "creator_username": ids["username"],
+                    },
+                    {"name": "bench", "description": "bench"},
+                )
+            ).one()
+            ids["bids"].append(row[0])
+    return ids
+
+
+def drop_fixtures(engine, ids: dict) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM tender WHERE id = :tender"), ids)
+        conn.execute(text("DELETE FROM organization WHERE id = :organization"), ids)
+        conn.execute(text("DELETE FROM employee WHERE username LIKE :prefix || '\\_%'"), ids)
+
+
+def edit(engine, bid_id, username) -> None:
+    """Тот же запрос, что edit_bid"""
+    with Session(engine) as session:
+        session.execute(queries.edit_bid(bid_id, username, "bench", "bench")).one()
+        session.commit()
+
+
+def rollback(engine, bid_id, username) -> None:
+    """Тот же запрос, что rollback_bid"""
+    with Session(engine) as session:
+        session.execute(queries.rollback_bid(bid_id, 1, username)).one()
+        session.commit()
+
+
+def run(name: str, call, bids: list, requests: int, concurrency: int) -> None:
+    # у каждого потока свое предложение: версии одного предложения конфликтуют
+    local = threading.local()
+    free = list(bids)
+    free_lock = threading.Lock()
+    latencies = []
+
+    def timed(_):
+        if not hasattr(local, "bid"):
+            with free_lock:
+                local.bid = free.pop()
+        start = time.perf_counter()
+        call(local.bid)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{name:>9}: {requests / elapsed:8.0f} req/s  "
+        f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--members", type=int, default=10000)
+    args = parser.parse_args()
+
+    engine = create_engine(
+        setings.postgress_conn,
+        pool_size=args.concurrency,
+        max_overflow=0,
+        pool_timeout=300,
+    )
+    ids = create_fixtures(engine, args.members, args.concurrency)
+    try:
+        username = ids["username"]
+        run("edit", lambda bid: edit(engine, bid, username), ids["bids"], args.requests, args.concurrency)
+        run(
+            "rollback",
+            lambda bid: rollback(engine, bid, username),
+            ids["bids"],
+            args.requests,
+            args.concurrency,
+        )
+    finally:
+        drop_fixtures(engine, ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Накладные расходы ограничителя частоты на один запрос.
+
+Запуск из корня репозитория:
+
+    python benchmarks/ratelimit.py
+
+Меряется RateLimiter.check при разном числе активных ключей и полный проход
+ASGI-запроса через RateLimitMiddleware по сравнению с голым приложением.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+from ratelimit import RateLimiter, RateLimitMiddleware  # noqa: E402
+
+
+def bench_check(keys: int, number: int = 200_000) -> float:
+    limiter = RateLimiter(limit=10**9, period=1, max_keys=keys)
+    names = [("/api/bids/my", f"user{i}") for i in range(keys)]
+    for key in names:
+        limiter.check(key)
+    it = iter(names * (number // keys + 1))
+    check = limiter.check
+    seconds = timeit.timeit(lambda: check(next(it)), number=number)
+    return seconds / number * 1e9
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"[]"})
+
+
+async def noop_send(message):
+    pass
+
+
+async def noop_receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def run_requests(handler, users: int, number: int) -> float:
+    scopes = [
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/bids/my",
+            "query_string": f"username=user{i}&limit=50".encode(),
+        }
+        for i in range(users)
+    ]
+    start = time.perf_counter()
+    for i in range(number):
+        await handler(scopes[i % users], noop_receive, noop_send)
+    return (time.perf_counter() - start) / number * 1e9
+
+
+def main() -> None:
+    for keys in (1, 1_000, 100_000):
+        print(f"check, {keys:>7} keys: {bench_check(keys):8.0f} ns/op")
+
+    number = 200_000
+    limited = RateLimitMiddleware(
+        app, quotas={"/api/bids/my": f"{10**9}/1"}, max_keys=100_000, idle_ttl=600
+    )
+    bare = asyncio.run(run_requests(app, 1_000, number))
+    with_limit = asyncio.run(run_requests(limited, 1_000, number))
+    print(f"asgi bare:          {bare:8.0f} ns/request")
+    print(f"asgi rate limited:  {with_limit:8.0f} ns/request")
+    print(f"overhead:           {with_limit - bare:8.0f} ns/request")
+
+
+if __name__ == "__main__":
+    main()
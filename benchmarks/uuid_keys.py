@@ -0,0 +1,123 @@
+"""
+Вставка строк с первичным ключом uuid4 против uuid7 (core/database/ids.py).
+
+Запуск из корня репозитория:
+
+    POSTGRES_CONN=postgresql://... python benchmarks/uuid_keys.py --rows 5000000
+
+Скрипт создает две таблицы формы bid (bench_keys_v4 и bench_keys_v7), вставляет
+в каждую --rows строк пачками по --batch из --concurrency потоков и по мере
+роста печатает скорость вставки и размер индекса первичного ключа. Разница
+заметна, когда индекс перестает помещаться в shared_buffers: случайные ключи
+v4 пишут в случайные страницы и расщепляют их, v7 дописываются справа. Если
+в базе есть расширение pgstattuple, в конце печатается плотность листьев
+индекса. После замера таблицы удаляются.
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("SERVER_ADDRESS", "127.0.0.1:8080")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+from config import setings  # noqa: E402
+from database.ids import uuid7  # noqa: E402
+from sqlalchemy import create_engine, text  # noqa: E402
+
+TABLES = {"v4": ("bench_keys_v4", uuid.uuid4), "v7": ("bench_keys_v7", uuid7)}
+
+
+def create_table(engine, table: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        conn.execute(
+            text(
+                f"CREATE TABLE {table} ("
+                "id UUID PRIMARY KEY, "
+                "tender_id UUID NOT NULL, "
+                "status VARCHAR(20) NOT NULL, "
+                "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+            )
+        )
+
+
+def insert_batch(engine, table: str, generate, size: int, tender_id: uuid.UUID) -> None:
+    rows = [{"id": generate(), "tender_id": tender_id} for _ in range(size)]
+    with engine.begin() as conn:
+        conn.execute(
+            text(f"INSERT INTO {table} (id, tender_id, status) VALUES (:id, :tender_id, 'Created')"),
+            rows,
+        )
+
+
+def index_size(engine, table: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT pg_relation_size('{table}_pkey')")).scalar()
+
+
+def leaf_density(engine, table: str) -> str:
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                text(f"SELECT avg_leaf_density, leaf_fragmentation FROM pgstatindex('{table}_pkey')")
+            ).one()
+        return f"leaf density {row[0]:.1f}%, fragmentation {row[1]:.1f}%"
+    except Exception:
+        return "leaf density: no pgstattuple"
+
+
+def run(engine, name: str, args) -> None:
+    table, generate = TABLES[name]
+    create_table(engine, table)
+    tender_id = uuid7()
+    step = max(args.rows // args.reports, args.batch)
+    done = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        while done < args.rows:
+            size = min(step, args.rows - done)
+            batches = [args.batch] * (size // args.batch)
+            if size % args.batch:
+                batches.append(size % args.batch)
+            step_start = time.perf_counter()
+            list(pool.map(lambda n: insert_batch(engine, table, generate, n, tender_id), batches))
+            done += size
+            print(
+                f"{name}: {done:>10} rows  "
+                f"{size / (time.perf_counter() - step_start):8.0f} rows/s  "
+                f"index {index_size(engine, table) / 2**20:8.1f} MB"
+            )
+    print(
+        f"{name}: total {args.rows / (time.perf_counter() - start):8.0f} rows/s, "
+        f"{leaf_density(engine, table)}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--reports", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="не удалять таблицы после замера")
+    args = parser.parse_args()
+
+    engine = create_engine(
+        setings.postgress_conn, pool_size=args.concurrency, max_overflow=0, pool_timeout=300
+    )
+    try:
+        for name in TABLES:
+            run(engine, name, args)
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                for table, _ in TABLES.values():
+                    conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+if __name__ == "__main__":
+    main()
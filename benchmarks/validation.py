@@ -0,0 +1,157 @@
+"""
+Валидация и сериализация моделей core/models.py: прежние поля-RootModel
+против именованных Annotated-типов.
+
+Запуск из корня репозитория:
+
+    python benchmarks/validation.py --items 50 --seconds 0.5
+
+Прежняя версия models.py берется из истории git (коммит перед заменой
+RootModel, либо --baseline <rev>). Для каждой модели запросов и ответов
+печатается число операций в секунду: validate - model_validate из словаря,
+как после разбора тела или при сборке ответа в обработчике, dump -
+model_dump_json(by_alias=True), как при отправке ответа.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import types
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "core"))
+
+import models  # noqa: E402
+
+
+def baseline_revision() -> str:
+    # последний коммит, где менялось число RootModel-полей, - это замена
+    removed = subprocess.check_output(
+        ["git", "log", "-1", "--format=%H", "-S", "class TenderId(RootModel", "--", "core/models.py"],
+        cwd=ROOT,
+        text=True,
+    ).strip()
+    return f"{removed}^"
+
+
+def load_baseline(revision: str) -> types.ModuleType:
+    source = subprocess.check_output(
+        ["git", "show", f"{revision}:core/models.py"], cwd=ROOT, text=True
+    )
+    module = types.ModuleType("models_baseline")
+    # pydantic ищет аннотации в sys.modules по имени модуля
+    sys.modules[module.__name__] = module
+    exec(compile(source, f"{revision}:core/models.py", "exec"), module.__dict__)
+    return module
+
+
+def samples(items: int) -> dict:
+    ident = str(uuid.uuid4())
+    tender = {
+        "id": ident,
+        "creator_username": "Тендер на доставку",
+        "description": "Доставка оборудования на склад заказчика",
+        "service_type": "Delivery",
+        "status": "Published",
+        "organization_id": ident,
+        "active_version": 3,
+        "created_at": "2006-01-02 15:04:05",
+    }
+    bid = {
+        "id": ident,
+        "creator_username": "user1",
+        "description": "Выполним за неделю",
+        "status": "Published",
+        "tender_id": ident,
+        "active_version": 2,
+        "created_at": "2006-01-02 15:04:05",
+    }
+    ids = [str(uuid.uuid4()) for _ in range(items)]
+    return {
+        "TendersNewPostRequest": {
+            "name": "Тендер",
+            "description": "Описание",
+            "serviceType": "Delivery",
+            "status": "Created",
+            "organizationId": ident,
+            "creatorUsername": "user1",
+        },
+        "TendersTenderIdEditPatchRequest": {"name": "Тендер", "service_type": "Delivery"},
+        "BidsNewPostRequest": {
+            "name": "Предложение",
+            "description": "Описание",
+            "status": "Created",
+            "tenderId": ident,
+            "organizationId": ident,
+            "creatorUsername": "user1",
+        },
+        "BidsBidIdEditPatchRequest": {"name": "Предложение", "description": "Описание"},
+        "BatchGetRequest": {"ids": ids},
+        "BatchStatusRequest": {"ids": ids, "since": "2006-01-02T15:04:05"},
+        "ErrorResponse": {"reason": "invalid authentication"},
+        "Tender": tender,
+        "Bid": bid,
+        "TendersGetResponse": [tender] * items,
+        "TendersMyGetResponse": [tender] * items,
+        "BidsMyGetResponse": [bid] * items,
+        "BidsTenderIdListGetResponse": [bid] * items,
+        "TendersBatchGetResponse": {"items": [{"id": ident, "tender": tender}] * items},
+        "BidsBatchGetResponse": {"items": [{"id": ident, "bid": bid}] * items},
+        "TendersBatchStatusResponse": {
+            "statuses": dict.fromkeys(ids, "Published"),
+            "errors": {},
+            "since": "2006-01-02T15:04:05",
+        },
+        "BidsBatchStatusResponse": {
+            "statuses": dict.fromkeys(ids, "Published"),
+            "errors": {},
+            "since": "2006-01-02T15:04:05",
+        },
+    }
+
+
+def rate(call, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(10):
+            call()
+        count += 10
+        now = time.perf_counter()
+        if now >= deadline:
+            return count / (now - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50, help="элементов в списках и пачках")
+    parser.add_argument("--seconds", type=float, default=0.5, help="время замера одной операции")
+    parser.add_argument("--baseline", help="ревизия с прежним models.py")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline or baseline_revision())
+    print(f"{'model':>32} {'validate old':>13} {'new':>10} {'x':>5} {'dump old':>10} {'new':>10} {'x':>5}")
+    for name, data in samples(args.items).items():
+        results = []
+        for module in (baseline, models):
+            model = getattr(module, name)
+            instance = model.model_validate(data)
+            results.append(
+                (
+                    rate(lambda: model.model_validate(data), args.seconds),
+                    rate(lambda: instance.model_dump_json(by_alias=True), args.seconds),
+                )
+            )
+        (old_validate, old_dump), (new_validate, new_dump) = results
+        print(
+            f"{name:>32} {old_validate:13.0f} {new_validate:10.0f} {new_validate / old_validate:5.1f} "
+            f"{old_dump:10.0f} {new_dump:10.0f} {new_dump / old_dump:5.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
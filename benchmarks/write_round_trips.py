@@ -0,0 +1,250 @@
+"""
+Создание и редактирование предложения: несколько запросов к базе, как было
+до CTE, против одного запроса из database/queries.py.
+
+Чем дальше база, тем дороже каждый круг до нее. Скрипт поднимает локальный
+TCP-прокси, который задерживает каждую пачку данных на --rtt-ms / 2 в каждую
+сторону, и гоняет обе схемы через него. Запуск из корня репозитория:
+
+    POSTGRES_CONN=postgresql://... python benchmarks/write_round_trips.py --rtt-ms 2 --requests 2000
+
+Печатается скорость и задержки для каждой пары (схема, операция). После
+замера тестовые данные удаляются.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("SERVER_ADDRESS", "127.0.0.1:8080")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+import database.queries as queries  # noqa: E402
+from config import setings  # noqa: E402
+from sqlalchemy import create_engine, make_url, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+
+class DelayProxy:
+    """TCP-прокси с задержкой delay секунд в каждую сторону"""
+
+    def __init__(self, host: str, port: int, delay: float):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.listen_port = None
+
+    async def pipe(self, reader, writer) -> None:
+        try:
+            while data := await reader.read(65536):
+                await asyncio.sleep(self.delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, client_reader, client_writer) -> None:
+        server_reader, server_writer = await asyncio.open_connection(self.host, self.port)
+        await asyncio.gather(
+            self.pipe(client_reader, server_writer), self.pipe(server_reader, client_writer)
+        )
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.listen_port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def start(self) -> int:
+        threading.Thread(target=self.loop.run_until_complete, args=(self.serve(),), daemon=True).start()
+        self.ready.wait()
+        return self.listen_port
+
+
+def create_fixtures(engine) -> dict:
+    ids = {
+        "organization": str(uuid.uuid4()),
+        "tender": str(uuid.uuid4()),
+        "username": f"bench_{uuid.uuid4().hex[:8]}",
+    }
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO organization (id, name) VALUES (:organization, 'bench')"), ids)
+        conn.execute(text("INSERT INTO employee (username) VALUES (:username)"), ids)
+        conn.execute(
+            text(
+                "INSERT INTO organization_responsible (organization_id, user_id) "
+                "SELECT :organization, id FROM employee WHERE username = :username"
+            ),
+            ids,
+        )
+        conn.execute(
+            text(
+                "INSERT INTO tender (id, status, organization_id, creator_username) "
+                "VALUES (:tender, 'Published', :organization, :username)"
+            ),
+            ids,
+        )
+        conn.execute(
+            text(
+                "INSERT INTO tender_version (tender_id, name, description, service_type) "
+                "VALUES (:tender, 'bench', 'bench', 'Delivery')"
+            ),
+            ids,
+        )
+    return ids
+
+
+def drop_fixtures(engine, ids: dict) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM tender WHERE id = :tender"), ids)
+        conn.execute(text("DELETE FROM organization WHERE id = :organization"), ids)
+        conn.execute(text("DELETE FROM employee WHERE username = :username"), ids)
+
+
+def bid_values(ids: dict) -> dict:
+    return {
+        "status": "Created",
+        "tender_id": ids["tender"],
+        "organization_id": ids["organization"],
+        "creator_username": ids["username"],
+    }
+
+
+def create_separate(engine, ids: dict):
+    with Session(engine) as session:
+        row = session.execute(
+            text(
+                "INSERT INTO bid (status, tender_id, organization_id, creator_username) "
+                "VALUES (:status, :tender_id, :organization_id, :creator_username) "
+                "RETURNING id, created_at, active_version"
+            ),
+            bid_values(ids),
+        ).one()
+        session.execute(
+            text("INSERT INTO bid_version (bid_id, name, description) VALUES (:id, 'bench', 'bench')"),
+            {"id": row[0]},
+        )
+        session.commit()
+    return row[0]
+
+
+def create_cte(engine, ids: dict):
+    with Session(engine) as session:
+        row = session.execute(
+            queries.create_bid(bid_values(ids), {"name": "bench", "description": "bench"})
+        ).one()
+        session.commit()
+    return row[0]
+
+
+def edit_separate(engine, ids: dict, bid_id) -> None:
+    params = {"id": bid_id, "username": ids["username"]}
+    with Session(engine) as session:
+        session.execute(text("SELECT creator_username FROM bid WHERE id = :id"), params).one()
+        session.execute(
+            text(
+                "SELECT v.name, v.description FROM bid b "
+                "JOIN bid_version v ON v.bid_id = b.id AND v.version = b.active_version "
+                "WHERE b.id = :id"
+            ),
+            params,
+        ).one()
+        version = session.execute(
+            text("SELECT max(version) FROM bid_version WHERE bid_id = :id"), params
+        ).scalar() + 1
+        session.execute(
+            text(
+                "INSERT INTO bid_version (bid_id, version, name, description) "
+                "VALUES (:id, :version, 'bench', 'bench')"
+            ),
+            dict(params, version=version),
+        )
+        session.execute(
+            text("UPDATE bid SET active_version = :version WHERE id = :id"),
+            dict(params, version=version),
+        )
+        session.commit()
+
+
+def edit_cte(engine, ids: dict, bid_id) -> None:
+    with Session(engine) as session:
+        session.execute(queries.edit_bid(bid_id, ids["username"], "bench", "bench")).one()
+        session.commit()
+
+
+def run(name: str, call, requests: int, concurrency: int) -> list:
+    latencies = []
+    results = []
+
+    def timed(_):
+        start = time.perf_counter()
+        results.append(call())
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{name:>15}: {requests / elapsed:8.0f} req/s  "
+        f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} ms"
+    )
+    return results
+
+
+def run_edits(name: str, call, bids: list, requests: int, concurrency: int) -> None:
+    # у каждого потока свое предложение: версии одного предложения конфликтуют
+    local = threading.local()
+    free = list(bids)
+    free_lock = threading.Lock()
+
+    def edit():
+        if not hasattr(local, "bid"):
+            with free_lock:
+                local.bid = free.pop()
+        call(local.bid)
+
+    run(name, edit, requests, concurrency)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="добавочная задержка круга до базы")
+    args = parser.parse_args()
+
+    url = make_url(setings.postgress_conn)
+    direct = create_engine(url)
+    ids = create_fixtures(direct)
+    try:
+        if args.rtt_ms > 0:
+            proxy = DelayProxy(url.host or "127.0.0.1", url.port or 5432, args.rtt_ms / 2000)
+            url = url.set(host="127.0.0.1", port=proxy.start())
+        engine = create_engine(url, pool_size=args.concurrency, max_overflow=0, pool_timeout=300)
+        # соединения открываются до замера: установка соединения через прокси дорогая
+        run("warmup", lambda: engine.connect().close(), args.concurrency, args.concurrency)
+
+        bids = run("create separate", lambda: create_separate(engine, ids), args.requests, args.concurrency)
+        run("create cte", lambda: create_cte(engine, ids), args.requests, args.concurrency)
+        bids = bids[: args.concurrency]
+        run_edits("edit separate", lambda bid: edit_separate(engine, ids, bid), bids, args.requests, args.concurrency)
+        run_edits("edit cte", lambda bid: edit_cte(engine, ids, bid), bids, args.requests, args.concurrency)
+    finally:
+        drop_fixtures(direct, ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Контроль допуска запросов: ограничение числа одновременно выполняемых
+запросов на чтение и на запись. Запрос, который не дождался своей очереди
+за отведенное время, сразу получает 503 с Retry-After, а не висит в пуле
+потоков и пуле соединений до таймаута клиента.
+"""
+
+import asyncio
+
+import tracing
+from models import ErrorResponse
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class AdmissionGate:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def saturated(self) -> bool:
+        return self.waiting > 0
+
+    async def acquire(self, timeout: float) -> bool:
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class AdmissionControl:
+    def __init__(self, read_limit: int, write_limit: int, queue_timeout: float, read_paths=()):
+        self.queue_timeout = queue_timeout
+        # POST-запросы, которые только читают (batch_get)
+        self.read_paths = set(read_paths)
+        self.reads = AdmissionGate(read_limit)
+        self.writes = AdmissionGate(write_limit)
+
+    def gate(self, method: str, path: str = "") -> AdmissionGate:
+        if method in READ_METHODS or path in self.read_paths:
+            return self.reads
+        return self.writes
+
+    @property
+    def saturated(self) -> bool:
+        return self.reads.saturated or self.writes.saturated
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "limit": gate.limit,
+                "in_flight": gate.in_flight,
+                "waiting": gate.waiting,
+                "rejected": gate.rejected,
+            }
+            for name, gate in (("reads", self.reads), ("writes", self.writes))
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, control: AdmissionControl, retry_after: int, exempt_paths=()):
+        self.app = app
+        self.control = control
+        self.retry_after = str(retry_after)
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        gate = self.control.gate(scope["method"], scope["path"])
+        with tracing.span("admission.wait"):
+            admitted = await gate.acquire(self.control.queue_timeout)
+        if not admitted:
+            await self.reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+    async def reject(self, send) -> None:
+        body = ErrorResponse(reason="server is overloaded").model_dump_json().encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", self.retry_after.encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -1,10 +1,77 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import database.coalescer as coalescer
+import database.idempotency as idempotency
+import database.orm as orm
+import statslog
+from admission import AdmissionControl, AdmissionMiddleware
+from compression import CompressionMiddleware
+from config import setings
+from database.archive import archiver
+from database.session import ServerTimingMiddleware
+from deadline import DeadlineMiddleware
+from deadline import stats as deadline_stats
+from database.summary import reconciler
+from events import ChangeListener, EventBroker
 from fastapi import FastAPI, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
+from jobs import job_runner
+from listcache import list_cache
+from ratelimit import RateLimitMiddleware
+from tracing import TracingMiddleware, tracer
 from v1.bids import router as bids_router
+from v1.events import router as events_router
+from v1.jobs import router as jobs_router
 from v1.ping import router as ping_router
 from v1.tenders import router as tenders_router
+from warmup import warm_up
+
+logger = logging.getLogger("uvicorn_main")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [
+        asyncio.create_task(warm_up(app)),
+        asyncio.create_task(
+            idempotency.purge_periodically(
+                orm.engine, setings.idempotency_ttl, setings.idempotency_purge_interval
+            )
+        ),
+    ]
+    if archiver.enabled:
+        tasks.append(asyncio.create_task(archiver.run_periodically(setings.archive_interval)))
+    if setings.summary_reconcile_interval > 0:
+        tasks.append(
+            asyncio.create_task(reconciler.run_periodically(setings.summary_reconcile_interval))
+        )
+    if job_runner.enabled:
+        tasks.append(asyncio.create_task(job_runner.run()))
+    if setings.events:
+        listener = ChangeListener(orm.engine, app.state.events, setings.events_reconnect_interval)
+        tasks.append(asyncio.create_task(listener.run()))
+    if setings.stats_log_interval > 0:
+        tasks.append(asyncio.create_task(statslog.log_periodically(setings.stats_log_interval)))
+    yield
+    for task in tasks:
+        task.cancel()
+    # запрос, уже отданный в поток, дорабатывает свою транзакцию
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), setings.timeout_graceful_shutdown
+        )
+    except asyncio.TimeoutError:
+        logger.error("background tasks did not stop in %s s", setings.timeout_graceful_shutdown)
+    else:
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("background task failed: %s", result)
+    job_runner.engine.dispose()
+    tracer.close()
 
 
 def create_app() -> FastAPI:
@@ -13,10 +80,69 @@ def create_app() -> FastAPI:
         version="1.0",
         description="API для управления тендерами и предложениями. \n\nОсновные функции API включают управление тендерами (создание, изменение, получение списка) и управление предложениями (создание, изменение, получение списка).\n",
         docs_url="/api/openapi",
+        lifespan=lifespan,
         # servers=[
         #     {'url': 'http://localhost:8080/api', 'description': 'Локальный сервер API'}
         # ],
     )
+    app.state.ready = False
+    app.state.admission = AdmissionControl(
+        read_limit=setings.admission_read_limit
+        or setings.pool_size + setings.pool_max_overflow,
+        write_limit=setings.admission_write_limit or setings.pool_size,
+        queue_timeout=setings.admission_queue_timeout,
+        read_paths=[
+            "/api/tenders/batch_get",
+            "/api/tenders/batch_status",
+            "/api/bids/batch_get",
+            "/api/bids/batch_status",
+        ],
+    )
+    app.state.events = EventBroker(
+        buffer_size=setings.events_buffer_size,
+        queue_size=setings.events_queue_size,
+        max_subscribers=setings.events_max_subscribers,
+    )
+    statslog.register("deadline", deadline_stats.as_dict)
+    if setings.bid_group_commit:
+        statslog.register("bid_group_commit", coalescer.bid_writer.stats)
+    if list_cache.enabled:
+        # записи других воркеров приходят только через ленту изменений
+        app.state.events.watchers.append(list_cache.on_change)
+    app.add_middleware(ServerTimingMiddleware)
+    app.add_middleware(
+        AdmissionMiddleware,
+        control=app.state.admission,
+        retry_after=setings.admission_retry_after,
+        # поток событий живет долго и не держит соединение с базой
+        exempt_paths=["/api/ping", "/api/openapi", "/openapi.json", "/api/events"],
+    )
+    # срок считается с прихода запроса, очередь допуска в него входит
+    app.add_middleware(
+        DeadlineMiddleware,
+        default=setings.request_deadline,
+        route_deadlines=setings.request_deadlines,
+        header=setings.request_deadline_header,
+        cancel_on_disconnect=setings.cancel_on_disconnect,
+        exempt_paths=["/api/ping", "/api/openapi", "/openapi.json", "/api/events"],
+    )
+    # снаружи контроля допуска: отклоненный запрос не занимает слот
+    app.add_middleware(
+        RateLimitMiddleware,
+        quotas=setings.rate_limits,
+        max_keys=setings.rate_limit_max_keys,
+        idle_ttl=setings.rate_limit_idle_ttl,
+    )
+    app.add_middleware(
+        CompressionMiddleware,
+        min_size=setings.compression_min_size,
+        level=setings.compression_level,
+        route_levels=setings.compression_levels,
+    )
+    if tracer.enabled:
+        # снаружи всех: span запроса включает очереди и сжатие
+        tracer.install()
+        app.add_middleware(TracingMiddleware, tracer=tracer)
 
     @app.exception_handler(RequestValidationError)
     def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -29,5 +155,7 @@ def create_app() -> FastAPI:
 
     app.include_router(ping_router)
     app.include_router(bids_router)
+    app.include_router(events_router)
+    app.include_router(jobs_router)
     app.include_router(tenders_router)
     return app
@@ -0,0 +1,209 @@
+"""
+Сжатие ответов по Accept-Encoding: gzip всегда, br и zstd, если установлены
+пакеты brotli и zstandard (`poetry install --extras compression`).
+
+Сжимаются только JSON и текстовые ответы не меньше min_size байт. Потоковый
+ответ сжимается по частям: каждая часть сбрасывается клиенту сразу (sync
+flush), поэтому он не копится в памяти целиком. text/event-stream не сжимается.
+Уровень задается для группы маршрутов по префиксу пути, 0 выключает сжатие.
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (b"application/json", b"text/")
+SKIP_TYPES = (b"text/event-stream",)
+
+
+class GzipEncoder:
+    name = b"gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = b"br"
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    name = b"zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# порядок - предпочтение сервера при равном q
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS = {"br": BrotliEncoder, **ENCODERS}
+if zstandard is not None:
+    ENCODERS = {"zstd": ZstdEncoder, **ENCODERS}
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """Выбирает кодировку из Accept-Encoding с наибольшим q, q=0 - запрет"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def header(headers, name: bytes) -> bytes | None:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def compressible(headers) -> bool:
+    if header(headers, b"content-encoding") is not None:
+        return False
+    content_type = header(headers, b"content-type") or b""
+    if content_type.startswith(SKIP_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int, level: int, route_levels: dict | None = None):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.route_levels = route_levels or {}
+        # самый длинный префикс проверяется первым
+        self.prefixes = sorted(self.route_levels, key=len, reverse=True)
+
+    def level_for(self, path: str) -> int:
+        for prefix in self.prefixes:
+            if path.startswith(prefix):
+                return self.route_levels[prefix]
+        return self.level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        level = self.level_for(scope["path"])
+        accept = header(scope["headers"], b"accept-encoding")
+        encoding = negotiate(accept.decode("latin-1")) if accept and level else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(send, ENCODERS[encoding](level), self.min_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    """
+    Держит http.response.start, пока не станет ясно, сжимать ли ответ: пока
+    тело меньше min_size, части копятся в буфере. Ответ, закончившийся раньше,
+    уходит без изменений
+    """
+
+    def __init__(self, send, encoder, min_size: int):
+        self._send = send
+        self.encoder = encoder
+        self.min_size = min_size
+        self.start = None
+        self.buffer = []
+        self.buffered = 0
+        self.compressing = False
+        self.passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            headers = list(message.get("headers", []))
+            if not compressible(headers):
+                self.passthrough = True
+                await self._send(message)
+                return
+            message["headers"] = headers + [(b"vary", b"accept-encoding")]
+            self.start = message
+            return
+        if self.passthrough or message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressing:
+            await self.send_compressed(body, more_body)
+            return
+
+        self.buffer.append(body)
+        self.buffered += len(body)
+        if self.buffered >= self.min_size:
+            self.compressing = True
+            await self.send_start()
+            body, self.buffer = b"".join(self.buffer), []
+            await self.send_compressed(body, more_body)
+        elif not more_body:
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": b"".join(self.buffer)})
+
+    async def send_start(self) -> None:
+        headers = [
+            (key, value) for key, value in self.start["headers"] if key.lower() != b"content-length"
+        ]
+        headers.append((b"content-encoding", self.encoder.name))
+        self.start["headers"] = headers
+        await self._send(self.start)
+
+    async def send_compressed(self, body: bytes, more_body: bool) -> None:
+        data = self.encoder.compress(body)
+        data += self.encoder.flush() if more_body else self.encoder.finish()
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
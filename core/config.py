@@ -1,3 +1,5 @@
+import os
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -6,5 +8,121 @@ class Settings(BaseSettings):
     server_adress: str = Field(..., alias="SERVER_ADDRESS")
     postgress_conn: str = Field(..., alias="POSTGRES_CONN")
 
+    # запуск сервера
+    reload: bool = Field(False, alias="RELOAD")
+    workers: int = Field(default_factory=lambda: os.cpu_count() or 1, alias="WEB_CONCURRENCY")
+    loop: str = Field("auto", alias="UVICORN_LOOP")
+    http: str = Field("auto", alias="UVICORN_HTTP")
+    limit_max_requests: int | None = Field(None, alias="WORKER_MAX_REQUESTS")
+    timeout_graceful_shutdown: int = Field(30, alias="GRACEFUL_SHUTDOWN_TIMEOUT")
+    timeout_keep_alive: int = Field(5, alias="KEEP_ALIVE_TIMEOUT")
+    backlog: int = Field(2048, alias="SOCKET_BACKLOG")
+
+    # пул соединений с базой (на каждый воркер)
+    pool_size: int = Field(5, alias="DB_POOL_SIZE")
+    pool_max_overflow: int = Field(10, alias="DB_POOL_MAX_OVERFLOW")
+    pool_timeout: float = Field(30, alias="DB_POOL_TIMEOUT")
+    pool_min_size: int = Field(2, alias="DB_POOL_MIN_SIZE")
+    # только psycopg 3: после скольких выполнений запрос готовится на сервере, 0 - никогда
+    db_prepare_threshold: int = Field(5, alias="DB_PREPARE_THRESHOLD")
+
+    # реплики для чтения списков и статусов
+    postgres_replicas: list[str] = Field([], alias="POSTGRES_REPLICAS")
+    replica_strategy: str = Field("round_robin", alias="REPLICA_STRATEGY")
+    replica_max_lag: float = Field(5, alias="REPLICA_MAX_LAG")
+    replica_lag_check_interval: float = Field(1, alias="REPLICA_LAG_CHECK_INTERVAL")
+    replica_sticky_seconds: float = Field(5, alias="REPLICA_STICKY_SECONDS")
+
+    # прогрев при старте
+    warmup: bool = Field(True, alias="WARMUP")
+    warmup_retry_interval: float = Field(5, alias="WARMUP_RETRY_INTERVAL")
+
+    # контроль допуска; по умолчанию лимиты считаются от размера пула
+    admission_read_limit: int | None = Field(None, alias="ADMISSION_READ_LIMIT")
+    admission_write_limit: int | None = Field(None, alias="ADMISSION_WRITE_LIMIT")
+    admission_queue_timeout: float = Field(1.0, alias="ADMISSION_QUEUE_TIMEOUT")
+    admission_retry_after: int = Field(1, alias="ADMISSION_RETRY_AFTER")
+
+    # срок запроса в секундах, 0 - без срока; по префиксу пути перекрывает общий
+    request_deadline: float = Field(0, alias="REQUEST_DEADLINE")
+    request_deadlines: dict[str, float] = Field({}, alias="REQUEST_DEADLINES")
+    request_deadline_header: str = Field("X-Request-Timeout", alias="REQUEST_DEADLINE_HEADER")
+    cancel_on_disconnect: bool = Field(True, alias="CANCEL_ON_DISCONNECT")
+
+    # ограничение частоты по username: префикс пути -> "запросов/секунд"
+    rate_limits: dict[str, str] = Field(
+        {"/api/tenders/my": "20/1", "/api/bids/my": "20/1"}, alias="RATE_LIMITS"
+    )
+    rate_limit_max_keys: int = Field(100_000, alias="RATE_LIMIT_MAX_KEYS")
+    rate_limit_idle_ttl: float = Field(600, alias="RATE_LIMIT_IDLE_TTL")
+
+    # сжатие ответов; уровень по префиксу пути перекрывает общий, 0 - без сжатия
+    compression_min_size: int = Field(1024, alias="COMPRESSION_MIN_SIZE")
+    compression_level: int = Field(3, alias="COMPRESSION_LEVEL")
+    compression_levels: dict[str, int] = Field({}, alias="COMPRESSION_LEVELS")
+
+    # сколько id можно запросить одним batch_get
+    batch_get_max_ids: int = Field(200, alias="BATCH_GET_MAX_IDS")
+    batch_status_max_ids: int = Field(1000, alias="BATCH_STATUS_MAX_IDS")
+    # на сколько секунд токен since отстает от времени базы
+    status_since_grace: float = Field(5, alias="STATUS_SINCE_GRACE")
+
+    # лента изменений GET /api/events
+    events: bool = Field(True, alias="EVENTS")
+    events_queue_size: int = Field(256, alias="EVENTS_QUEUE_SIZE")
+    events_buffer_size: int = Field(10_000, alias="EVENTS_BUFFER_SIZE")
+    events_max_subscribers: int = Field(1000, alias="EVENTS_MAX_SUBSCRIBERS")
+    events_heartbeat_interval: float = Field(15, alias="EVENTS_HEARTBEAT_INTERVAL")
+    events_retry_ms: int = Field(3000, alias="EVENTS_RETRY_MS")
+    events_reconnect_interval: float = Field(1, alias="EVENTS_RECONNECT_INTERVAL")
+
+    # групповой коммит POST /api/bids/new
+    bid_group_commit: bool = Field(False, alias="BID_GROUP_COMMIT")
+    bid_group_commit_window: float = Field(0.005, alias="BID_GROUP_COMMIT_WINDOW")
+    bid_group_commit_max_batch: int = Field(100, alias="BID_GROUP_COMMIT_MAX_BATCH")
+    bid_group_commit_timeout: float = Field(5, alias="BID_GROUP_COMMIT_TIMEOUT")
+
+    # заголовок Idempotency-Key: сколько секунд хранится ответ
+    idempotency_ttl: float = Field(86400, alias="IDEMPOTENCY_TTL")
+    idempotency_purge_interval: float = Field(3600, alias="IDEMPOTENCY_PURGE_INTERVAL")
+
+    # архивация; без политик задача не запускается
+    archive_closed_tenders_after_days: int | None = Field(
+        None, alias="ARCHIVE_CLOSED_TENDERS_AFTER_DAYS"
+    )
+    archive_keep_versions: int | None = Field(None, alias="ARCHIVE_KEEP_VERSIONS")
+    archive_batch_size: int = Field(100, alias="ARCHIVE_BATCH_SIZE")
+    archive_batch_pause: float = Field(0.05, alias="ARCHIVE_BATCH_PAUSE")
+    archive_interval: float = Field(3600, alias="ARCHIVE_INTERVAL")
+
+    # сверка счетчиков предложений тендера; 0 - не запускать
+    summary_reconcile_interval: float = Field(3600, alias="SUMMARY_RECONCILE_INTERVAL")
+    summary_reconcile_batch_size: int = Field(1000, alias="SUMMARY_RECONCILE_BATCH_SIZE")
+    summary_reconcile_batch_pause: float = Field(0.05, alias="SUMMARY_RECONCILE_BATCH_PAUSE")
+
+    # фоновые задачи POST /api/jobs; 0 - воркер задачи не выполняет, только принимает
+    jobs_concurrency: int = Field(1, alias="JOBS_CONCURRENCY")
+    jobs_executor: str = Field("thread", alias="JOBS_EXECUTOR")
+    jobs_poll_interval: float = Field(1, alias="JOBS_POLL_INTERVAL")
+    jobs_stale_after: float = Field(60, alias="JOBS_STALE_AFTER")
+    jobs_ttl: float = Field(7 * 86400, alias="JOBS_TTL")
+    # кто может запускать задачи над всей базой (archive, summary_reconcile)
+    jobs_admins: list[str] = Field([], alias="JOBS_ADMINS")
+
+    # трассировка в файл JSON lines; 0 и 0 - выключена
+    tracing_sample_rate: float = Field(0, alias="TRACING_SAMPLE_RATE")
+    tracing_slow_threshold: float = Field(0, alias="TRACING_SLOW_THRESHOLD")
+    tracing_file: str = Field("traces.jsonl", alias="TRACING_FILE")
+    tracing_file_max_bytes: int = Field(100 * 1024 * 1024, alias="TRACING_FILE_MAX_BYTES")
+    tracing_file_backups: int = Field(5, alias="TRACING_FILE_BACKUPS")
+
+    # кэш страниц GET /api/tenders без username; 0 байт - кэш выключен
+    list_cache_max_bytes: int = Field(16 * 1024 * 1024, alias="LIST_CACHE_MAX_BYTES")
+    list_cache_ttl: float = Field(30, alias="LIST_CACHE_TTL")
+    list_cache_stale_while_revalidate: float = Field(0, alias="LIST_CACHE_STALE_WHILE_REVALIDATE")
+
+    # счетчики воркера в лог раз в столько секунд; 0 - не писать
+    stats_log_interval: float = Field(60, alias="STATS_LOG_INTERVAL")
+
 
 setings = Settings()
@@ -0,0 +1,240 @@
+"""
+Перенос закрытых тендеров и старых версий в архивные таблицы
+(posgresql/migrations/005_archive.sql).
+
+Политики:
+    ARCHIVE_CLOSED_TENDERS_AFTER_DAYS - тендеры в статусе Closed, не менявшиеся
+        столько дней, вместе с версиями, предложениями и их версиями;
+    ARCHIVE_KEEP_VERSIONS - из истории версий остаются последние K и та, на
+        которую указывает active_version; откатиться на архивную версию нельзя.
+
+Каждая пачка - один запрос: DELETE ... RETURNING и INSERT в архив в одной
+транзакции, строки выбираются с SKIP LOCKED, поэтому блокировки короткие и
+не ждут редактирования. Версии перебираются по ключу (родитель, версия) от
+последнего ключа прошлой пачки, поэтому запуск читает историю один раз. Из воркеров работает один: остальные не получают
+advisory-блокировку и пропускают запуск. Разово:
+
+    python -m database.archive
+"""
+
+import asyncio
+import logging
+import time
+
+import uuid
+
+import database.orm as orm
+import database.queries as queries
+from config import setings
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("uvicorn_main")
+
+# ключ advisory-блокировки: один архиватор на базу
+LOCK_KEY = 7_039_001
+
+# ключ перед первой версией: версии начинаются с 1
+FIRST_VERSION_KEY = {"after_parent": uuid.UUID(int=0), "after_version": 0}
+
+
+def columns(table) -> str:
+    return ", ".join(column.name for column in table.columns)
+
+
+def move(source: str, table, target: str) -> str:
+    """CTE, переносящий в архив строки, удаленные CTE source"""
+    names = columns(table)
+    return f"INSERT INTO {target} ({names}) SELECT {names} FROM {source}"
+
+
+CLOSED_TENDERS = f"""
+WITH doomed AS (
+    SELECT id FROM tender
+    WHERE status = 'Closed' AND updated_at < localtimestamp - make_interval(days => :days)
+    ORDER BY updated_at
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+),
+tenders AS (
+    DELETE FROM tender t USING doomed d WHERE t.id = d.id RETURNING t.*
+),
+tender_versions AS (
+    DELETE FROM tender_version v USING doomed d WHERE v.tender_id = d.id RETURNING v.*
+),
+bid_versions AS (
+    DELETE FROM bid_version v USING bid b, doomed d
+    WHERE v.bid_id = b.id AND b.tender_id = d.id RETURNING v.*
+),
+bids AS (
+    DELETE FROM bid b USING doomed d WHERE b.tender_id = d.id RETURNING b.*
+),
+archived_tenders AS ({move("tenders", queries.tender_table, "tender_archive")}),
+archived_tender_versions AS (
+    {move("tender_versions", queries.tender_version_table, "tender_version_archive")}
+),
+archived_bids AS ({move("bids", queries.bid_table, "bid_archive")}),
+archived_bid_versions AS (
+    {move("bid_versions", queries.bid_version_table, "bid_version_archive")}
+)
+SELECT
+    (SELECT count(*) FROM tenders),
+    (SELECT count(*) FROM tender_versions),
+    (SELECT count(*) FROM bids),
+    (SELECT count(*) FROM bid_versions)
+"""
+
+
+def stale_versions(parent: str, version_table, parent_key: str, target: str) -> str:
+    table = version_table.name
+    return f"""
+WITH doomed AS (
+    SELECT v.{parent_key}, v.version FROM {table} v JOIN {parent} p ON p.id = v.{parent_key}
+    WHERE (v.{parent_key}, v.version) > (:after_parent, :after_version)
+      AND v.version IS DISTINCT FROM p.active_version
+      AND v.version <= (
+          SELECT max(m.version) FROM {table} m WHERE m.{parent_key} = v.{parent_key}
+      ) - :keep
+    ORDER BY v.{parent_key}, v.version
+    LIMIT :batch_size
+    FOR UPDATE OF v SKIP LOCKED
+),
+versions AS (
+    DELETE FROM {table} v USING doomed d
+    WHERE v.{parent_key} = d.{parent_key} AND v.version = d.version RETURNING v.*
+),
+archived AS ({move("versions", version_table, target)}),
+last AS (
+    SELECT {parent_key}, version FROM doomed ORDER BY {parent_key} DESC, version DESC LIMIT 1
+)
+SELECT (SELECT count(*) FROM versions), last.{parent_key}, last.version
+FROM (SELECT 1) AS one LEFT JOIN last ON true
+"""
+
+
+STALE_TENDER_VERSIONS = stale_versions(
+    "tender", queries.tender_version_table, "tender_id", "tender_version_archive"
+)
+STALE_BID_VERSIONS = stale_versions(
+    "bid", queries.bid_version_table, "bid_id", "bid_version_archive"
+)
+
+
+class Archiver:
+    def __init__(
+        self,
+        engine,
+        closed_after_days: int | None,
+        keep_versions: int | None,
+        batch_size: int,
+        batch_pause: float,
+    ):
+        self.engine = engine
+        self.closed_after_days = closed_after_days
+        # последняя версия нужна для номера следующей при редактировании
+        self.keep_versions = None if keep_versions is None else max(keep_versions, 1)
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.moved = {
+            "tender": 0,
+            "tender_version": 0,
+            "bid": 0,
+            "bid_version": 0,
+        }
+        self.runs = 0
+        self.last_run = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.closed_after_days is not None or self.keep_versions is not None
+
+    def batches(
+        self, statement: str, params: dict, counted: tuple, on_batch=None, key: dict | None = None
+    ) -> dict:
+        """
+        Пачки до пустой, каждая в своей транзакции; on_batch получает число
+        строк пачки. С key запрос после счетчиков возвращает последний ключ
+        пачки, следующая пачка начинается после него
+        """
+        moved = dict.fromkeys(counted, 0)
+        key = dict(key or {})
+        while True:
+            with self.engine.begin() as conn:
+                row = conn.execute(
+                    text(statement), dict(params, **key, batch_size=self.batch_size)
+                ).one()
+            counts, last = row[: len(counted)], row[len(counted) :]
+            for name, count in zip(counted, counts):
+                moved[name] += count
+                self.moved[name] += count
+            if not any(counts):
+                return moved
+            if key:
+                key = dict(zip(key, last))
+            if on_batch is not None:
+                on_batch(sum(counts))
+            logger.info("archive progress: %s", moved)
+            time.sleep(self.batch_pause)
+
+    def run_once(self, on_batch=None) -> dict | None:
+        """Строки, перенесенные за запуск, или None, если архиватор уже работает в другом воркере"""
+        moved = dict.fromkeys(self.moved, 0)
+        with self.engine.connect() as lock_conn:
+            if not lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": LOCK_KEY}
+            ).scalar():
+                return None
+            try:
+                if self.closed_after_days is not None:
+                    moved.update(
+                        self.batches(
+                            CLOSED_TENDERS,
+                            {"days": self.closed_after_days},
+                            ("tender", "tender_version", "bid", "bid_version"),
+                            on_batch,
+                        )
+                    )
+                if self.keep_versions is not None:
+                    params = {"keep": self.keep_versions}
+                    for statement, name in (
+                        (STALE_TENDER_VERSIONS, "tender_version"),
+                        (STALE_BID_VERSIONS, "bid_version"),
+                    ):
+                        moved[name] += self.batches(
+                            statement, params, (name,), on_batch, FIRST_VERSION_KEY
+                        )[name]
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+                lock_conn.commit()
+        self.runs += 1
+        self.last_run = time.time()
+        logger.info("archive run done, rows moved: %s", moved)
+        return moved
+
+    async def run_periodically(self, interval: float) -> None:
+        while True:
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception as e:
+                logger.error("archive run failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {"moved": dict(self.moved), "runs": self.runs, "last_run": self.last_run}
+
+
+archiver = Archiver(
+    orm.engine,
+    closed_after_days=setings.archive_closed_tenders_after_days,
+    keep_versions=setings.archive_keep_versions,
+    batch_size=setings.archive_batch_size,
+    batch_pause=setings.archive_batch_pause,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if not archiver.enabled:
+        print("no archive policy: set ARCHIVE_CLOSED_TENDERS_AFTER_DAYS or ARCHIVE_KEEP_VERSIONS")
+    else:
+        print(archiver.run_once() or "archiver is already running")
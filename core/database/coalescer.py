@@ -0,0 +1,254 @@
+"""
+Групповой коммит для создания предложений (BID_GROUP_COMMIT).
+
+Конкурентные create_bid кладут строки в очередь, отдельный поток через
+BID_GROUP_COMMIT_WINDOW секунд (или раньше, набрав BID_GROUP_COMMIT_MAX_BATCH
+строк) вставляет их одним многострочным INSERT и коммитит один раз. Каждый
+вызывающий получает свою строку или свою ошибку: если пачка не вставилась
+целиком, строки повторяются по одной в savepoint'ах той же транзакции.
+
+Исход строки всегда известен вызывающему. Поток забирает строку в пачку
+только если ее еще ждут: строка, которую не дождались (время ожидания или
+срок запроса из deadline.py вышли, клиент отключился), не записывается, и
+submit бросает BidNotWritten - запрос можно повторить без дубля. Строку,
+уже взятую в пачку, вызывающий ждет дольше: срок запроса и отмена при
+отключении на саму пачку не действуют, она общая для нескольких запросов.
+Но и это ожидание ограничено: запросы пачки выполняются со statement_timeout
+BID_GROUP_COMMIT_TIMEOUT, и если пачка не завершилась за время ожидания
+соединения пула, этот срок и запас, submit бросает BidOutcomeUnknown -
+строка могла быть записана. Поток пачек переживает любые ошибки, а если
+все же завершился, следующий submit запускает его снова. Счетчики - в stats().
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import database.orm as orm
+import database.queries as queries
+from config import setings
+from deadline import current_deadline
+from sqlalchemy import Engine, insert
+
+logger = logging.getLogger("uvicorn_main")
+
+QUEUED, CLAIMED, ABANDONED = "queued", "claimed", "abandoned"
+
+
+class BidNotWritten(Exception):
+    """Строка не записана и записана не будет"""
+
+
+class BidOutcomeUnknown(Exception):
+    """Пачка со строкой не завершилась вовремя: строка могла быть записана"""
+
+
+class PendingBid:
+    __slots__ = ("values", "version_values", "deadline", "state", "result", "error", "done")
+
+    def __init__(self, values: dict, version_values: dict, deadline=None):
+        self.values = values
+        self.version_values = version_values
+        # RequestDeadline запроса: поток пачек работает вне его контекста
+        self.deadline = deadline
+        self.state = QUEUED
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def given_up(self) -> bool:
+        if self.deadline is None:
+            return False
+        remaining = self.deadline.remaining()
+        return self.deadline.disconnected or (remaining is not None and remaining <= 0)
+
+
+class BidCoalescer:
+    def __init__(
+        self,
+        engine: Engine,
+        window: float,
+        max_batch: int,
+        wait_timeout: float,
+        statement_timeout: float,
+        claimed_timeout: float,
+    ):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        # сколько строка ждет пачку и сколько - завершения уже взявшей ее пачки
+        self.wait_timeout = wait_timeout
+        self.statement_timeout = statement_timeout
+        self.claimed_timeout = claimed_timeout
+        self.queue: queue.Queue = queue.Queue()
+        self.batches = 0
+        self.rows = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # переходы PendingBid.state
+        self._state_lock = threading.Lock()
+        self.abandoned = 0
+        self.unknown = 0
+
+    def start(self) -> None:
+        # поток запускается при первой записи, уже внутри воркера
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name="bid-coalescer", daemon=True)
+                self._thread.start()
+
+    def submit(self, values: dict, version_values: dict) -> tuple:
+        """
+        (id, created_at, active_version) новой строки или исключение этой
+        строки; BidNotWritten - строка не записана, BidOutcomeUnknown - исход
+        неизвестен
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        deadline = current_deadline.get()
+        pending = PendingBid(values, version_values, deadline)
+        self.queue.put(pending)
+        timeout = self.wait_timeout
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None:
+            timeout = max(min(timeout, remaining), 0)
+        if not pending.done.wait(timeout) and self.abandon(pending):
+            raise BidNotWritten("bid was not written in time")
+        # строка уже в пачке: ее исход придет вместе с пачкой
+        if not pending.done.wait(self.claimed_timeout):
+            self.unknown += 1
+            raise BidOutcomeUnknown("bid write timed out, outcome unknown")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def abandon(self, pending: PendingBid) -> bool:
+        with self._state_lock:
+            if pending.state != QUEUED:
+                return False
+            pending.state = ABANDONED
+        self.abandoned += 1
+        return True
+
+    def claim(self, batch: list) -> list:
+        """Строки, которые еще ждут; остальные помечаются брошенными"""
+        claimed = []
+        with self._state_lock:
+            for pending in batch:
+                if pending.state == QUEUED and pending.given_up():
+                    pending.state = ABANDONED
+                    pending.error = BidNotWritten("request deadline exceeded")
+                    pending.done.set()
+                    self.abandoned += 1
+                elif pending.state == QUEUED:
+                    pending.state = CLAIMED
+                    claimed.append(pending)
+        return claimed
+
+    def collect(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("bid coalescer failed: %s", e)
+
+    def run_once(self) -> None:
+        batch = self.claim(self.collect())
+        if not batch:
+            return
+        try:
+            self.flush(batch)
+        except Exception as e:
+            logger.error("bid group commit failed: %s", e)
+            # транзакция откатилась целиком, вместе с уже вставленными строками
+            for pending in batch:
+                if pending.error is None:
+                    pending.result, pending.error = None, e
+        finally:
+            for pending in batch:
+                pending.done.set()
+        self.batches += 1
+        self.rows += len(batch)
+
+    def flush(self, batch: list) -> None:
+        # триггер count_bid блокирует строку счетчиков каждого тендера пачки:
+        # в одном порядке во всех пачках они не ждут друг друга по кругу
+        batch = sorted(batch, key=lambda pending: str(pending.values.get("tender_id")))
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql(
+                f"SET LOCAL statement_timeout = {int(self.statement_timeout * 1000)}"
+            )
+            # executemany требует одинаковых ключей во всех строках
+            groups: dict = {}
+            for pending in batch:
+                groups.setdefault(tuple(pending.values), []).append(pending)
+            for group in groups.values():
+                try:
+                    with conn.begin_nested():
+                        self.insert_many(conn, group)
+                except Exception:
+                    for pending in group:
+                        self.insert_one(conn, pending)
+            conn.commit()
+
+    def insert_many(self, conn, group: list) -> None:
+        rows = conn.execute(
+            insert(queries.bid_table).returning(
+                queries.bid_table.c.id,
+                queries.bid_table.c.created_at,
+                queries.bid_table.c.active_version,
+                sort_by_parameter_order=True,
+            ),
+            [pending.values for pending in group],
+        ).all()
+        conn.execute(
+            insert(queries.bid_version_table),
+            [dict(pending.version_values, bid_id=row[0]) for pending, row in zip(group, rows)],
+        )
+        for pending, row in zip(group, rows):
+            pending.result = tuple(row)
+
+    def insert_one(self, conn, pending: PendingBid) -> None:
+        try:
+            with conn.begin_nested():
+                row = conn.execute(
+                    queries.create_bid(pending.values, pending.version_values)
+                ).one()
+            pending.result = tuple(row)
+        except Exception as e:
+            pending.error = e
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "queued": self.queue.qsize(),
+            "abandoned": self.abandoned,
+            "unknown": self.unknown,
+            "alive": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+bid_writer = BidCoalescer(
+    orm.engine,
+    window=setings.bid_group_commit_window,
+    max_batch=setings.bid_group_commit_max_batch,
+    wait_timeout=setings.pool_timeout + setings.bid_group_commit_window,
+    statement_timeout=setings.bid_group_commit_timeout,
+    # соединение из пула, запросы пачки и запас на коммит
+    claimed_timeout=setings.pool_timeout + setings.bid_group_commit_timeout + 1,
+)
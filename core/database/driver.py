@@ -0,0 +1,132 @@
+"""
+Драйвер PostgreSQL выбирается схемой POSTGRES_CONN: postgresql:// (или
+postgresql+psycopg2://) - psycopg2, postgresql+psycopg:// - psycopg 3 (extra
+psycopg3).
+
+На psycopg 3 независимые запросы обработчика (проверка прав и чтение данных)
+отправляются в pipeline mode: все сразу, ответы приходят за один круг до
+базы. Запрос, выполненный на соединении DB_PREPARE_THRESHOLD раз, драйвер
+готовит на сервере, дальше сервер не разбирает и не планирует его заново.
+На psycopg2 запросы выполняются по очереди, как раньше.
+"""
+
+from config import setings
+from sqlalchemy import make_url
+from sqlalchemy.engine import Result
+from sqlalchemy.orm import Session
+
+PSYCOPG = "psycopg"
+
+
+def connect_args(url) -> dict:
+    """Параметры соединения для create_engine(..., connect_args=...)"""
+    if make_url(url).get_driver_name() != PSYCOPG:
+        return {}
+    # None - не готовить запросы (например, за pgbouncer в режиме transaction)
+    return {"prepare_threshold": setings.db_prepare_threshold or None}
+
+
+def execute_pipelined(session: Session, *statements) -> list[Result]:
+    """
+    Независимые SELECT в одной транзакции сессии. Запросы проходят тот же
+    путь, что в Connection.execute, кроме самого cursor.execute: компиляция
+    через кэш движка (его же заполняет прогрев), обработка типов параметров
+    и колонок, события с контекстом выполнения и обертка ошибок драйвера.
+    Результат разбирается только после выхода из pipeline: до синхронизации
+    у курсора еще нет description
+    """
+    connection = session.connection()
+    dialect = connection.dialect
+    if dialect.driver != PSYCOPG:
+        return [session.execute(statement) for statement in statements]
+
+    contexts = [execution_context(connection, statement) for statement in statements]
+    # события те же, что у session.execute: срок запроса, трассировка.
+    # executing ждут after_cursor_execute, трассировка снимает спаны с конца
+    executing = []
+    try:
+        for context in contexts:
+            connection.dispatch.before_cursor_execute(
+                connection, context.cursor, context.statement, context.parameters[0], context, False
+            )
+            executing.append(context)
+    except BaseException:
+        # как в Connection.execute: отказ до отправки не оборачивается
+        for context in reversed(executing):
+            after_cursor_execute(connection, context)
+        for context in contexts:
+            context.cursor.close()
+        raise
+    try:
+        with connection.connection.dbapi_connection.pipeline():
+            for context in contexts:
+                dialect.do_execute(
+                    context.cursor, context.statement, context.parameters[0], context
+                )
+        # на выходе из pipeline все ответы уже получены
+        results = []
+        while executing:
+            context = executing[-1]
+            context.post_exec()
+            result = context._setup_result_proxy()
+            after_cursor_execute(connection, context)
+            executing.pop()
+            results.append(result)
+    except BaseException as e:
+        # какой из запросов упал, драйвер не сообщает: ошибку получает первый
+        # из незавершенных, остальные завершаются как обычно
+        failed, *rest = executing
+        for context in reversed(rest):
+            after_cursor_execute(connection, context)
+            context.cursor.close()
+        connection._handle_dbapi_exception(
+            e, failed.statement, failed.parameters[0], failed.cursor, failed
+        )
+    return results[::-1]
+
+
+def after_cursor_execute(connection, context) -> None:
+    connection.dispatch.after_cursor_execute(
+        connection, context.cursor, context.statement, context.parameters[0], context, False
+    )
+
+
+def execution_context(connection, statement):
+    """Контекст выполнения, как его строит Connection.execute, без выполнения"""
+    dialect = connection.dialect
+    options = statement._execution_options.merge_with(connection._execution_options)
+    compiled, extracted_params, cache_hit = statement._compile_w_cache(
+        dialect=dialect,
+        compiled_cache=options.get("compiled_cache", connection.engine._compiled_cache),
+        column_keys=[],
+        for_executemany=False,
+        schema_translate_map=options.get("schema_translate_map"),
+        linting=dialect.compiler_linting,
+    )
+    context = dialect.execution_ctx_cls._init_compiled(
+        dialect,
+        connection,
+        connection.connection,
+        options,
+        compiled,
+        [],
+        statement,
+        extracted_params,
+        cache_hit=cache_hit,
+    )
+    context.pre_exec()
+    return context
+
+
+def notifies(dialect, conn) -> list[str]:
+    """Payload пришедших NOTIFY на соединении с LISTEN, без ожидания"""
+    if dialect.driver == PSYCOPG:
+        conn.pgconn.consume_input()
+        payloads = []
+        while (notify := conn.pgconn.notifies()) is not None:
+            payloads.append(notify.extra.decode(conn.info.encoding))
+        return payloads
+    conn.poll()
+    payloads = [notify.payload for notify in conn.notifies]
+    conn.notifies.clear()
+    return payloads
@@ -0,0 +1,118 @@
+"""
+Заголовок Idempotency-Key для POST /new.
+
+Первый запрос выполняет запись и в той же транзакции сохраняет свой ответ,
+повтор с тем же ключом получает сохраненный ответ без повторной записи.
+Одновременные дубли ждут исходный запрос на advisory-блокировке транзакции:
+она снимается коммитом, после которого ответ уже виден. Ключ с другим телом
+запроса - ошибка 422. Ответы с ошибкой не сохраняются: транзакция
+откатывается, и повтор выполняется заново.
+"""
+
+import asyncio
+import datetime
+import hashlib
+import logging
+
+import database.orm as orm
+from fastapi import Response
+from models import ErrorResponse
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("uvicorn_main")
+
+table = orm.IdempotencyKey.__table__
+
+
+def request_hash(body) -> str:
+    return hashlib.sha256(body.model_dump_json().encode()).hexdigest()
+
+
+def begin(session: Session, scope: str, username: str, key: str, body, ttl: float) -> Response | None:
+    """
+    Берет блокировку ключа до конца транзакции и возвращает сохраненный ответ,
+    если запрос с этим ключом уже выполнялся, иначе None
+    """
+    session.execute(
+        select(func.pg_advisory_xact_lock(func.hashtextextended(f"{scope}:{username}:{key}", 0)))
+    )
+    stored = session.execute(
+        select(table.c.request_hash, table.c.status_code, table.c.response).where(
+            table.c.scope == scope,
+            table.c.username == username,
+            table.c.key == key,
+            table.c.created_at > func.localtimestamp() - datetime.timedelta(seconds=ttl),
+        )
+    ).first()
+    if stored is None:
+        return None
+    if stored[0] != request_hash(body):
+        return Response(
+            status_code=422,
+            content=ErrorResponse(
+                reason="Idempotency-Key was already used with another request"
+            ).model_dump_json(),
+        )
+    return Response(
+        status_code=stored[1],
+        content=stored[2],
+        media_type="application/json",
+        headers={"idempotent-replayed": "true"},
+    )
+
+
+def save(session: Session, scope: str, username: str, key: str, body, status_code: int, response: str) -> None:
+    # истекшая запись с тем же ключом перезаписывается
+    stmt = insert(table).values(
+        scope=scope,
+        username=username,
+        key=key,
+        request_hash=request_hash(body),
+        status_code=status_code,
+        response=response,
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.username, table.c.key],
+            set_={
+                "request_hash": stmt.excluded.request_hash,
+                "status_code": stmt.excluded.status_code,
+                "response": stmt.excluded.response,
+                "created_at": func.localtimestamp(),
+            },
+        )
+    )
+
+
+def purge(engine, ttl: float, batch_size: int = 1000) -> int:
+    """Удаляет истекшие ключи пачками, чтобы не держать долгих блокировок"""
+    removed = 0
+    while True:
+        expired = (
+            select(table.c.scope, table.c.username, table.c.key)
+            .where(table.c.created_at < func.localtimestamp() - datetime.timedelta(seconds=ttl))
+            .limit(batch_size)
+        )
+        with engine.begin() as conn:
+            count = conn.execute(
+                delete(table).where(
+                    tuple_(table.c.scope, table.c.username, table.c.key).in_(expired)
+                )
+            ).rowcount
+        removed += count
+        if count < batch_size:
+            return removed
+
+
+async def purge_periodically(engine, ttl: float, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await run_in_threadpool(purge, engine, ttl)
+            if removed:
+                logger.info("idempotency keys purged: %s", removed)
+        except Exception as e:
+            logger.error("idempotency keys purge failed: %s", e)
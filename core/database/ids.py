@@ -0,0 +1,43 @@
+"""
+Первичные ключи UUID версии 7 (RFC 9562): 48 бит миллисекунд Unix, 12 бит
+счетчика внутри миллисекунды, 62 случайных бита.
+
+Новые ключи попадают в правую часть B-дерева, а не в случайную страницу, и
+id известен до INSERT. Ключи одного процесса строго возрастают, даже если
+часы пошли назад; ключи разных воркеров упорядочены с точностью до
+миллисекунды. Формат строки тот же, что у uuid4.
+"""
+
+import secrets
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    global _last_ms, _counter
+    ms = time.time_ns() // 1_000_000
+    with _lock:
+        if ms > _last_ms:
+            _last_ms = ms
+            # случайное начало в нижней половине оставляет место для счетчика
+            _counter = secrets.randbits(11)
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # счетчик исчерпан: ключ берет следующую миллисекунду
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+    return uuid.UUID(
+        int=(ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | secrets.randbits(62)
+    )
+
+
+def timestamp(value: uuid.UUID) -> float:
+    """Время создания ключа в секундах Unix"""
+    return (value.int >> 80) / 1000
@@ -3,15 +3,22 @@ import uuid
 from typing import List, Optional
 
 from config import setings
+from database.driver import connect_args
+from database.ids import uuid7
 from sqlalchemy import (
+    CHAR,
+    BigInteger,
+    Boolean,
     CheckConstraint,
     Column,
     DateTime,
     Enum,
     ForeignKey,
     ForeignKeyConstraint,
+    Index,
     Integer,
     PrimaryKeyConstraint,
+    SmallInteger,
     String,
     Table,
     Text,
@@ -20,6 +27,7 @@ from sqlalchemy import (
     create_engine,
     text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -35,7 +43,7 @@ class Employee(Base):
     )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, server_default=text("uuid_generate_v4()")
+        Uuid, primary_key=True, default=uuid7, server_default=text("uuid_generate_v7()")
     )
     username: Mapped[str] = mapped_column(String(50))
     first_name: Mapped[Optional[str]] = mapped_column(String(50))
@@ -59,7 +67,7 @@ class Organization(Base):
     __table_args__ = (PrimaryKeyConstraint("id", name="organization_pkey"),)
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, server_default=text("uuid_generate_v4()")
+        Uuid, primary_key=True, default=uuid7, server_default=text("uuid_generate_v7()")
     )
     name: Mapped[str] = mapped_column(String(100))
     description: Mapped[Optional[str]] = mapped_column(Text)
@@ -98,10 +106,11 @@ class OrganizationResponsible(Base):
             name="organization_responsible_user_id_fkey",
         ),
         PrimaryKeyConstraint("id", name="organization_responsible_pkey"),
+        Index("organization_responsible_organization_user_idx", "organization_id", "user_id"),
     )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, server_default=text("uuid_generate_v4()")
+        Uuid, primary_key=True, default=uuid7, server_default=text("uuid_generate_v7()")
     )
     organization_id: Mapped[Optional[uuid.UUID]] = mapped_column(Uuid)
     user_id: Mapped[Optional[uuid.UUID]] = mapped_column(Uuid)
@@ -130,10 +139,24 @@ class Tender(Base):
             name="tender_organization_id_fkey",
         ),
         PrimaryKeyConstraint("id", name="tender_pkey"),
+        # список тендеров (queries.tenders_page)
+        Index(
+            "tender_published_created_at_idx",
+            "created_at",
+            "id",
+            postgresql_where=text("status = 'Published'"),
+        ),
+        Index(
+            "tender_unpublished_organization_idx",
+            "organization_id",
+            "created_at",
+            "id",
+            postgresql_where=text("status <> 'Published'"),
+        ),
     )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, server_default=text("uuid_generate_v4()")
+        Uuid, primary_key=True, default=uuid7, server_default=text("uuid_generate_v7()")
     )
     status: Mapped[str] = mapped_column(
         Enum("Created", "Published", "Closed", name="tender_status")
@@ -146,6 +169,10 @@ class Tender(Base):
     created_at: Mapped[Optional[datetime.datetime]] = mapped_column(
         DateTime, server_default=text("CURRENT_TIMESTAMP")
     )
+    # меняется триггером при смене статуса или активной версии
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, server_default=text("CURRENT_TIMESTAMP")
+    )
     employee: Mapped["Employee"] = relationship("Employee", back_populates="tender")
     organization: Mapped["Organization"] = relationship(
         "Organization", back_populates="tender"
@@ -173,6 +200,8 @@ class TenderVersion(Base):
 
 
 class Bid(Base):
+    # после database/partitioning.py первичный ключ в базе (id, tender_id) или
+    # (id, created_at), а каскад на bid_version делает триггер; для ORM ключ - id
     __tablename__ = "bid"
     __table_args__ = (
         ForeignKeyConstraint(
@@ -190,7 +219,7 @@ class Bid(Base):
     )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        Uuid, primary_key=True, server_default=text("uuid_generate_v4()")
+        Uuid, primary_key=True, default=uuid7, server_default=text("uuid_generate_v7()")
     )
     status: Mapped[Optional[str]] = mapped_column(
         Enum("Created", "Published", "Canceled", name="bid_status"),
@@ -208,6 +237,10 @@ class Bid(Base):
     created_at: Mapped[Optional[datetime.datetime]] = mapped_column(
         DateTime, server_default=text("CURRENT_TIMESTAMP")
     )
+    # меняется триггером при смене статуса или активной версии
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, server_default=text("CURRENT_TIMESTAMP")
+    )
     employee: Mapped["Employee"] = relationship("Employee", back_populates="bid")
     organization: Mapped["Organization"] = relationship(
         "Organization", back_populates="bid"
@@ -229,6 +262,99 @@ class BidVersion(Base):
     )
 
 
+class TenderBidSummary(Base):
+    """
+    Счетчики предложений тендера, их меняет триггер count_bid. Значение -
+    сумма строк тендера по shard
+    """
+
+    __tablename__ = "tender_bid_summary"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["tender_id"],
+            ["tender.id"],
+            ondelete="CASCADE",
+            name="tender_bid_summary_tender_id_fkey",
+        ),
+        PrimaryKeyConstraint("tender_id", "shard", name="tender_bid_summary_pkey"),
+    )
+
+    tender_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    shard: Mapped[int] = mapped_column(SmallInteger, primary_key=True, server_default=text("0"))
+    created: Mapped[int] = mapped_column(Integer, server_default=text("0"))
+    published: Mapped[int] = mapped_column(Integer, server_default=text("0"))
+    canceled: Mapped[int] = mapped_column(Integer, server_default=text("0"))
+    approved: Mapped[int] = mapped_column(Integer, server_default=text("0"))
+    rejected: Mapped[int] = mapped_column(Integer, server_default=text("0"))
+
+
+class IdempotencyKey(Base):
+    """Ответ на первый запрос с заголовком Idempotency-Key"""
+
+    __tablename__ = "idempotency_key"
+    __table_args__ = (
+        PrimaryKeyConstraint("scope", "username", "key", name="idempotency_key_pkey"),
+        Index("idempotency_key_created_at_idx", "created_at"),
+    )
+
+    scope: Mapped[str] = mapped_column(String(50))
+    username: Mapped[str] = mapped_column(String(50))
+    key: Mapped[str] = mapped_column(String(255))
+    request_hash: Mapped[str] = mapped_column(CHAR(64))
+    status_code: Mapped[int] = mapped_column(SmallInteger)
+    response: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, server_default=text("CURRENT_TIMESTAMP")
+    )
+
+
+class Job(Base):
+    """Фоновая задача, ее выполняет core/jobs.py"""
+
+    __tablename__ = "job"
+    __table_args__ = (
+        CheckConstraint(
+            "status IN ('Queued', 'Running', 'Succeeded', 'Failed', 'Canceled')",
+            name="job_status_check",
+        ),
+        ForeignKeyConstraint(
+            ["creator_username"],
+            ["employee.username"],
+            ondelete="CASCADE",
+            name="job_creator_username_fkey",
+        ),
+        PrimaryKeyConstraint("id", name="job_pkey"),
+        Index(
+            "job_queued_idx",
+            "created_at",
+            "id",
+            postgresql_where=text("status = 'Queued'"),
+        ),
+        Index("job_running_idx", "heartbeat_at", postgresql_where=text("status = 'Running'")),
+        Index(
+            "job_finished_at_idx", "finished_at", postgresql_where=text("finished_at IS NOT NULL")
+        ),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        Uuid, primary_key=True, default=uuid7, server_default=text("uuid_generate_v7()")
+    )
+    kind: Mapped[str] = mapped_column(String(50))
+    params: Mapped[dict] = mapped_column(JSONB, server_default=text("'{}'"))
+    status: Mapped[str] = mapped_column(String(20), server_default=text("'Queued'"))
+    creator_username: Mapped[str] = mapped_column(String(50))
+    done: Mapped[int] = mapped_column(BigInteger, server_default=text("0"))
+    total: Mapped[Optional[int]] = mapped_column(BigInteger)
+    result: Mapped[Optional[dict]] = mapped_column(JSONB)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, server_default=text("false"))
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, server_default=text("CURRENT_TIMESTAMP")
+    )
+    started_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+    heartbeat_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime)
+
 # t_tender_version = Table(
 #     'tender_version', Base.metadata,
 #     Column('tender_id', Uuid),
@@ -254,4 +380,10 @@ class BidVersion(Base):
 # )
 
 
-engine = create_engine(setings.postgress_conn)
+engine = create_engine(
+    setings.postgress_conn,
+    pool_size=setings.pool_size,
+    max_overflow=setings.pool_max_overflow,
+    pool_timeout=setings.pool_timeout,
+    connect_args=connect_args(setings.postgress_conn),
+)
@@ -0,0 +1,349 @@
+"""
+Секционирование bid, bid_version и tender_version без остановки записи.
+
+Раскладки (--layout):
+    hash  - bid и tender_version по hash(tender_id), bid_version по hash(bid_id);
+    range - bid по месяцам created_at плюс секция по умолчанию, версии как в
+            hash: created_at в них нет.
+
+Запуск из core с теми же переменными окружения, что у сервера:
+
+    python -m database.partitioning prepare --layout hash --partitions 16
+    python -m database.partitioning backfill --batch-size 5000
+    python -m database.partitioning cutover
+    python -m database.partitioning ensure --months-ahead 3
+
+prepare создает рядом секционированные копии <table>_partitioned и триггеры,
+которые повторяют в них каждую запись в исходные таблицы. backfill переносит
+существующие строки пачками по ключу; прерванный перенос продолжается с места
+остановки. cutover под короткой блокировкой меняет таблицы местами и переносит
+триггеры, исходные таблицы остаются как <table>_unpartitioned до ручного
+удаления. ensure для range создает секции на следующие месяцы - его нужно
+запускать по расписанию, пока в секцию по умолчанию не начали попадать строки.
+
+Имена таблиц не меняются, поэтому ORM и запросы работают с обеими раскладками.
+
+Чем платит секционированный bid:
+    - первичный ключ включает ключ секционирования: (id, tender_id) в hash и
+      (id, created_at) в range. Поиск только по id (редактирование, откат,
+      статус предложения) не знает секции и проверяет индекс каждой;
+    - колонки первичного ключа становятся NOT NULL. Если в bid уже есть
+      строки с NULL в tender_id (hash) или created_at (range), prepare
+      отказывается ставить триггеры; после prepare вставка такой строки в
+      bid падает уже в триггере копирования.
+"""
+
+import argparse
+import datetime
+import logging
+
+import database.orm as orm
+from sqlalchemy import text
+
+logger = logging.getLogger("uvicorn_main")
+
+# порядок переноса; версии предложений ссылаются на bid
+TABLES = ("tender_version", "bid", "bid_version")
+PROGRESS = "partitioning_progress"
+MIRROR = "partitioning_mirror"
+
+# ключ исходной таблицы для переноса пачками: колонка и тип
+SOURCE_KEYS = {
+    "tender_version": (("tender_id", "uuid"), ("version", "integer")),
+    "bid": (("id", "uuid"),),
+    "bid_version": (("bid_id", "uuid"), ("version", "integer")),
+}
+
+
+def layout_of(layout: str) -> dict:
+    """Ключ секционирования, уникальный ключ (включает ключ секционирования) и индексы"""
+    bid = {
+        "hash": {"by": "HASH (tender_id)", "key": ("id", "tender_id"), "primary": True},
+        "range": {"by": "RANGE (created_at)", "key": ("id", "created_at"), "primary": True},
+    }[layout]
+    return {
+        "tender_version": {"by": "HASH (tender_id)", "key": ("tender_id", "version"), "primary": False},
+        "bid": dict(bid, indexes=[("tender_id",), ("creator_username",)]),
+        "bid_version": {"by": "HASH (bid_id)", "key": ("bid_id", "version"), "primary": False},
+    }
+
+
+def month_partitions(table: str, first: datetime.date, last: datetime.date) -> list:
+    statements = []
+    month = first.replace(day=1)
+    while month <= last:
+        following = (month + datetime.timedelta(days=32)).replace(day=1)
+        statements.append(
+            f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {{parent}} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        month = following
+    return statements
+
+
+def partitions(conn, table: str, spec: dict, count: int, months_ahead: int) -> list:
+    if spec["by"].startswith("HASH"):
+        return [
+            f"CREATE TABLE {table}_p{i} PARTITION OF {{parent}} "
+            f"FOR VALUES WITH (MODULUS {count}, REMAINDER {i})"
+            for i in range(count)
+        ]
+    today = datetime.date.today()
+    first = conn.execute(text(f"SELECT min(created_at)::date FROM {table}")).scalar() or today
+    last = (today.replace(day=1) + datetime.timedelta(days=32 * months_ahead)).replace(day=1)
+    return month_partitions(table, first, last) + [
+        f"CREATE TABLE {table}_default PARTITION OF {{parent}} DEFAULT"
+    ]
+
+
+def foreign_keys(conn, table: str) -> list:
+    """Внешние ключи исходной таблицы, кроме ссылок на переносимые таблицы"""
+    rows = conn.execute(
+        text(
+            "SELECT conname, pg_get_constraintdef(oid), confrelid::regclass::text "
+            "FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+        ),
+        {"table": table},
+    ).all()
+    # на секционированную bid нельзя сослаться по одному id, каскад делает триггер
+    return [(name, definition) for name, definition, target in rows if target not in TABLES]
+
+
+def mirror_function(table: str, key: tuple) -> str:
+    match = " AND ".join(f"{column} = OLD.{column}" for column in key)
+    return f"""
+CREATE OR REPLACE FUNCTION {MIRROR}_{table}()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {table}_partitioned WHERE {match};
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {table}_partitioned VALUES (NEW.*);
+    END IF;
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql"""
+
+
+def prepare_statements(conn, layout: str, count: int, months_ahead: int) -> list:
+    statements = [
+        f"CREATE TABLE {PROGRESS} (table_name VARCHAR(50) PRIMARY KEY, "
+        "last_key TEXT[], done BOOLEAN NOT NULL DEFAULT FALSE)"
+    ]
+    for table, spec in layout_of(layout).items():
+        shadow = f"{table}_partitioned"
+        key = ", ".join(spec["key"])
+        statements.append(
+            f"CREATE TABLE {shadow} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY {spec['by']}"
+        )
+        statements += [
+            statement.format(parent=shadow)
+            for statement in partitions(conn, table, spec, count, months_ahead)
+        ]
+        if spec["primary"]:
+            statements.append(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow}_pkey PRIMARY KEY ({key})")
+        else:
+            statements.append(f"ALTER TABLE {shadow} ADD CONSTRAINT {shadow}_key UNIQUE ({key})")
+        for columns in spec.get("indexes", []):
+            name = f"{shadow}_{'_'.join(columns)}_idx"
+            statements.append(f"CREATE INDEX {name} ON {shadow} ({', '.join(columns)})")
+        for name, definition in foreign_keys(conn, table):
+            statements.append(f"ALTER TABLE {shadow} ADD CONSTRAINT {name} {definition}")
+        statements.append(mirror_function(table, spec["key"]))
+        statements.append(
+            f"CREATE TRIGGER {MIRROR} AFTER INSERT OR UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {MIRROR}_{table}()"
+        )
+        statements.append(f"INSERT INTO {PROGRESS} (table_name) VALUES ('{table}')")
+    return statements
+
+
+def null_keys(conn, layout: str) -> list:
+    """Колонки первичных ключей копий, в которых у исходных таблиц есть NULL"""
+    found = []
+    for table, spec in layout_of(layout).items():
+        if not spec["primary"]:
+            continue
+        for column in spec["key"]:
+            query = f"SELECT EXISTS (SELECT 1 FROM {table} WHERE {column} IS NULL)"
+            if conn.execute(text(query)).scalar():
+                found.append(f"{table}.{column}")
+    return found
+
+
+def prepare(engine, layout: str, count: int, months_ahead: int, dry_run: bool = False) -> None:
+    with engine.begin() as conn:
+        nulls = null_keys(conn, layout)
+        if nulls:
+            raise RuntimeError(f"NULL in primary key columns of the partitioned copy: {nulls}")
+        statements = prepare_statements(conn, layout, count, months_ahead)
+        for statement in statements:
+            if dry_run:
+                print(statement.strip() + ";\n")
+            else:
+                conn.exec_driver_sql(statement)
+
+
+def copy_batch(conn, table: str, last_key: list | None, batch_size: int) -> list | None:
+    """
+    Переносит следующую пачку и возвращает ее последний ключ. FOR SHARE не дает
+    изменить строки до коммита пачки, а после коммита их изменения повторит триггер
+    """
+    columns = ", ".join(column for column, _ in SOURCE_KEYS[table])
+    after = ""
+    params = {"batch_size": batch_size}
+    if last_key is not None:
+        casts = ", ".join(
+            f"CAST(:k{i} AS {kind})" for i, (_, kind) in enumerate(SOURCE_KEYS[table])
+        )
+        after = f"WHERE ({columns}) > ({casts})"
+        params.update({f"k{i}": value for i, value in enumerate(last_key)})
+    row = conn.execute(
+        text(
+            f"WITH batch AS (SELECT * FROM {table} {after} ORDER BY {columns} "
+            f"LIMIT :batch_size FOR SHARE), "
+            f"copied AS (INSERT INTO {table}_partitioned SELECT * FROM batch ON CONFLICT DO NOTHING) "
+            f"SELECT {columns} FROM batch ORDER BY {columns} DESC LIMIT 1"
+        ),
+        params,
+    ).first()
+    return None if row is None else [str(value) for value in row]
+
+
+def backfill(engine, batch_size: int) -> None:
+    with engine.connect() as conn:
+        pending = conn.execute(
+            text(f"SELECT table_name, last_key FROM {PROGRESS} WHERE NOT done")
+        ).all()
+    order = {table: index for index, table in enumerate(TABLES)}
+    for table, last_key in sorted(pending, key=lambda row: order[row[0]]):
+        copied = 0
+        while True:
+            # пачка и отметка прогресса коммитятся вместе
+            with engine.begin() as conn:
+                key = copy_batch(conn, table, last_key, batch_size)
+                conn.execute(
+                    text(
+                        f"UPDATE {PROGRESS} SET last_key = COALESCE(:key, last_key), "
+                        "done = :done WHERE table_name = :table"
+                    ),
+                    {"key": key, "done": key is None, "table": table},
+                )
+            if key is None:
+                break
+            last_key = key
+            copied += batch_size
+            logger.info("%s: about %s rows copied", table, copied)
+        logger.info("%s: backfill done", table)
+
+
+def cutover(engine, lock_timeout: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        conn.execute(text(f"LOCK TABLE {', '.join(TABLES)} IN ACCESS EXCLUSIVE MODE"))
+        unfinished = conn.execute(
+            text(f"SELECT table_name FROM {PROGRESS} WHERE NOT done")
+        ).scalars().all()
+        if unfinished:
+            raise RuntimeError(f"backfill is not finished for {', '.join(unfinished)}")
+        external = conn.execute(
+            text(
+                "SELECT conrelid::regclass::text, confrelid::regclass::text FROM pg_constraint "
+                "WHERE contype = 'f' AND confrelid::regclass::text = ANY(:tables) "
+                "AND conrelid::regclass::text <> ALL(:tables)"
+            ),
+            {"tables": list(TABLES)},
+        ).all()
+        if external:
+            raise RuntimeError(f"tables reference moved tables: {external}")
+        for table in TABLES:
+            triggers = conn.execute(
+                text(
+                    "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger "
+                    "WHERE tgrelid = CAST(:table AS regclass) AND NOT tgisinternal "
+                    "AND tgname <> :mirror"
+                ),
+                {"table": table, "mirror": MIRROR},
+            ).all()
+            # notify_change без аргумента взял бы вид события из имени секции
+            if any("notify_change()" in definition for _, definition in triggers):
+                raise RuntimeError("apply posgresql/migrations/010_notify_change_kind.sql first")
+            conn.execute(text(f"DROP TRIGGER {MIRROR} ON {table}"))
+            conn.execute(text(f"DROP FUNCTION {MIRROR}_{table}()"))
+            for name, _ in triggers:
+                conn.execute(text(f'DROP TRIGGER "{name}" ON {table}'))
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+            conn.execute(text(f"ALTER TABLE {table}_partitioned RENAME TO {table}"))
+            # определения ссылаются на имя таблицы и теперь относятся к новой
+            for _, definition in triggers:
+                conn.exec_driver_sql(definition)
+        conn.exec_driver_sql(
+            """
+CREATE OR REPLACE FUNCTION delete_bid_versions()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM bid_version WHERE bid_id = OLD.id;
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql"""
+        )
+        conn.execute(
+            text(
+                "CREATE TRIGGER delete_bid_versions AFTER DELETE ON bid "
+                "FOR EACH ROW EXECUTE FUNCTION delete_bid_versions()"
+            )
+        )
+        conn.execute(text(f"DROP TABLE {PROGRESS}"))
+    logger.info("cutover done, old tables: %s", ", ".join(f"{t}_unpartitioned" for t in TABLES))
+
+
+def ensure(engine, months_ahead: int) -> None:
+    with engine.begin() as conn:
+        parent = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname IN ('bid', 'bid_partitioned') AND p.partstrat = 'r'"
+            )
+        ).scalar()
+        if parent is None:
+            logger.info("bid is not range-partitioned, nothing to do")
+            return
+        today = datetime.date.today().replace(day=1)
+        last = (today + datetime.timedelta(days=32 * months_ahead)).replace(day=1)
+        for statement in month_partitions("bid", today, last):
+            conn.execute(text(statement.format(parent=parent)))
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(prog="python -m database.partitioning")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prepare_parser = commands.add_parser("prepare")
+    prepare_parser.add_argument("--layout", choices=["hash", "range"], default="hash")
+    prepare_parser.add_argument("--partitions", type=int, default=16)
+    prepare_parser.add_argument("--months-ahead", type=int, default=3)
+    prepare_parser.add_argument("--dry-run", action="store_true")
+    backfill_parser = commands.add_parser("backfill")
+    backfill_parser.add_argument("--batch-size", type=int, default=5000)
+    cutover_parser = commands.add_parser("cutover")
+    cutover_parser.add_argument("--lock-timeout", default="5s")
+    ensure_parser = commands.add_parser("ensure")
+    ensure_parser.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "prepare":
+        prepare(orm.engine, args.layout, args.partitions, args.months_ahead, args.dry_run)
+    elif args.command == "backfill":
+        backfill(orm.engine, args.batch_size)
+    elif args.command == "cutover":
+        cutover(orm.engine, args.lock_timeout)
+    else:
+        ensure(orm.engine, args.months_ahead)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+"""
+Запросы обработчиков core/v1.
+
+Формы запросов собраны здесь, чтобы прогрев при старте (warmup.py) компилировал
+ровно то же, что потом выполняют обработчики: кэш компиляции SQLAlchemy
+различает запросы по структуре, а не по значениям параметров.
+"""
+
+import datetime
+import uuid
+
+import database.orm as orm
+from database.ids import uuid7
+from sqlalchemy import (
+    ARRAY,
+    DateTime,
+    Select,
+    String,
+    Uuid,
+    and_,
+    any_,
+    bindparam,
+    case,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    true,
+    union_all,
+    update,
+)
+
+# DML строится по таблицам, а не по ORM-сущностям: ORM-путь сессии аннотирует
+# insert/update перед выполнением, и ключ кэша компиляции у них другой
+tender_table = orm.Tender.__table__
+tender_version_table = orm.TenderVersion.__table__
+bid_table = orm.Bid.__table__
+bid_version_table = orm.BidVersion.__table__
+job_table = orm.Job.__table__
+
+TENDER_FIELDS = ["organization_id", "creator_username", "status"]
+TENDER_VERSION_FIELDS = ["name", "description", "service_type"]
+BID_FIELDS = ["organization_id", "creator_username", "status", "tender_id"]
+BID_VERSION_FIELDS = ["name", "description"]
+
+
+def split_fields(body: dict, parent_fields: list, version_fields: list):
+    """
+    Делит тело запроса на колонки основной таблицы и таблицы версий.
+    Порядок ключей важен для кэша компиляции, поэтому он берется из тела
+    """
+    parent = {item: body[item] for item in body if item in parent_fields}
+    version = {item: body[item] for item in body if item in version_fields}
+    return parent, version
+
+
+def tender_rows() -> Select:
+    return select(
+        orm.Tender.id,
+        orm.TenderVersion.name,
+        orm.TenderVersion.description,
+        orm.Tender.status,
+        orm.TenderVersion.service_type,
+        orm.Tender.organization_id,
+        orm.Tender.creator_username,
+        orm.Tender.active_version,
+        orm.Tender.created_at,
+    ).join(
+        orm.TenderVersion,
+        (orm.Tender.id == orm.TenderVersion.tender_id)
+        & (orm.TenderVersion.version == orm.Tender.active_version),
+    )
+
+
+def bid_rows(active_only: bool = True) -> Select:
+    onclause = orm.Bid.id == orm.BidVersion.bid_id
+    if active_only:
+        onclause = onclause & (orm.BidVersion.version == orm.Bid.active_version)
+    return select(
+        orm.Bid.id,
+        orm.BidVersion.name,
+        orm.BidVersion.description,
+        orm.Bid.status,
+        orm.Bid.tender_id,
+        orm.Bid.creator_username,
+        orm.Bid.active_version,
+        orm.Bid.created_at,
+    ).join(orm.BidVersion, onclause)
+
+
+def parse_ids(ids: list) -> dict:
+    """
+    id из запроса -> UUID; строки, которые не являются UUID, получают None:
+    такой записи точно нет, а в запрос к базе они бы попали как ошибка
+    """
+    parsed = {}
+    for item in ids:
+        try:
+            parsed[item] = uuid.UUID(item)
+        except ValueError:
+            parsed[item] = None
+    return parsed
+
+
+def id_array(ids: list):
+    # один параметр-массив вместо IN (...): форма запроса не зависит от числа id
+    return any_(bindparam("ids", ids, type_=ARRAY(Uuid)))
+
+
+def username_param(username):
+    # bindparam, а не значение: сравнение с None не должно превращаться в IS NULL
+    return bindparam("username", username, type_=String)
+
+
+def responsible_for(organization_id, username):
+    """Пользователь username - ответственный за организацию organization_id"""
+    return (
+        select(orm.OrganizationResponsible.id)
+        .join(orm.Employee, orm.Employee.id == orm.OrganizationResponsible.user_id)
+        .where(
+            orm.OrganizationResponsible.organization_id == organization_id,
+            orm.Employee.username == username,
+        )
+        .exists()
+    )
+
+
+def tenders_by_ids(ids: list, username) -> Select:
+    """
+    Текущие версии тендеров по списку id и признак видимости для username:
+    опубликованные видны всем, остальные - автору и ответственным организации
+    """
+    username = username_param(username)
+    visible = or_(
+        orm.Tender.status == "Published",
+        orm.Tender.creator_username == username,
+        responsible_for(orm.Tender.organization_id, username),
+    )
+    return tender_rows().add_columns(visible).where(orm.Tender.id == id_array(ids))
+
+
+def bids_by_ids(ids: list, username) -> Select:
+    """
+    Текущие версии предложений по списку id и признак видимости для username:
+    предложение видно автору и ответственным его организации, опубликованное -
+    еще и ответственным организации тендера
+    """
+    username = username_param(username)
+    tender_responsible = (
+        select(orm.Tender.id)
+        .join(
+            orm.OrganizationResponsible,
+            orm.OrganizationResponsible.organization_id == orm.Tender.organization_id,
+        )
+        .join(orm.Employee, orm.Employee.id == orm.OrganizationResponsible.user_id)
+        .where(orm.Tender.id == orm.Bid.tender_id, orm.Employee.username == username)
+        .exists()
+    )
+    visible = or_(
+        orm.Bid.creator_username == username,
+        responsible_for(orm.Bid.organization_id, username),
+        and_(orm.Bid.status == "Published", tender_responsible),
+    )
+    return bid_rows().add_columns(visible).where(orm.Bid.id == id_array(ids))
+
+
+def tender_summary(tender_id, username) -> Select:
+    """
+    Счетчики предложений тендера и признак видимости тендера для username.
+    Тендер и счетчики читаются по первичному ключу
+    """
+    username = username_param(username)
+    summary = orm.TenderBidSummary
+    visible = or_(
+        orm.Tender.status == "Published",
+        orm.Tender.creator_username == username,
+        responsible_for(orm.Tender.organization_id, username),
+    )
+    columns = ("created", "published", "canceled", "approved", "rejected")
+    # строки счетчиков тендера по shard складываются
+    totals = (
+        select(
+            summary.tender_id,
+            *[func.sum(getattr(summary, name)).label(name) for name in columns],
+        )
+        .where(summary.tender_id == tender_id)
+        .group_by(summary.tender_id)
+        .subquery()
+    )
+    counters = [func.coalesce(totals.c[name], 0) for name in columns]
+    return (
+        select(*counters, visible)
+        .select_from(orm.Tender)
+        .outerjoin(totals, totals.c.tender_id == orm.Tender.id)
+        .where(orm.Tender.id == tender_id)
+    )
+
+
+def status_rows(entity, ids: list, username, since) -> Select:
+    """
+    (id, статус, доступен ли username, изменился ли после since, время базы)
+    для тендеров или предложений. Смотреть статус могут автор и ответственные
+    организации. При since=None признак изменения - NULL
+    """
+    username = username_param(username)
+    owner = or_(
+        entity.creator_username == username,
+        responsible_for(entity.organization_id, username),
+    )
+    changed = entity.updated_at > bindparam("since", since, type_=DateTime)
+    return select(entity.id, entity.status, owner, changed, func.localtimestamp()).where(
+        entity.id == id_array(ids)
+    )
+
+
+def tender_statuses(ids: list, username, since) -> Select:
+    return status_rows(orm.Tender, ids, username, since)
+
+
+def bid_statuses(ids: list, username, since) -> Select:
+    return status_rows(orm.Bid, ids, username, since)
+
+
+def since_token(db_time: datetime.datetime, grace: float) -> str:
+    # запас на транзакции, которые изменили строку раньше, а закоммитились позже
+    return (db_time - datetime.timedelta(seconds=grace)).isoformat()
+
+
+def parse_since(token: str | None) -> datetime.datetime | None:
+    """ValueError, если токен испорчен"""
+    return datetime.datetime.fromisoformat(token) if token else None
+
+
+def employee_id(username) -> Select:
+    return select(orm.Employee.id).where(orm.Employee.username == username)
+
+
+def memberships(username):
+    """Организации, за которые отвечает username"""
+    return (
+        select(orm.OrganizationResponsible.organization_id)
+        .join(orm.Employee, orm.Employee.id == orm.OrganizationResponsible.user_id)
+        .where(orm.Employee.username == username)
+    )
+
+
+def tenders_page(service_types, username, limit, offset) -> Select:
+    """
+    Страница тендеров, видимых username: опубликованные видны всем, созданные
+    и закрытые - ответственным организации. Без username - только
+    опубликованные.
+
+    Видимость - часть WHERE, поэтому limit и offset отсчитываются по видимым
+    строкам. Опубликованные читаются по частичному индексу
+    tender_published_created_at_idx уже в порядке страницы, остальные - по
+    tender_unpublished_organization_idx для организаций пользователя; каждая
+    ветка UNION ALL отдает не больше offset + limit строк
+    """
+
+    def branch(visible, size) -> Select:
+        stmt = tender_rows().where(visible)
+        if service_types:
+            stmt = stmt.where(
+                orm.TenderVersion.service_type.in_([item.value for item in service_types])
+            )
+        return stmt.order_by(orm.Tender.created_at.desc(), orm.Tender.id.desc()).limit(size)
+
+    # литерал, а не параметр: иначе в подготовленном запросе с общим планом
+    # условие частичного индекса не доказывается
+    published = orm.Tender.status == literal_column("'Published'")
+    if not username:
+        return branch(published, limit).offset(offset)
+
+    own = and_(
+        orm.Tender.status != literal_column("'Published'"),
+        orm.Tender.organization_id.in_(memberships(username_param(username))),
+    )
+    page = union_all(branch(published, limit + offset), branch(own, limit + offset)).subquery()
+    return (
+        select(page)
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+def tenders_by_creator(username, limit, offset) -> Select:
+    return (
+        tender_rows()
+        .where(orm.Tender.creator_username == str(username))
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+def tender_creator(tender_id) -> Select:
+    return select(orm.Tender.creator_username).where(orm.Tender.id == tender_id)
+
+
+def tender_status(tender_id) -> Select:
+    return select(orm.Tender.status).where(orm.Tender.id == tender_id)
+
+
+def create_tender(values: dict, version_values: dict) -> Select:
+    """
+    Тендер и его первая версия одним запросом: id генерируется заранее,
+    поэтому версии не нужно ждать RETURNING. (id, created_at, active_version)
+    """
+    tender_id = uuid7()
+    parent = (
+        insert(tender_table)
+        .values(**values, id=tender_id)
+        .returning(tender_table.c.id, tender_table.c.created_at, tender_table.c.active_version)
+        .cte("parent")
+    )
+    version = (
+        insert(tender_version_table)
+        .values(**version_values, tender_id=tender_id)
+        .returning(tender_version_table.c.tender_id)
+        .cte("version")
+    )
+    return select(parent).add_cte(version)
+
+
+def bids_by_creator(username, limit, offset) -> Select:
+    return (
+        bid_rows()
+        .where(orm.Bid.creator_username == str(username))
+        .limit(limit)
+        .offset(offset)
+    )
+
+
+def bids_for_tender(tender_id, limit, offset) -> Select:
+    return bid_rows().where(orm.Bid.tender_id == tender_id).limit(limit).offset(offset)
+
+
+def rollback_bid(bid_id, version, username) -> Select:
+    """
+    Откат предложения автором одним запросом: строка ответа с версией version
+    или пустой результат, если предложения, версии или прав нет
+    """
+    target = (
+        bid_rows(active_only=False)
+        .where(
+            orm.Bid.id == bid_id,
+            orm.BidVersion.version == version,
+            orm.Bid.creator_username == username,
+        )
+        .cte("target")
+    )
+    updated = (
+        update(bid_table)
+        .where(bid_table.c.id == target.c.id)
+        .values(active_version=version)
+        .returning(bid_table.c.active_version)
+        .cte("updated")
+    )
+    return select(
+        target.c.id,
+        target.c.name,
+        target.c.description,
+        target.c.status,
+        target.c.tender_id,
+        target.c.creator_username,
+        updated.c.active_version,
+        target.c.created_at,
+    ).join_from(target, updated, true())
+
+
+def bid_creator(bid_id) -> Select:
+    return select(orm.Bid.creator_username).where(orm.Bid.id == bid_id)
+
+
+def bid_status(bid_id) -> Select:
+    return select(orm.Bid.status).where(orm.Bid.id == bid_id)
+
+
+def create_bid(values: dict, version_values: dict) -> Select:
+    """Предложение и его первая версия одним запросом, как create_tender"""
+    bid_id = uuid7()
+    parent = (
+        insert(bid_table)
+        .values(**values, id=bid_id)
+        .returning(bid_table.c.id, bid_table.c.created_at, bid_table.c.active_version)
+        .cte("parent")
+    )
+    version = (
+        insert(bid_version_table)
+        .values(**version_values, bid_id=bid_id)
+        .returning(bid_version_table.c.bid_id)
+        .cte("version")
+    )
+    return select(parent).add_cte(version)
+
+
+def edit_bid(bid_id, username, name, description) -> Select:
+    """
+    Новая версия предложения одним запросом: проверка автора, чтение текущей
+    версии, вставка версии max + 1 и смена активной. Строка ответа и признак
+    прав; версия и имя - NULL, если прав нет. Пустой результат - предложения
+    нет. Параллельная правка того же предложения получит нарушение
+    уникальности (bid_id, version)
+    """
+    username = username_param(username)
+    target = (
+        select(
+            orm.Bid.id,
+            orm.Bid.status,
+            orm.Bid.tender_id,
+            orm.Bid.creator_username,
+            orm.Bid.created_at,
+            orm.BidVersion.name,
+            orm.BidVersion.description,
+            (orm.Bid.creator_username == username).label("allowed"),
+        )
+        .join(
+            orm.BidVersion,
+            (orm.BidVersion.bid_id == orm.Bid.id)
+            & (orm.BidVersion.version == orm.Bid.active_version),
+        )
+        .where(orm.Bid.id == bid_id)
+        .cte("target")
+    )
+    max_version = (
+        select(func.max(bid_version_table.c.version))
+        .where(bid_version_table.c.bid_id == target.c.id)
+        .scalar_subquery()
+    )
+    new_version = (
+        insert(bid_version_table)
+        .from_select(
+            ["bid_id", "version", "name", "description"],
+            select(
+                target.c.id,
+                max_version + 1,
+                func.coalesce(bindparam("name", name, type_=String), target.c.name),
+                func.coalesce(
+                    bindparam("description", description, type_=String), target.c.description
+                ),
+            ).where(target.c.allowed),
+        )
+        .returning(
+            bid_version_table.c.bid_id,
+            bid_version_table.c.version,
+            bid_version_table.c.name,
+            bid_version_table.c.description,
+        )
+        .cte("new_version")
+    )
+    updated = (
+        update(bid_table)
+        .where(bid_table.c.id == new_version.c.bid_id)
+        .values(active_version=new_version.c.version)
+        .returning(bid_table.c.id)
+        .cte("updated")
+    )
+    return (
+        select(
+            target.c.id,
+            new_version.c.name,
+            new_version.c.description,
+            target.c.status,
+            target.c.tender_id,
+            target.c.creator_username,
+            new_version.c.version,
+            target.c.created_at,
+            target.c.allowed,
+        )
+        .outerjoin_from(target, new_version, true())
+        .add_cte(updated)
+    )
+
+
+JOB_COLUMNS = [
+    job_table.c.id,
+    job_table.c.kind,
+    job_table.c.status,
+    job_table.c.done,
+    job_table.c.total,
+    job_table.c.result,
+    job_table.c.error,
+    job_table.c.cancel_requested,
+    job_table.c.created_at,
+    job_table.c.started_at,
+    job_table.c.finished_at,
+    job_table.c.creator_username,
+]
+
+
+def create_job(kind: str, params: dict, username):
+    return insert(job_table).values(
+        id=uuid7(), kind=kind, params=params, creator_username=username
+    ).returning(*JOB_COLUMNS)
+
+
+def job_by_id(job_id) -> Select:
+    return select(*JOB_COLUMNS).where(job_table.c.id == job_id)
+
+
+def cancel_job(job_id):
+    """Задача из очереди отменяется сразу, выполняющаяся - когда сообщит прогресс"""
+    queued = job_table.c.status == "Queued"
+    return (
+        update(job_table)
+        .where(job_table.c.id == job_id, job_table.c.status.in_(["Queued", "Running"]))
+        .values(
+            status=case((queued, "Canceled"), else_=job_table.c.status),
+            finished_at=case((queued, func.localtimestamp()), else_=job_table.c.finished_at),
+            cancel_requested=True,
+        )
+        .returning(*JOB_COLUMNS)
+    )
@@ -0,0 +1,146 @@
+"""
+Маршрутизация чтения на реплики.
+
+Списки и статусы читаются с реплик, записи идут на основной сервер. Реплика
+пропускается, если ее отставание больше допустимого или она недоступна; если
+подходящих реплик нет, чтение уходит на основной сервер. Пользователь, который
+только что что-то записал, какое-то время читает с основного сервера, чтобы
+видеть свои изменения (в пределах воркера).
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import database.orm as orm
+from config import setings
+from database.driver import connect_args
+from sqlalchemy import Engine, create_engine, text
+
+logger = logging.getLogger("uvicorn_main")
+
+LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class Replica:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.lag = 0.0
+        self.checked_at = float("-inf")
+        self.checking = threading.Lock()
+
+    def refresh_lag(self, interval: float) -> None:
+        if time.monotonic() - self.checked_at < interval:
+            return
+        # проверяет один поток, остальные пока используют прошлое значение
+        if not self.checking.acquire(blocking=False):
+            return
+        try:
+            with self.engine.connect() as conn:
+                self.lag = float(conn.execute(LAG_QUERY).scalar())
+        except Exception as e:
+            logger.error("replica %s is unavailable: %s", self.engine.url.host, e)
+            self.lag = float("inf")
+        finally:
+            self.checked_at = time.monotonic()
+            self.checking.release()
+
+
+class ReplicaRouter:
+    def __init__(
+        self,
+        primary: Engine,
+        replicas: list[Engine],
+        strategy: str = "round_robin",
+        max_lag: float = 5.0,
+        lag_check_interval: float = 1.0,
+        sticky_seconds: float = 5.0,
+        max_sticky_users: int = 100_000,
+    ):
+        self.primary = primary
+        self.replicas = [Replica(engine) for engine in replicas]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.sticky_seconds = sticky_seconds
+        self.max_sticky_users = max_sticky_users
+        self.recent_writers: OrderedDict = OrderedDict()
+        self._writers_lock = threading.Lock()
+        self._next = itertools.count()
+
+    def engines(self) -> list[Engine]:
+        return [self.primary] + [replica.engine for replica in self.replicas]
+
+    def mark_write(self, username) -> None:
+        if not isinstance(username, str) or not username:
+            return
+        now = time.monotonic()
+        with self._writers_lock:
+            self.recent_writers.pop(username, None)
+            self.recent_writers[username] = now + self.sticky_seconds
+            # записи упорядочены по времени, истекшие всегда в начале
+            while self.recent_writers and (
+                len(self.recent_writers) > self.max_sticky_users
+                or next(iter(self.recent_writers.values())) < now
+            ):
+                self.recent_writers.popitem(last=False)
+
+    def wrote_recently(self, username) -> bool:
+        expires = self.recent_writers.get(username) if isinstance(username, str) else None
+        return expires is not None and expires > time.monotonic()
+
+    def read_engine(self, username=None) -> Engine:
+        if not self.replicas or self.wrote_recently(username):
+            return self.primary
+        for replica in self.replicas:
+            replica.refresh_lag(self.lag_check_interval)
+        healthy = [replica for replica in self.replicas if replica.lag <= self.max_lag]
+        if not healthy:
+            return self.primary
+        if self.strategy == "least_connections":
+            return min(healthy, key=lambda replica: replica.engine.pool.checkedout()).engine
+        return healthy[next(self._next) % len(healthy)].engine
+
+
+replica_engines = [
+    create_engine(
+        url,
+        pool_size=setings.pool_size,
+        max_overflow=setings.pool_max_overflow,
+        pool_timeout=setings.pool_timeout,
+        connect_args=connect_args(url),
+    )
+    for url in setings.postgres_replicas
+]
+
+router = ReplicaRouter(
+    orm.engine,
+    replica_engines,
+    strategy=setings.replica_strategy,
+    max_lag=setings.replica_max_lag,
+    lag_check_interval=setings.replica_lag_check_interval,
+    sticky_seconds=setings.replica_sticky_seconds,
+)
+
+
+def read_engine(username=None) -> Engine:
+    return router.read_engine(username)
+
+
+def mark_write(username) -> None:
+    router.mark_write(username)
+
+
+def max_staleness() -> float:
+    """На сколько секунд прочитанные данные могут отставать от основного сервера"""
+    return router.max_lag if router.replicas else 0.0
@@ -0,0 +1,96 @@
+"""
+Сессия на запрос: Depends(write_session) или Depends(read_session).
+
+Соединение берется из пула при первом запросе к базе, поэтому запросы,
+отклоненные валидацией или отвеченные без базы, пул не трогают. Реплику
+read_session тоже выбирает только тогда (с проверкой отставания). Транзакция
+одна на запрос и завершается один раз после обработчика: commit, а если
+обработчик упал - rollback. Обработчик, поймавший ошибку базы, сам вызывает
+session.rollback(), после этого коммитить нечего.
+
+Время, пока запрос держал соединение, отдается в заголовке
+Server-Timing: db;dur=<мс>.
+"""
+
+import time
+
+import database.orm as orm
+import database.routing as routing
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class RequestSession(Session):
+    def __init__(self, bind=None, choose_bind=None):
+        super().__init__(bind)
+        self.hold = 0.0
+        self._checked_out = None
+        # выбор движка при первом обращении к базе
+        self._choose_bind = choose_bind
+
+    def get_bind(self, mapper=None, **kw):
+        if self.bind is None and self._choose_bind is not None:
+            self.bind = self._choose_bind()
+        return super().get_bind(mapper, **kw)
+
+
+@event.listens_for(RequestSession, "after_begin")
+def _checked_out(session, transaction, connection):
+    if transaction.parent is None:
+        session._checked_out = time.perf_counter()
+
+
+@event.listens_for(RequestSession, "after_transaction_end")
+def _released(session, transaction):
+    if transaction.parent is None and session._checked_out is not None:
+        session.hold += time.perf_counter() - session._checked_out
+        session._checked_out = None
+
+
+def unit_of_work(request: Request, bind=None, choose_bind=None):
+    session = RequestSession(bind, choose_bind)
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        request.state.db_hold = getattr(request.state, "db_hold", 0.0) + session.hold
+
+
+def write_session(request: Request):
+    """Сессия на основном сервере"""
+    yield from unit_of_work(request, orm.engine)
+
+
+def read_session(request: Request):
+    """
+    Сессия на реплике, если они есть. Пользователь из параметра username
+    после своей записи читает с основного сервера
+    """
+    username = request.query_params.get("username")
+    yield from unit_of_work(request, choose_bind=lambda: routing.read_engine(username))
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                hold = scope.get("state", {}).get("db_hold")
+                if hold is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", f"db;dur={hold * 1000:.1f}".encode()))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
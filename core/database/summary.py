@@ -0,0 +1,179 @@
+"""
+Сверка счетчиков tender_bid_summary (posgresql/migrations/007_tender_bid_summary.sql)
+с таблицей bid.
+
+Счетчики меняет триггер на bid, поэтому расходиться они могут только после
+ручных правок или восстановления из копии. Триггер пишет в строку (tender_id,
+shard) своего соединения; сверка заодно сворачивает строки тендера в shard 0.
+Сверка идет пачками по tender_id: строки счетчиков пачки блокируются, и только
+после этого считаются предложения. Транзакция, которая уже изменила счетчик, к
+этому моменту закоммичена, а следующая дождется блокировки (или создаст новую
+строку shard) и прибавит свое к пересчитанному значению. Из воркеров работает
+один, как и архиватор. Разово:
+
+    python -m database.summary
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+
+import database.orm as orm
+from config import setings
+from sqlalchemy import ARRAY, Boolean, Uuid, bindparam, text
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("uvicorn_main")
+
+# ключ advisory-блокировки: одна сверка на базу
+LOCK_KEY = 7_044_001
+
+MISSING = """
+INSERT INTO tender_bid_summary (tender_id)
+SELECT t.id FROM tender t
+WHERE NOT EXISTS (SELECT 1 FROM tender_bid_summary s WHERE s.tender_id = t.id AND s.shard = 0)
+ON CONFLICT DO NOTHING
+"""
+
+LOCK_BATCH = text("""
+SELECT tender_id FROM tender_bid_summary
+WHERE tender_id IN (
+    SELECT tender_id FROM tender_bid_summary
+    WHERE tender_id > :after AND shard = 0
+    ORDER BY tender_id
+    LIMIT :batch_size
+)
+ORDER BY tender_id, shard
+FOR UPDATE
+""").bindparams(bindparam("after", type_=Uuid)).columns(tender_id=Uuid)
+
+# (tender_id, расходился ли счетчик) для тендеров, чьи строки изменены
+FIX_BATCH = text("""
+WITH actual AS (
+    SELECT
+        t.tender_id,
+        count(b.id) FILTER (WHERE b.status = 'Created') AS created,
+        count(b.id) FILTER (WHERE b.status = 'Published') AS published,
+        count(b.id) FILTER (WHERE b.status = 'Canceled') AS canceled,
+        count(b.id) FILTER (WHERE b.desision = 'Approved') AS approved,
+        count(b.id) FILTER (WHERE b.desision = 'Rejected') AS rejected
+    FROM unnest(CAST(:ids AS uuid[])) AS t(tender_id)
+    LEFT JOIN bid b ON b.tender_id = t.tender_id
+    GROUP BY t.tender_id
+), counted AS (
+    SELECT
+        tender_id,
+        count(*) AS shards,
+        sum(created) AS created,
+        sum(published) AS published,
+        sum(canceled) AS canceled,
+        sum(approved) AS approved,
+        sum(rejected) AS rejected
+    FROM tender_bid_summary
+    WHERE tender_id = ANY(:ids)
+    GROUP BY tender_id
+), folded AS (
+    DELETE FROM tender_bid_summary WHERE tender_id = ANY(:ids) AND shard <> 0
+)
+UPDATE tender_bid_summary s SET
+    created = a.created,
+    published = a.published,
+    canceled = a.canceled,
+    approved = a.approved,
+    rejected = a.rejected
+FROM actual a
+JOIN counted c ON c.tender_id = a.tender_id
+WHERE s.tender_id = a.tender_id AND s.shard = 0
+  AND (
+      c.shards > 1
+      OR (c.created, c.published, c.canceled, c.approved, c.rejected)
+         IS DISTINCT FROM (a.created, a.published, a.canceled, a.approved, a.rejected)
+  )
+RETURNING
+    s.tender_id,
+    (c.created, c.published, c.canceled, c.approved, c.rejected)
+    IS DISTINCT FROM (a.created, a.published, a.canceled, a.approved, a.rejected) AS drifted
+""").bindparams(bindparam("ids", type_=ARRAY(Uuid))).columns(tender_id=Uuid, drifted=Boolean)
+
+
+class SummaryReconciler:
+    def __init__(self, engine, batch_size: int, batch_pause: float):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.fixed = 0
+        self.runs = 0
+        self.last_run = None
+
+    def reconcile_batch(self, after: uuid.UUID, on_batch=None) -> tuple[uuid.UUID | None, int]:
+        """(последний tender_id пачки или None, если пачка пуста; исправлено строк)"""
+        with self.engine.begin() as conn:
+            # по строке на shard, порядок tender_id сохраняется
+            ids = list(
+                dict.fromkeys(
+                    conn.execute(
+                        LOCK_BATCH, {"after": after, "batch_size": self.batch_size}
+                    ).scalars()
+                )
+            )
+            if not ids:
+                return None, 0
+            rows = conn.execute(FIX_BATCH, {"ids": ids}).all()
+        fixed = [tender_id for tender_id, drifted in rows if drifted]
+        for tender_id in fixed:
+            logger.warning("bid summary drift fixed for tender %s", tender_id)
+        if on_batch is not None:
+            on_batch(len(ids))
+        return ids[-1], len(fixed)
+
+    def run_once(self, on_batch=None) -> dict | None:
+        """
+        Итоги запуска или None, если сверка уже идет в другом воркере.
+        on_batch получает число проверенных тендеров пачки
+        """
+        result = {"missing": 0, "fixed": 0}
+        with self.engine.connect() as lock_conn:
+            if not lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": LOCK_KEY}
+            ).scalar():
+                return None
+            try:
+                with self.engine.begin() as conn:
+                    result["missing"] = conn.execute(text(MISSING)).rowcount
+                after, fixed = self.reconcile_batch(uuid.UUID(int=0), on_batch)
+                while after is not None:
+                    result["fixed"] += fixed
+                    time.sleep(self.batch_pause)
+                    after, fixed = self.reconcile_batch(after, on_batch)
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+                lock_conn.commit()
+        self.fixed += result["fixed"] + result["missing"]
+        self.runs += 1
+        self.last_run = time.time()
+        logger.info("bid summary reconciled: %s", result)
+        return result
+
+    async def run_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception as e:
+                logger.error("bid summary reconcile failed: %s", e)
+
+    def stats(self) -> dict:
+        return {"fixed": self.fixed, "runs": self.runs, "last_run": self.last_run}
+
+
+reconciler = SummaryReconciler(
+    orm.engine,
+    batch_size=setings.summary_reconcile_batch_size,
+    batch_pause=setings.summary_reconcile_batch_pause,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(reconciler.run_once() or "reconcile is already running")
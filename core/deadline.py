@@ -0,0 +1,262 @@
+"""
+Срок запроса и отмена запросов к базе, когда клиент ушел.
+
+Срок берется из REQUEST_DEADLINES по префиксу пути или из REQUEST_DEADLINE,
+заголовок REQUEST_DEADLINE_HEADER (секунды) может его только сократить, а
+если срока для маршрута нет - задает его. Каждый запрос к базе перед
+отправкой проверяет срок, а в момент срока таймер отменяет выполняющиеся
+SQL-запросы (pg_cancel_backend через connection.cancel()), поэтому запрос,
+отправленный перед самым сроком, не работает дольше него. Лишнего SET
+statement_timeout на каждую транзакцию нет. Если срок вышел, клиент получает
+504 "deadline exceeded", что бы ни ответил обработчик.
+
+Пока выполняется запрос, middleware слушает receive: если клиент отключился
+до ответа, выполняющиеся SQL-запросы отменяются так же, а новые не
+отправляются. Прерванная работа считается в stats() и пишется в лог строкой
+"stats" (statslog.py).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from models import ErrorResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("uvicorn_main")
+
+current_deadline: ContextVar = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class RequestDeadline:
+    def __init__(self, expires: float | None):
+        self.expires = expires
+        self.expired = False
+        self.disconnected = False
+        # DBAPI-соединения, на которых сейчас выполняется запрос
+        self.connections: set = set()
+        self.lock = threading.Lock()
+
+    def remaining(self) -> float | None:
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+    def check(self) -> None:
+        """Перед запросом к базе: срок вышел или клиента уже нет"""
+        if self.disconnected:
+            raise DeadlineExceeded("client disconnected")
+        if self.expired:
+            raise DeadlineExceeded("deadline exceeded")
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.expired = True
+            raise DeadlineExceeded("deadline exceeded")
+
+
+class DeadlineStats:
+    def __init__(self):
+        self.expired = 0
+        self.disconnected = 0
+        self.canceled_statements = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "expired": self.expired,
+            "disconnected": self.disconnected,
+            "canceled_statements": self.canceled_statements,
+        }
+
+
+stats = DeadlineStats()
+
+
+def parse_timeout(value: str | None) -> float | None:
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        return None
+    return timeout if timeout > 0 else None
+
+
+class DeadlineMiddleware:
+    def __init__(
+        self,
+        app,
+        default: float,
+        route_deadlines: dict | None = None,
+        header: str = "",
+        cancel_on_disconnect: bool = True,
+        exempt_paths=(),
+    ):
+        self.app = app
+        self.default = default
+        self.route_deadlines = route_deadlines or {}
+        self.prefixes = sorted(self.route_deadlines, key=len, reverse=True)
+        self.header = header.lower().encode()
+        self.cancel_on_disconnect = cancel_on_disconnect
+        self.exempt_paths = set(exempt_paths)
+
+    def deadline_for(self, path: str) -> float:
+        for prefix in self.prefixes:
+            if path.startswith(prefix):
+                return self.route_deadlines[prefix]
+        return self.default
+
+    def budget(self, scope) -> float | None:
+        budget = self.deadline_for(scope["path"]) or None
+        if self.header:
+            for name, value in scope["headers"]:
+                if name == self.header:
+                    requested = parse_timeout(value.decode("latin-1"))
+                    if requested is not None:
+                        budget = requested if budget is None else min(budget, requested)
+                    break
+        return budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        budget = self.budget(scope)
+        if budget is None and not self.cancel_on_disconnect:
+            await self.app(scope, receive, send)
+            return
+        state = RequestDeadline(None if budget is None else time.monotonic() + budget)
+        token = current_deadline.set(state)
+        responded = False
+        replaced = False
+
+        # receive читает только этот middleware: сообщения тела передаются
+        # приложению через очередь, отключение замечается сразу
+        messages: asyncio.Queue = asyncio.Queue()
+
+        async def listen():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not responded:
+                        await self.abort(state)
+                    return
+
+        async def receive_buffered():
+            return await messages.get()
+
+        async def send_checked(message):
+            nonlocal responded, replaced
+            if message["type"] == "http.response.start":
+                responded = True
+                if state.expired:
+                    replaced = True
+                    await self.timeout_response(send)
+                    return
+            if replaced:
+                return
+            await send(message)
+
+        async def expire():
+            await asyncio.sleep(budget)
+            if not responded:
+                state.expired = True
+                await self.cancel_statements(state)
+
+        listener = asyncio.create_task(listen()) if self.cancel_on_disconnect else None
+        timer = asyncio.create_task(expire()) if budget is not None else None
+        try:
+            await self.app(scope, receive_buffered if listener else receive, send_checked)
+        finally:
+            responded = True
+            for task in (listener, timer):
+                if task is not None:
+                    task.cancel()
+            current_deadline.reset(token)
+            if state.expired:
+                stats.expired += 1
+                logger.warning("deadline exceeded: %s %s", scope["method"], scope["path"])
+
+    async def abort(self, state: RequestDeadline) -> None:
+        state.disconnected = True
+        stats.disconnected += 1
+        await self.cancel_statements(state)
+
+    async def cancel_statements(self, state: RequestDeadline) -> None:
+        with state.lock:
+            connections = list(state.connections)
+        if not connections:
+            return
+        stats.canceled_statements += len(connections)
+        logger.warning(
+            "%s, canceling %s statements",
+            "client disconnected" if state.disconnected else "deadline exceeded",
+            len(connections),
+        )
+        loop = asyncio.get_running_loop()
+        for connection in connections:
+            # cancel() открывает отдельное соединение с сервером
+            await loop.run_in_executor(None, cancel, connection)
+
+    async def timeout_response(self, send) -> None:
+        body = ErrorResponse(reason="deadline exceeded").model_dump_json().encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def stats(self) -> dict:
+        return stats.as_dict()
+
+
+def cancel(connection) -> None:
+    try:
+        connection.cancel()
+    except Exception as e:
+        logger.error("statement cancel failed: %s", e)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = current_deadline.get()
+    if state is None:
+        return
+    dbapi_connection = conn.connection.dbapi_connection
+    # сначала в список, потом проверка: таймер, сработавший между ними,
+    # либо увидит соединение, либо проверка увидит вышедший срок
+    with state.lock:
+        state.connections.add(dbapi_connection)
+        try:
+            state.check()
+        except DeadlineExceeded:
+            state.connections.discard(dbapi_connection)
+            raise
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = current_deadline.get()
+    if state is not None:
+        with state.lock:
+            state.connections.discard(conn.connection.dbapi_connection)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    state = current_deadline.get()
+    if state is None or context.connection is None:
+        return
+    with state.lock:
+        state.connections.discard(context.connection.connection.dbapi_connection)
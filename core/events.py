@@ -0,0 +1,203 @@
+"""
+Лента изменений тендеров и предложений для GET /api/events.
+
+Триггеры из posgresql/migrations/002_change_events.sql шлют NOTIFY при смене
+статуса или активной версии. Каждый воркер держит одно соединение с LISTEN
+(вне пула) и раздает события подписчикам через EventBroker. Очередь подписчика
+ограничена: если клиент не успевает читать, он получает событие reset и
+отключается, а при переподключении продолжает с Last-Event-ID по буферу
+последних событий.
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+
+from database.driver import notifies
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("uvicorn_main")
+
+CHANNEL = "tender_changes"
+# клиенту нужно заново запросить статусы: часть событий могла потеряться
+RESET_FRAME = b"event: reset\ndata: {}\n\n"
+
+
+class ChangeEvent:
+    __slots__ = ("seq", "kind", "tender_id", "organization_id", "frame")
+
+    def __init__(self, payload: dict):
+        self.seq = payload["seq"]
+        self.kind = payload["kind"]
+        self.tender_id = payload["tender_id"]
+        self.organization_id = payload["organization_id"]
+        self.frame = (
+            f"id: {self.seq}\nevent: {payload['kind']}\ndata: {json.dumps(payload)}\n\n".encode()
+        )
+
+
+class Subscriber:
+    def __init__(
+        self, organizations: set, tender_ids: set, organization_id: str | None, queue_size: int
+    ):
+        # организации, за которые отвечает пользователь: статусы их тендеров и
+        # предложений он видит и через batch_status
+        self.organizations = organizations
+        self.tender_ids = tender_ids
+        self.organization_id = organization_id
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.closed = False
+
+    def matches(self, event: ChangeEvent) -> bool:
+        if event.organization_id not in self.organizations:
+            return False
+        if self.tender_ids and event.tender_id not in self.tender_ids:
+            return False
+        if self.organization_id and event.organization_id != self.organization_id:
+            return False
+        return True
+
+    def put(self, frame: bytes) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self) -> None:
+        """Очередь сбрасывается, клиент получит reset и конец потока"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESET_FRAME)
+        self.queue.put_nowait(None)
+
+
+class EventBroker:
+    """Раздача событий подписчикам воркера. Работает только в event loop"""
+
+    def __init__(self, buffer_size: int, queue_size: int, max_subscribers: int):
+        self.history: deque = deque(maxlen=buffer_size)
+        # в очереди всегда должно остаться место для reset и конца потока
+        self.queue_size = max(queue_size, 2)
+        self.max_subscribers = max_subscribers
+        self.subscribers: set = set()
+        # функции, которым передается каждое событие, а при потере событий - None
+        self.watchers: list = []
+        self.published = 0
+
+    def publish(self, event: ChangeEvent) -> None:
+        self.history.append(event)
+        self.published += 1
+        for watcher in self.watchers:
+            watcher(event)
+        for subscriber in self.subscribers:
+            if subscriber.matches(event):
+                subscriber.put(event.frame)
+
+    def reset(self) -> None:
+        """Соединение с базой терялось: буфер больше не непрерывен"""
+        self.history.clear()
+        for watcher in self.watchers:
+            watcher(None)
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+
+    def subscribe(
+        self,
+        organizations: set,
+        tender_ids: set,
+        organization_id: str | None,
+        last_event_id: str | None,
+    ) -> Subscriber | None:
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(organizations, tender_ids, organization_id, self.queue_size)
+        if last_event_id is not None:
+            self.replay(subscriber, last_event_id)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def replay(self, subscriber: Subscriber, last_event_id: str) -> None:
+        # порядок в буфере - порядок коммитов, а seq выдается раньше коммита,
+        # поэтому продолжаем с позиции события, а не с seq больше заданного
+        position = None
+        for index, event in enumerate(self.history):
+            if str(event.seq) == last_event_id:
+                position = index
+                break
+        if position is None:
+            subscriber.put(RESET_FRAME)
+            return
+        for index in range(position + 1, len(self.history)):
+            event = self.history[index]
+            if subscriber.matches(event):
+                subscriber.put(event.frame)
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "buffered": len(self.history),
+            "published": self.published,
+        }
+
+
+class ChangeListener:
+    """
+    Соединение с LISTEN на основном сервере. Уведомления читаются из event
+    loop через add_reader, поток на ожидание не нужен
+    """
+
+    def __init__(self, engine, broker: EventBroker, reconnect_interval: float):
+        self.engine = engine
+        self.broker = broker
+        self.reconnect_interval = reconnect_interval
+
+    def connect(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        # keepalive: оборванное соединение иначе молча ждало бы вечно
+        cparams.update(keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3)
+        conn = self.engine.dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def drain(self, conn, lost: asyncio.Event) -> None:
+        try:
+            payloads = notifies(self.engine.dialect, conn)
+        except Exception as e:
+            logger.error("change listener lost connection: %s", e)
+            lost.set()
+            return
+        for payload in payloads:
+            try:
+                self.broker.publish(ChangeEvent(json.loads(payload)))
+            except (ValueError, KeyError) as e:
+                logger.error("bad change notification %r: %s", payload, e)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                conn = await run_in_threadpool(self.connect)
+            except Exception as e:
+                logger.error("change listener cannot connect: %s", e)
+                await asyncio.sleep(self.reconnect_interval)
+                continue
+            lost = asyncio.Event()
+            fd = conn.fileno()
+            loop.add_reader(fd, self.drain, conn, lost)
+            try:
+                await lost.wait()
+            finally:
+                loop.remove_reader(fd)
+                conn.close()
+            # пока соединения не было, события терялись
+            self.broker.reset()
+            await asyncio.sleep(self.reconnect_interval)
@@ -0,0 +1,317 @@
+"""
+Фоновые задачи: POST /api/jobs ставит задачу в таблицу job
+(posgresql/migrations/009_jobs.sql), воркеры приложения ее выполняют.
+
+Каждый воркер держит не больше JOBS_CONCURRENCY задач в пуле потоков или
+процессов (JOBS_EXECUTOR = thread | process) и ходит в базу через свой пул
+соединений, поэтому задачи не занимают соединения запросов. Задача
+забирается из очереди с SKIP LOCKED, пока она выполняется, воркер обновляет
+heartbeat_at; задачу, которая не обновлялась JOBS_STALE_AFTER секунд (воркер
+упал), любой воркер завершает с ошибкой. Завершенные задачи удаляются через
+JOBS_TTL секунд.
+
+Задачи над всей базой (JobSpec.admin_only) ставят только пользователи из
+JOBS_ADMINS. Задача - функция из JOBS, она получает JobContext и параметры запроса и
+возвращает результат (dict). context.advance(count) сообщает прогресс и
+заодно проверяет отмену: если задачу отменили, он бросает JobCanceled.
+Задача, которая прогресс не сообщает, отменяется только до начала.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Callable, NamedTuple
+
+from config import setings
+from database.archive import Archiver
+from database.driver import connect_args
+from database.summary import SummaryReconciler
+from sqlalchemy import ARRAY, Uuid, bindparam, create_engine, text
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("uvicorn_main")
+
+# как часто задача пишет прогресс в базу, секунд
+PROGRESS_INTERVAL = 1
+# как часто воркер завершает потерянные и удаляет старые задачи, секунд
+MAINTENANCE_INTERVAL = 60
+
+CLAIM = text("""
+UPDATE job SET status = 'Running', started_at = localtimestamp, heartbeat_at = localtimestamp
+WHERE id = (
+    SELECT id FROM job
+    WHERE status = 'Queued' AND kind = ANY(:kinds)
+    ORDER BY created_at, id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, kind, params
+""")
+
+PROGRESS = text("""
+UPDATE job SET done = :done, total = coalesce(:total, total), heartbeat_at = localtimestamp
+WHERE id = :id
+RETURNING cancel_requested
+""")
+
+HEARTBEAT = text("""
+UPDATE job SET heartbeat_at = localtimestamp WHERE id = ANY(:ids) AND status = 'Running'
+""").bindparams(bindparam("ids", type_=ARRAY(Uuid)))
+
+FINISH = text("""
+UPDATE job SET status = :status, result = CAST(:result AS jsonb), error = :error,
+    finished_at = localtimestamp
+WHERE id = :id AND status = 'Running'
+""")
+
+EXPIRE = text("""
+UPDATE job SET status = 'Failed', error = 'worker lost', finished_at = localtimestamp
+WHERE status = 'Running' AND heartbeat_at < localtimestamp - make_interval(secs => :stale_after)
+""")
+
+PURGE = text("""
+DELETE FROM job WHERE finished_at < localtimestamp - make_interval(secs => :ttl)
+""")
+
+
+class JobCanceled(Exception):
+    pass
+
+
+class JobContext:
+    def __init__(self, engine, job_id: uuid.UUID):
+        self.engine = engine
+        self.job_id = job_id
+        self.done = 0
+        self.total = None
+        self.flushed = 0.0
+
+    def advance(self, count: int = 1, total: int | None = None) -> None:
+        """Прогресс задачи; бросает JobCanceled, если задачу отменили"""
+        self.done += count
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if total is None and now - self.flushed < PROGRESS_INTERVAL:
+            return
+        self.flushed = now
+        with self.engine.begin() as conn:
+            canceled = conn.execute(
+                PROGRESS, {"id": self.job_id, "done": self.done, "total": self.total}
+            ).scalar()
+        if canceled:
+            raise JobCanceled()
+
+
+def archive(context: JobContext) -> dict:
+    """Разовый запуск архивации по политикам ARCHIVE_*"""
+    archiver = Archiver(
+        context.engine,
+        closed_after_days=setings.archive_closed_tenders_after_days,
+        keep_versions=setings.archive_keep_versions,
+        batch_size=setings.archive_batch_size,
+        batch_pause=setings.archive_batch_pause,
+    )
+    if not archiver.enabled:
+        raise ValueError("no archive policy: set ARCHIVE_CLOSED_TENDERS_AFTER_DAYS or ARCHIVE_KEEP_VERSIONS")
+    moved = archiver.run_once(on_batch=context.advance)
+    if moved is None:
+        raise RuntimeError("archiver is already running")
+    return moved
+
+
+def summary_reconcile(context: JobContext) -> dict:
+    """Разовая сверка счетчиков предложений"""
+    reconciler = SummaryReconciler(
+        context.engine,
+        batch_size=setings.summary_reconcile_batch_size,
+        batch_pause=setings.summary_reconcile_batch_pause,
+    )
+    with context.engine.connect() as conn:
+        total = conn.execute(text("SELECT count(*) FROM tender_bid_summary WHERE shard = 0")).scalar()
+    context.advance(0, total)
+    result = reconciler.run_once(on_batch=context.advance)
+    if result is None:
+        raise RuntimeError("reconcile is already running")
+    return result
+
+
+class JobSpec(NamedTuple):
+    function: Callable[..., dict]
+    # имена параметров из тела запроса, которые принимает функция
+    params: tuple = ()
+    # ставить могут только пользователи из JOBS_ADMINS
+    admin_only: bool = False
+
+
+JOBS = {
+    "archive": JobSpec(archive, admin_only=True),
+    "summary_reconcile": JobSpec(summary_reconcile, admin_only=True),
+}
+
+# движок дочернего процесса при JOBS_EXECUTOR=process
+_process_engine = None
+
+
+def run_job(job_id: uuid.UUID, kind: str, params: dict, engine=None) -> dict:
+    """Выполнение задачи в пуле; без engine - в дочернем процессе со своим движком"""
+    global _process_engine
+    if engine is None:
+        if _process_engine is None:
+            _process_engine = create_engine(
+                setings.postgress_conn,
+                pool_size=2,
+                max_overflow=0,
+                connect_args=connect_args(setings.postgress_conn),
+            )
+        engine = _process_engine
+    return JOBS[kind].function(JobContext(engine, job_id), **params)
+
+
+class JobRunner:
+    def __init__(
+        self,
+        engine,
+        concurrency: int,
+        executor: str,
+        poll_interval: float,
+        stale_after: float,
+        ttl: float,
+    ):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.executor = executor
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.ttl = ttl
+        self.pool = None
+        self.loop = None
+        self.wakeup = None
+        self.running: dict = {}
+        self.maintained = 0.0
+        self.finished = {"Succeeded": 0, "Failed": 0, "Canceled": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.concurrency > 0
+
+    def notify(self) -> None:
+        """Новая задача в очереди: не ждать следующего опроса. Вызывается из любого потока"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def claim(self):
+        with self.engine.begin() as conn:
+            return conn.execute(CLAIM, {"kinds": list(JOBS)}).one_or_none()
+
+    def heartbeat(self) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(HEARTBEAT, {"ids": list(self.running)})
+
+    def maintain(self) -> None:
+        with self.engine.begin() as conn:
+            expired = conn.execute(EXPIRE, {"stale_after": self.stale_after}).rowcount
+            purged = conn.execute(PURGE, {"ttl": self.ttl}).rowcount
+        if expired:
+            logger.warning("jobs lost by their workers: %s", expired)
+        if purged:
+            logger.info("finished jobs purged: %s", purged)
+
+    def finish(self, job_id: uuid.UUID, status: str, result: dict | None, error: str | None) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                FINISH,
+                {
+                    "id": job_id,
+                    "status": status,
+                    "result": None if result is None else json.dumps(result, default=str),
+                    "error": error,
+                },
+            )
+
+    async def execute(self, job_id: uuid.UUID, kind: str, params: dict) -> None:
+        # дочернему процессу движок не передать, он создаст свой
+        engine = self.engine if self.executor == "thread" else None
+        result, error = None, None
+        try:
+            result = await self.loop.run_in_executor(
+                self.pool, run_job, job_id, kind, params, engine
+            )
+            status = "Succeeded"
+        except JobCanceled:
+            status = "Canceled"
+        except Exception as e:
+            logger.error("job %s (%s) failed: %s", job_id, kind, e)
+            status, error = "Failed", str(e) or type(e).__name__
+        try:
+            await run_in_threadpool(self.finish, job_id, status, result, error)
+            self.finished[status] += 1
+        except Exception as e:
+            logger.error("job %s status not saved: %s", job_id, e)
+        finally:
+            self.running.pop(job_id, None)
+            self.wakeup.set()
+
+    async def tick(self) -> None:
+        if time.monotonic() - self.maintained >= MAINTENANCE_INTERVAL:
+            await run_in_threadpool(self.maintain)
+            self.maintained = time.monotonic()
+        while len(self.running) < self.concurrency:
+            job = await run_in_threadpool(self.claim)
+            if job is None:
+                break
+            job_id, kind, params = job
+            self.running[job_id] = asyncio.create_task(self.execute(job_id, kind, params))
+        if self.running:
+            await run_in_threadpool(self.heartbeat)
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        if self.executor == "process":
+            self.pool = ProcessPoolExecutor(self.concurrency, mp_context=get_context("spawn"))
+        else:
+            self.pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix="job")
+        try:
+            while True:
+                self.wakeup.clear()
+                try:
+                    await self.tick()
+                except Exception as e:
+                    logger.error("job runner failed: %s", e)
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # прерванные задачи завершит по heartbeat_at другой воркер
+            tasks = list(self.running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.loop = None
+
+    def stats(self) -> dict:
+        return {"running": len(self.running), "finished": dict(self.finished)}
+
+
+job_runner = JobRunner(
+    # задача держит до двух соединений: advisory-блокировку и рабочее
+    create_engine(
+        setings.postgress_conn,
+        pool_size=max(setings.jobs_concurrency, 1),
+        max_overflow=setings.jobs_concurrency + 1,
+        pool_timeout=setings.pool_timeout,
+        connect_args=connect_args(setings.postgress_conn),
+    ),
+    concurrency=setings.jobs_concurrency,
+    executor=setings.jobs_executor,
+    poll_interval=setings.jobs_poll_interval,
+    stale_after=setings.jobs_stale_after,
+    ttl=setings.jobs_ttl,
+)
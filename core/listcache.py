@@ -0,0 +1,142 @@
+"""
+Кэш страниц GET /api/tenders без username.
+
+Ключ - нормализованный фильтр (типы услуг без повторов и по порядку), limit и
+offset, значение - готовое тело ответа. Страница помнит поколения, с которыми
+ее посчитали: общее и по каждому типу услуг фильтра (без фильтра - по всем
+типам). Запись тендера в этом воркере увеличивает поколение своего типа,
+событие из ленты изменений (запись в другом воркере) - общее, потому что типа
+услуг в событии нет. Проверка поколений - сравнение кортежей при чтении,
+сама инвалидация ничего не обходит.
+
+Устаревшая страница - промах. Если задан stale_while_revalidate, она еще
+столько секунд отдается как есть, а пересчитывает ее одна фоновая задача.
+Память ограничена суммой длин тел max_bytes, вытесняются давно не читавшиеся
+страницы.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from config import setings
+from models import TenderServiceType
+
+
+class CachedPage:
+    __slots__ = ("body", "generations", "stored", "stale_since")
+
+    def __init__(self, body: bytes, generations: tuple, stored: float):
+        self.body = body
+        self.generations = generations
+        self.stored = stored
+        self.stale_since = None
+
+
+class ListCache:
+    def __init__(self, max_bytes: int, ttl: float, stale_while_revalidate: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.pages: OrderedDict = OrderedDict()
+        self.size = 0
+        self.generation = 0
+        self.type_generations = {item.value: 0 for item in TenderServiceType}
+        self.refreshing: set = set()
+        # страницы читают и пишут обработчики из пула потоков, поколения - еще
+        # и event loop
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(service_types, limit, offset) -> tuple:
+        types = tuple(sorted({item.value for item in service_types})) if service_types else ()
+        return types, limit, offset
+
+    def generations(self, key: tuple) -> tuple:
+        """Снимать до запроса к базе: запись во время запроса сделает страницу устаревшей"""
+        types = key[0] or self.type_generations
+        return (self.generation, *(self.type_generations[item] for item in types))
+
+    def get(self, key: tuple, now: float | None = None) -> tuple[bytes | None, bool]:
+        """
+        (тело страницы или None при промахе, нужно ли пересчитать ее в фоне).
+        Пересчет поручается одному вызывающему, он обязан вызвать refreshed
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            page = self.pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None, False
+            if page.generations == self.generations(key) and now - page.stored < self.ttl:
+                self.pages.move_to_end(key)
+                self.hits += 1
+                return page.body, False
+            if page.stale_since is None:
+                page.stale_since = min(now, page.stored + self.ttl)
+            if now - page.stale_since >= self.stale_while_revalidate:
+                self.drop(key)
+                self.misses += 1
+                return None, False
+            self.pages.move_to_end(key)
+            self.stale_hits += 1
+            revalidate = key not in self.refreshing
+            self.refreshing.add(key)
+            return page.body, revalidate
+
+    def put(self, key: tuple, body: bytes, generations: tuple, now: float | None = None) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            self.drop(key)
+            self.pages[key] = CachedPage(body, generations, time.monotonic() if now is None else now)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.pages.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def drop(self, key: tuple) -> None:
+        page = self.pages.pop(key, None)
+        if page is not None:
+            self.size -= len(page.body)
+
+    def refreshed(self, key: tuple) -> None:
+        with self.lock:
+            self.refreshing.discard(key)
+
+    def bump(self, service_type: str | None = None) -> None:
+        """Запись тендера: без типа услуг устаревают все страницы"""
+        with self.lock:
+            if service_type is None:
+                self.generation += 1
+            else:
+                self.type_generations[service_type] += 1
+
+    def on_change(self, event) -> None:
+        """Наблюдатель EventBroker; None - события терялись"""
+        if event is None or event.kind == "tender":
+            self.bump()
+
+    def stats(self) -> dict:
+        return {
+            "pages": len(self.pages),
+            "bytes": self.size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+
+list_cache = ListCache(
+    max_bytes=setings.list_cache_max_bytes,
+    ttl=setings.list_cache_ttl,
+    stale_while_revalidate=setings.list_cache_stale_while_revalidate,
+)
@@ -10,11 +10,39 @@ logger = logging.getLogger("uvicorn_main")
 app = create_app()
 logger.info("app created")
 
+
+def run_options() -> dict:
+    """
+    Параметры uvicorn из настроек. В режиме RELOAD поднимается один процесс
+    с отслеживанием файлов, иначе - пул воркеров без reload
+    """
+    host, port = setings.server_adress.split(":")
+    options = dict(
+        host=host,
+        port=int(port),
+        loop=setings.loop,
+        http=setings.http,
+        backlog=setings.backlog,
+        timeout_keep_alive=setings.timeout_keep_alive,
+        timeout_graceful_shutdown=setings.timeout_graceful_shutdown,
+    )
+    if setings.reload:
+        options.update(reload=True)
+    else:
+        options.update(
+            workers=max(setings.workers, 1),
+            limit_max_requests=setings.limit_max_requests,
+        )
+    return options
+
+
 if __name__ == "__main__":
-    logger.info("server running")
-    uvicorn.run(
-        "main:app",
-        host=setings.server_adress.split(":")[0],
-        port=int(setings.server_adress.split(":")[1]),
-        reload=True,
+    options = run_options()
+    logger.info(
+        "server running: workers=%s loop=%s http=%s reload=%s",
+        options.get("workers", 1),
+        options["loop"],
+        options["http"],
+        setings.reload,
     )
+    uvicorn.run("main:app", **options)
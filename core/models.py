@@ -1,15 +1,22 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import List, Optional
+from typing import Annotated, Any, Dict, List, Optional
 
-from pydantic import BaseModel, Field, RootModel, conint, constr
+from pydantic import BaseModel, Field, RootModel, TypeAdapter, WithJsonSchema, conint, constr
+from typing_extensions import TypeAliasType
 
 
-class Username(RootModel[str]):
-    root: str = Field(
-        ..., description="Уникальный slug пользователя.", examples=["test_user"]
-    )
+def named(name: str, base, description: str) -> TypeAliasType:
+    """
+    Ограниченный тип поля вместо отдельного RootModel: валидация без вложенной
+    модели на каждое значение, в OpenAPI - та же схема с тем же именем
+    """
+    schema = dict(TypeAdapter(base).json_schema(), title=name, description=description)
+    return TypeAliasType(name, Annotated[base, WithJsonSchema(schema)])
+
+
+Username = named("Username", str, "Уникальный slug пользователя.")
 
 
 class TenderStatus(str, Enum):
@@ -24,32 +31,19 @@ class TenderServiceType(Enum):
     Manufacture = "Manufacture"
 
 
-class TenderId(RootModel[constr(max_length=100)]):
-    root: constr(max_length=100) = Field(
-        ...,
-        description="Уникальный идентификатор тендера, присвоенный сервером.",
-        examples=["550e8400-e29b-41d4-a716-446655440000"],
-    )
-
+TenderId = named(
+    "TenderId", constr(max_length=100), "Уникальный идентификатор тендера, присвоенный сервером."
+)
 
-class TenderName(RootModel[constr(max_length=100)]):
-    root: constr(max_length=100) = Field(..., description="Полное название тендера")
+TenderName = named("TenderName", constr(max_length=100), "Полное название тендера")
 
+TenderDescription = named("TenderDescription", constr(max_length=500), "Описание тендера")
 
-class TenderDescription(RootModel[constr(max_length=500)]):
-    root: constr(max_length=500) = Field(..., description="Описание тендера")
+TenderVersion = named("TenderVersion", conint(ge=1), "Номер версии посел правок")
 
-
-class TenderVersion(RootModel[conint(ge=1)]):
-    root: conint(ge=1) = Field(..., description="Номер версии посел правок")
-
-
-class OrganizationId(RootModel[constr(max_length=100)]):
-    root: constr(max_length=100) = Field(
-        ...,
-        description="Уникальный идентификатор организации, присвоенный сервером.",
-        examples=["550e8400-e29b-41d4-a716-446655440000"],
-    )
+OrganizationId = named(
+    "OrganizationId", constr(max_length=100), "Уникальный идентификатор организации, присвоенный сервером."
+)
 
 
 class Tender(BaseModel):
@@ -79,24 +73,15 @@ class BidDecision(Enum):
     Rejected = "Rejected"
 
 
-class BidId(RootModel[constr(max_length=100)]):
-    root: constr(max_length=100) = Field(
-        ...,
-        description="Уникальный идентификатор предложения, присвоенный сервером.",
-        examples=["550e8400-e29b-41d4-a716-446655440000"],
-    )
-
-
-class BidName(RootModel[constr(max_length=100)]):
-    root: constr(max_length=100) = Field(..., description="Полное название предложения")
+BidId = named(
+    "BidId", constr(max_length=100), "Уникальный идентификатор предложения, присвоенный сервером."
+)
 
+BidName = named("BidName", constr(max_length=100), "Полное название предложения")
 
-class BidDescription(RootModel[constr(max_length=500)]):
-    root: constr(max_length=500) = Field(..., description="Описание предложения")
+BidDescription = named("BidDescription", constr(max_length=500), "Описание предложения")
 
-
-class BidFeedback(RootModel[constr(max_length=1000)]):
-    root: constr(max_length=1000) = Field(..., description="Отзыв на предложение")
+BidFeedback = named("BidFeedback", constr(max_length=1000), "Отзыв на предложение")
 
 
 class BidAuthorType(Enum):
@@ -104,28 +89,19 @@ class BidAuthorType(Enum):
     User = "User"
 
 
-class BidAuthorId(RootModel[constr(max_length=100)]):
-    root: constr(max_length=100) = Field(
-        ...,
-        description="Уникальный идентификатор автора предложения, присвоенный сервером.",
-        examples=["550e8400-e29b-41d4-a716-446655440000"],
-    )
-
+BidAuthorId = named(
+    "BidAuthorId", constr(max_length=100), "Уникальный идентификатор автора предложения, присвоенный сервером."
+)
 
-class BidVersion(RootModel[conint(ge=1)]):
-    root: conint(ge=1) = Field(..., description="Номер версии посел правок")
-
-
-class BidReviewId(RootModel[constr(max_length=100)]):
-    root: constr(max_length=100) = Field(
-        ...,
-        description="Уникальный идентификатор отзыва, присвоенный сервером.",
-        examples=["550e8400-e29b-41d4-a716-446655440000"],
-    )
+BidVersion = named("BidVersion", conint(ge=1), "Номер версии посел правок")
 
+BidReviewId = named(
+    "BidReviewId", constr(max_length=100), "Уникальный идентификатор отзыва, присвоенный сервером."
+)
 
-class BidReviewDescription(RootModel[constr(max_length=1000)]):
-    root: constr(max_length=1000) = Field(..., description="Описание предложения")
+BidReviewDescription = named(
+    "BidReviewDescription", constr(max_length=1000), "Описание предложения"
+)
 
 
 class BidReview(BaseModel):
@@ -171,6 +147,52 @@ class ServiceType(RootModel[List[TenderServiceType]]):
     root: List[TenderServiceType] = Field(..., examples=[["Construction", "Delivery"]])
 
 
+class BatchGetRequest(BaseModel):
+    ids: List[constr(max_length=100)] = Field(
+        ...,
+        min_length=1,
+        description="Идентификаторы, порядок ответа совпадает с порядком запроса",
+        examples=[["550e8400-e29b-41d4-a716-446655440000"]],
+    )
+
+
+class BatchItemError(str, Enum):
+    NotFound = "NotFound"
+    Forbidden = "Forbidden"
+
+
+class TenderBatchItem(BaseModel):
+    id: constr(max_length=100)
+    tender: Optional[Tender] = None
+    error: Optional[BatchItemError] = None
+
+
+class TendersBatchGetResponse(BaseModel):
+    items: List[TenderBatchItem]
+
+
+class BatchStatusRequest(BaseModel):
+    ids: List[constr(max_length=100)] = Field(..., min_length=1)
+    since: Optional[str] = Field(
+        None,
+        description="Токен since из прошлого ответа: вернутся только статусы, изменившиеся после него",
+    )
+
+
+class TendersBatchStatusResponse(BaseModel):
+    statuses: Dict[str, TenderStatus]
+    errors: Dict[str, BatchItemError]
+    since: Optional[str] = Field(
+        None, description="Передайте в следующий запрос, чтобы получить только изменения"
+    )
+
+
+class TenderSummary(BaseModel):
+    tenderId: TenderId
+    bids: Dict[BidStatus, int] = Field(..., description="Число предложений по статусам")
+    decisions: Dict[BidDecision, int] = Field(..., description="Число предложений по решениям")
+
+
 class TendersNewPostRequest(BaseModel):
     name: TenderName
     description: TenderDescription
@@ -207,6 +229,24 @@ class BidsTenderIdListGetResponse(RootModel[List[Bid]]):
     root: List[Bid]
 
 
+class BidBatchItem(BaseModel):
+    id: constr(max_length=100)
+    bid: Optional[Bid] = None
+    error: Optional[BatchItemError] = None
+
+
+class BidsBatchGetResponse(BaseModel):
+    items: List[BidBatchItem]
+
+
+class BidsBatchStatusResponse(BaseModel):
+    statuses: Dict[str, BidStatus]
+    errors: Dict[str, BatchItemError]
+    since: Optional[str] = Field(
+        None, description="Передайте в следующий запрос, чтобы получить только изменения"
+    )
+
+
 class BidsBidIdEditPatchRequest(BaseModel):
     name: Optional[BidName] = None
     description: Optional[BidDescription] = None
@@ -214,3 +254,39 @@ class BidsBidIdEditPatchRequest(BaseModel):
 
 class BidsTenderIdReviewsGetResponse(RootModel[List[BidReview]]):
     root: List[BidReview]
+
+
+JobId = named("JobId", constr(max_length=100), "Уникальный идентификатор задачи, присвоенный сервером.")
+
+
+class JobKind(str, Enum):
+    archive = "archive"
+    summary_reconcile = "summary_reconcile"
+
+
+class JobStatus(str, Enum):
+    Queued = "Queued"
+    Running = "Running"
+    Succeeded = "Succeeded"
+    Failed = "Failed"
+    Canceled = "Canceled"
+
+
+class Job(BaseModel):
+    id: JobId
+    kind: JobKind
+    status: JobStatus
+    done: int = Field(..., description="Сколько обработано, единицы зависят от задачи")
+    total: Optional[int] = Field(None, description="Сколько всего, если известно заранее")
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancelRequested: bool
+    createdAt: str
+    startedAt: Optional[str] = None
+    finishedAt: Optional[str] = None
+
+
+class JobsPostRequest(BaseModel):
+    kind: JobKind
+    params: Dict[str, Any] = Field({}, description="Параметры задачи")
+    creatorUsername: Username
@@ -0,0 +1,137 @@
+"""
+Ограничение частоты запросов по username внутри процесса.
+
+Для каждой пары (группа маршрутов, username) хранится token bucket. Проверка
+стоит O(1): поиск в словаре, пополнение по прошедшему времени и перенос ключа
+в конец OrderedDict. Давно не использовавшиеся ключи вытесняются с начала
+словаря, поэтому память ограничена max_keys.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from urllib.parse import unquote_plus
+
+from models import ErrorResponse
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    def __init__(self, limit: int, period: float, max_keys: int = 100_000, idle_ttl: float = 600):
+        self.limit = limit
+        self.period = period
+        self.rate = limit / period
+        self.limit_header = str(limit).encode()
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self.buckets: OrderedDict = OrderedDict()
+
+    def check(self, key, now: float | None = None) -> tuple[bool, int, int]:
+        """
+        Списывает токен для key. Возвращает (разрешено, осталось токенов,
+        секунд до полного восстановления или до следующего токена при отказе)
+        """
+        if now is None:
+            now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.limit, now)
+            self.evict(now)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(self.limit, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        if bucket.tokens < 1:
+            return False, 0, math.ceil((1 - bucket.tokens) / self.rate)
+        bucket.tokens -= 1
+        return True, int(bucket.tokens), math.ceil((self.limit - bucket.tokens) / self.rate)
+
+    def evict(self, now: float) -> None:
+        # ключи упорядочены по последнему обращению, устаревшие всегда в начале
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        for _ in range(2):
+            key, bucket = next(iter(self.buckets.items()))
+            if now - bucket.updated < self.idle_ttl:
+                break
+            del self.buckets[key]
+
+
+def query_param(query_string: bytes, name: bytes) -> str | None:
+    for part in query_string.split(b"&"):
+        key, _, value = part.partition(b"=")
+        if key == name:
+            return unquote_plus(value.decode("latin-1"))
+    return None
+
+
+def parse_quota(quota: str) -> tuple[int, float]:
+    """'20/10' - 20 запросов за 10 секунд"""
+    limit, _, period = quota.partition("/")
+    return int(limit), float(period or 1)
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, quotas: dict, max_keys: int, idle_ttl: float):
+        self.app = app
+        self.limiters = {
+            prefix: RateLimiter(*parse_quota(quota), max_keys=max_keys, idle_ttl=idle_ttl)
+            for prefix, quota in quotas.items()
+        }
+        # самый длинный префикс проверяется первым
+        self.prefixes = sorted(self.limiters, key=len, reverse=True)
+
+    def limiter_for(self, path: str):
+        for prefix in self.prefixes:
+            if path.startswith(prefix):
+                return prefix, self.limiters[prefix]
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        group, limiter = self.limiter_for(scope["path"])
+        username = None
+        if limiter is not None and scope["query_string"]:
+            username = query_param(scope["query_string"], b"username")
+        if not username:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, remaining, reset = limiter.check((group, username))
+        headers = [
+            (b"ratelimit-limit", limiter.limit_header),
+            (b"ratelimit-remaining", str(remaining).encode()),
+            (b"ratelimit-reset", str(reset).encode()),
+        ]
+        if not allowed:
+            body = ErrorResponse(reason="rate limit exceeded").model_dump_json().encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": headers
+                    + [
+                        (b"retry-after", str(reset).encode()),
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,32 @@
+"""
+Счетчики воркера в лог: раз в STATS_LOG_INTERVAL секунд одна строка
+"stats {...}" с stats() зарегистрированных источников.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Callable
+
+logger = logging.getLogger("uvicorn_main")
+
+sources: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, stats: Callable[[], dict]) -> None:
+    sources[name] = stats
+
+
+def snapshot() -> dict:
+    return {name: stats() for name, stats in sources.items()}
+
+
+async def log_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        if not sources:
+            continue
+        try:
+            logger.info("stats %s", json.dumps(snapshot(), default=str))
+        except Exception as e:
+            logger.error("stats failed: %s", e)
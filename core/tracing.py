@@ -0,0 +1,447 @@
+"""
+Трассировка запросов в локальный файл JSON lines.
+
+На запрос - корневой span (TracingMiddleware) и дочерние:
+    admission.wait      - очередь контроля допуска;
+    route               - обработчик FastAPI целиком, в атрибутах загрузка пула
+                          потоков в момент входа;
+    request.prepare     - зависимости, валидация запроса и очередь в пул потоков;
+    handler             - тело обработчика;
+    db.checkout         - ожидание соединения из пула SQLAlchemy;
+    db.query            - каждый SQL-запрос (события движка);
+    response.serialize  - валидация и сериализация ответа.
+
+Запрос записывается с вероятностью TRACING_SAMPLE_RATE, а если задан
+TRACING_SLOW_THRESHOLD - еще и любой запрос не быстрее порога: тогда span'ы
+собираются для всех запросов, а в файл попадают медленные. Заголовок
+traceparent (W3C) задает trace id, а флаг sampled в нем - запись.
+
+Строка файла - один запрос в формате OTLP JSON (resourceSpans), как у
+file exporter коллектора OpenTelemetry. Пишет файл отдельный поток через
+очередь, файл ротируется по размеру; при нескольких воркерах у каждого свой
+файл с pid в имени.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import anyio.to_thread
+from config import setings
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# SpanKind из OTLP
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+# длина текста SQL в атрибуте db.statement и текста ошибки в статусе
+MAX_STATEMENT_LENGTH = 2000
+MAX_ERROR_LENGTH = 500
+
+current_trace: ContextVar = ContextVar("current_trace", default=None)
+current_span: ContextVar = ContextVar("current_span", default=None)
+_route_state: ContextVar = ContextVar("route_state", default=None)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start", "end", "attributes", "error")
+
+    def __init__(
+        self, name: str, parent_id: str | None, kind: int, attributes: dict, start: int | None = None
+    ):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.time_ns() if start is None else start
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def finish(self, end: int | None = None) -> None:
+        if self.end is None:
+            self.end = time.time_ns() if end is None else end
+
+    def fail(self, error) -> None:
+        message = str(error)
+        if isinstance(error, BaseException):
+            message = f"{type(error).__name__}: {message}" if message else type(error).__name__
+        self.error = message[:MAX_ERROR_LENGTH]
+
+
+class Trace:
+    def __init__(self, trace_id: str | None = None, sampled: bool = True):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.sampled = sampled
+        # span'ы дописывают и event loop, и поток обработчика; append атомарен
+        self.spans: list = []
+
+    def start(
+        self, name: str, parent=None, kind: int = INTERNAL, start: int | None = None, **attributes
+    ) -> Span:
+        """parent - Span, span id строкой или None (текущий span)"""
+        if parent is None:
+            parent = current_span.get()
+        if isinstance(parent, Span):
+            parent = parent.span_id
+        item = Span(name, parent, kind, attributes, start)
+        self.spans.append(item)
+        return item
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Дочерний span текущего; без трассировки ничего не делает"""
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    item = trace.start(name, **attributes)
+    token = current_span.set(item)
+    try:
+        yield item
+    except BaseException as e:
+        item.fail(e)
+        raise
+    finally:
+        item.finish()
+        current_span.reset(token)
+
+
+def attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str, bool] | None:
+    """(trace id, родительский span id, sampled) из заголовка traceparent"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class Tracer:
+    def __init__(
+        self,
+        sample_rate: float,
+        slow_threshold: float,
+        path: str,
+        max_bytes: int,
+        backups: int,
+        service_name: str = "tender",
+    ):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.resource = {
+            "attributes": [
+                attribute("service.name", service_name),
+                attribute("process.pid", os.getpid()),
+            ]
+        }
+        self.listener = None
+        self.logger = None
+        self.exported = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0
+
+    def begin(self, traceparent: str | None) -> Trace | None:
+        """Трасса запроса или None, если запрос не записывается"""
+        parent = parse_traceparent(traceparent)
+        if parent is not None and parent[2]:
+            return Trace(parent[0])
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_threshold <= 0:
+            return None
+        return Trace(parent[0] if parent else None, sampled)
+
+    def install(self) -> None:
+        """Файл, поток записи и события SQLAlchemy; вызывается в create_app"""
+        if self.listener is not None:
+            return
+        path = self.path
+        if setings.workers > 1 and not setings.reload:
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{os.getpid()}{ext}"
+        handler = RotatingFileHandler(
+            path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8", delay=True
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records = queue.SimpleQueue()
+        self.listener = QueueListener(records, handler)
+        self.listener.start()
+        self.logger = logging.getLogger("tracing")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.handlers = [QueueHandler(records)]
+        if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            return
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+        event.listen(Session, "after_transaction_create", _transaction_created)
+        event.listen(Session, "after_begin", _checked_out)
+        event.listen(Session, "after_transaction_end", _transaction_ended)
+
+    def close(self) -> None:
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def export(self, trace: Trace, duration: float) -> None:
+        if not trace.sampled and duration < self.slow_threshold:
+            return
+        spans = []
+        for item in trace.spans:
+            if item.end is None:
+                continue
+            record = {
+                "traceId": trace.trace_id,
+                "spanId": item.span_id,
+                "name": item.name,
+                "kind": item.kind,
+                "startTimeUnixNano": str(item.start),
+                "endTimeUnixNano": str(item.end),
+                "attributes": [attribute(key, value) for key, value in item.attributes.items()],
+                "status": {} if item.error is None else {"code": 2, "message": item.error},
+            }
+            if item.parent_id is not None:
+                record["parentSpanId"] = item.parent_id
+            spans.append(record)
+        line = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [{"scope": {"name": "tender.tracing"}, "spans": spans}],
+                }
+            ]
+        }
+        self.logger.info(json.dumps(line, separators=(",", ":")))
+        self.exported += 1
+
+    def stats(self) -> dict:
+        return {"exported": self.exported}
+
+
+tracer = Tracer(
+    sample_rate=setings.tracing_sample_rate,
+    slow_threshold=setings.tracing_slow_threshold,
+    path=setings.tracing_file,
+    max_bytes=setings.tracing_file_max_bytes,
+    backups=setings.tracing_file_backups,
+)
+
+
+class TracingMiddleware:
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        trace = self.tracer.begin(traceparent)
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+        parent = parse_traceparent(traceparent)
+        root = trace.start(
+            f"{scope['method']} {scope['path']}",
+            parent=parent[1] if parent else None,
+            kind=SERVER,
+            **{"http.request.method": scope["method"], "url.path": scope["path"]},
+        )
+        trace_token = current_trace.set(trace)
+        span_token = current_span.set(root)
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.response.status_code"] = message["status"]
+                if message["status"] >= 500:
+                    root.error = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        except BaseException as e:
+            root.fail(e)
+            raise
+        finally:
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                root.name = f"{scope['method']} {route.path}"
+                root.attributes["http.route"] = route.path
+            root.finish()
+            current_span.reset(span_token)
+            current_trace.reset(trace_token)
+            self.tracer.export(trace, (root.end - root.start) / 1e9)
+
+
+class RouteState:
+    __slots__ = ("route", "prepare", "handler_end")
+
+    def __init__(self, route: Span, prepare: Span):
+        self.route = route
+        self.prepare = prepare
+        self.handler_end = None
+
+
+def traced_endpoint(call):
+    """
+    Синхронный обработчик остается синхронным: FastAPI по-прежнему вызывает
+    его и валидирует ответ в пуле потоков, span'ы ставятся уже в потоке
+    """
+
+    def endpoint(*args, **kwargs):
+        state = _route_state.get()
+        if state is None:
+            return call(*args, **kwargs)
+        state.prepare.finish()
+        try:
+            with span("handler", parent=state.route):
+                return call(*args, **kwargs)
+        finally:
+            state.handler_end = time.time_ns()
+
+    endpoint.__name__ = getattr(call, "__name__", "endpoint")
+    endpoint.__doc__ = call.__doc__
+    return endpoint
+
+
+class TracedRoute(APIRoute):
+    """route_class роутеров: span'ы подготовки, обработчика и сериализации"""
+
+    def get_route_handler(self):
+        if not tracer.enabled:
+            return super().get_route_handler()
+        call = self.dependant.call
+        if call is not None and not asyncio.iscoroutinefunction(call):
+            self.dependant.call = traced_endpoint(call)
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def traced_handler(request):
+            trace = current_trace.get()
+            if trace is None:
+                return await handler(request)
+            threads = anyio.to_thread.current_default_thread_limiter().statistics()
+            route = trace.start(
+                "route",
+                **{
+                    "http.route": path,
+                    "threadpool.busy": threads.borrowed_tokens,
+                    "threadpool.waiting": threads.tasks_waiting,
+                },
+            )
+            state = RouteState(route, trace.start("request.prepare", parent=route))
+            state_token = _route_state.set(state)
+            span_token = current_span.set(route)
+            try:
+                response = await handler(request)
+                if state.handler_end is not None:
+                    trace.start("response.serialize", parent=route, start=state.handler_end).finish()
+                return response
+            except BaseException as e:
+                route.fail(e)
+                raise
+            finally:
+                state.prepare.finish()
+                route.finish()
+                current_span.reset(span_token)
+                _route_state.reset(state_token)
+
+        return traced_handler
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = current_trace.get()
+    if trace is None:
+        return
+    conn.info.setdefault("trace_spans", []).append(
+        trace.start(
+            "db.query",
+            kind=CLIENT,
+            **{
+                "db.system": "postgresql",
+                "db.statement": statement[:MAX_STATEMENT_LENGTH],
+                "db.executemany": bool(executemany),
+            },
+        )
+    )
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        item = spans.pop()
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            item.attributes["db.rowcount"] = cursor.rowcount
+        item.finish()
+
+
+def _handle_error(context):
+    spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+    if spans:
+        item = spans.pop()
+        item.fail(context.original_exception)
+        item.finish()
+
+
+def _transaction_created(session, transaction):
+    trace = current_trace.get()
+    if trace is not None and transaction.parent is None:
+        session.info["trace_checkout"] = trace.start("db.checkout", kind=CLIENT)
+
+
+def _checked_out(session, transaction, connection):
+    item = session.info.pop("trace_checkout", None)
+    if item is not None:
+        item.finish()
+
+
+def _transaction_ended(session, transaction):
+    # соединение так и не получено: транзакция без запросов (span не нужен)
+    # или откат после ошибки получения, например таймаута пула
+    item = session.info.pop("trace_checkout", None)
+    error = sys.exc_info()[1]
+    if item is not None and error is not None:
+        item.fail(error)
+        item.finish()
@@ -4,13 +4,25 @@ import logging
 from typing import Annotated, Optional, Union
 from uuid import UUID
 
-import database.orm as orm
-from fastapi import APIRouter, FastAPI, Path, Query, Response, status
+import database.coalescer as coalescer
+import database.idempotency as idempotency
+import database.queries as queries
+import database.routing as routing
+from config import setings
+from database.driver import execute_pipelined
+from database.session import read_session, write_session
+from fastapi import APIRouter, Body, Depends, FastAPI, Header, Path, Query, Response, status
 from models import (
+    BatchGetRequest,
+    BatchItemError,
+    BatchStatusRequest,
     Bid,
+    BidBatchItem,
     BidDecision,
     BidFeedback,
     BidId,
+    BidsBatchGetResponse,
+    BidsBatchStatusResponse,
     BidsBidIdEditPatchRequest,
     BidsMyGetResponse,
     BidsNewPostRequest,
@@ -36,8 +48,9 @@ from sqlalchemy import (  # с точки зрения инъекций, это
     update,
 )
 from sqlalchemy.orm import Session
+from tracing import TracedRoute
 
-router = APIRouter(prefix="/api/bids", tags=["bids"])
+router = APIRouter(prefix="/api/bids", tags=["bids"], route_class=TracedRoute)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn_main")
@@ -52,37 +65,85 @@ def get_user_bids(
     username=Annotated[Username, ""],
     limit: Optional[conint(ge=0, le=50)] = 5,
     offset: Optional[conint(ge=0)] = 0,
+    session: Session = Depends(read_session),
 ) -> Union[BidsMyGetResponse, ErrorResponse]:
-    if not username.root:
+    if not username:
         return Response(
             status_code=401, content=ErrorResponse(reason="None username field").model_dump_json()
             )
-    with Session(orm.engine) as session:
+    try:
+        results = session.execute(
+            queries.bids_by_creator(username, limit, offset)
+        ).all()
+        return BidsMyGetResponse(
+            [
+                {
+                    "id": str(row[0]),
+                    "name": row[1],
+                    "description": row[2],
+                    "status": row[3],
+                    "tender_id": str(row[4]),
+                    "creator_username": row[5],
+                    "active_version": row[6],
+                    "created_at": str(row[7]),
+                }
+                for row in results
+            ]
+        )
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=403, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
+
+
+@router.post(
+    "/batch_get",
+    response_model=BidsBatchGetResponse,
+    responses={"400": {"model": ErrorResponse}},
+)
+def batch_get_bids(
+    body: BatchGetRequest,
+    username: Optional[str] = None,
+    session: Session = Depends(read_session),
+) -> Union[BidsBatchGetResponse, ErrorResponse]:
+    """
+    Текущие версии предложений по списку id одним запросом. Отсутствующие и
+    недоступные пользователю предложения отмечаются в ответе, а не ломают весь запрос
+    """
+    if len(body.ids) > setings.batch_get_max_ids:
+        return Response(
+            status_code=400,
+            content=ErrorResponse(
+                reason=f"too many ids, max {setings.batch_get_max_ids}"
+            ).model_dump_json(),
+        )
+    ids = queries.parse_ids(body.ids)
+    valid_ids = list({item for item in ids.values() if item is not None})
+    results = []
+    if valid_ids:
         try:
-            results = (
-                session.query(
-                    orm.Bid.id,
-                    orm.BidVersion.name,
-                    orm.BidVersion.description,
-                    orm.Bid.status,
-                    orm.Bid.tender_id,
-                    orm.Bid.creator_username,
-                    orm.Bid.active_version,
-                    orm.Bid.created_at,
-                )
-                .join(
-                    orm.BidVersion,
-                    (orm.Bid.id == orm.BidVersion.bid_id)
-                    & (orm.BidVersion.version == orm.Bid.active_version),
-                )
-                .where(orm.Bid.creator_username == str(username))
-                .limit(limit)
-                .offset(offset)
-                .all()
+            results = session.execute(queries.bids_by_ids(valid_ids, username)).all()
+        except Exception as e:
+            logger.error(str(e))
+            session.rollback()
+            return Response(
+                status_code=400, content=ErrorResponse(reason=str(e)).model_dump_json()
             )
-            return BidsMyGetResponse(
-                [
-                    {
+    found = {row[0]: row for row in results}
+    items = []
+    for item in body.ids:
+        row = found.get(ids[item])
+        if row is None:
+            items.append(BidBatchItem(id=item, error=BatchItemError.NotFound))
+        elif not row[8]:
+            items.append(BidBatchItem(id=item, error=BatchItemError.Forbidden))
+        else:
+            items.append(
+                BidBatchItem(
+                    id=item,
+                    bid={
                         "id": str(row[0]),
                         "name": row[1],
                         "description": row[2],
@@ -91,16 +152,73 @@ def get_user_bids(
                         "creator_username": row[5],
                         "active_version": row[6],
                         "created_at": str(row[7]),
-                    }
-                    for row in results
-                ]
+                    },
+                )
             )
+    return BidsBatchGetResponse(items=items)
+
+
+@router.post(
+    "/batch_status",
+    response_model=BidsBatchStatusResponse,
+    responses={"400": {"model": ErrorResponse}, "401": {"model": ErrorResponse}},
+)
+def batch_status_bids(
+    body: BatchStatusRequest,
+    username: Optional[str] = None,
+    session: Session = Depends(read_session),
+) -> Union[BidsBatchStatusResponse, ErrorResponse]:
+    """
+    Статусы предложений по списку id одним запросом. С токеном since в ответ попадают
+    только статусы, изменившиеся после него
+    """
+    if not username:
+        return Response(
+            status_code=401, content=ErrorResponse(reason="None username field").model_dump_json()
+        )
+    if len(body.ids) > setings.batch_status_max_ids:
+        return Response(
+            status_code=400,
+            content=ErrorResponse(
+                reason=f"too many ids, max {setings.batch_status_max_ids}"
+            ).model_dump_json(),
+        )
+    try:
+        since = queries.parse_since(body.since)
+    except ValueError:
+        return Response(
+            status_code=400, content=ErrorResponse(reason="invalid since token").model_dump_json()
+        )
+    ids = queries.parse_ids(body.ids)
+    valid_ids = list({item for item in ids.values() if item is not None})
+    results = []
+    if valid_ids:
+        try:
+            results = session.execute(
+                queries.bid_statuses(valid_ids, username, since)
+            ).all()
         except Exception as e:
             logger.error(str(e))
             session.rollback()
             return Response(
-                status_code=403, content=ErrorResponse(reason=str(e)).model_dump_json()
+                status_code=400, content=ErrorResponse(reason=str(e)).model_dump_json()
             )
+    found = {row[0]: row for row in results}
+    statuses, errors = {}, {}
+    for item in body.ids:
+        row = found.get(ids[item])
+        if row is None:
+            errors[item] = BatchItemError.NotFound
+        elif not row[2]:
+            errors[item] = BatchItemError.Forbidden
+        elif since is None or row[3]:
+            statuses[item] = row[1]
+    token = body.since
+    if results:
+        # данные с реплики могут отставать еще на допустимую задержку
+        grace = setings.status_since_grace + routing.max_staleness()
+        token = queries.since_token(results[0][4], grace)
+    return BidsBatchStatusResponse(statuses=statuses, errors=errors, since=token)
 
 
 @router.post(
@@ -110,55 +228,89 @@ def get_user_bids(
         "401": {"model": ErrorResponse},
         "403": {"model": ErrorResponse},
         "404": {"model": ErrorResponse},
+        "503": {"model": ErrorResponse},
+        "504": {"model": ErrorResponse},
     },
 )
-def create_bid(body: BidsNewPostRequest) -> Union[Bid, ErrorResponse]:
+def create_bid(
+    body: BidsNewPostRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    session: Session = Depends(write_session),
+) -> Union[Bid, ErrorResponse]:
     bid_dict = body.model_dump(mode="json", by_alias=True)
-    dict_for_version = {
-        item: bid_dict[item] for item in bid_dict if item in ["name", "description"]
-    }
-    dict_for_bid = {
-        item: bid_dict[item]
-        for item in bid_dict
-        if item in ["organization_id", "creator_username", "status", "tender_id"]
-    }
-    stmt_tender = (
-        insert(orm.Bid)
-        .returning(orm.Bid.id, orm.Bid.created_at, orm.Bid.active_version)
-        .values(**dict_for_bid)
+    dict_for_bid, dict_for_version = queries.split_fields(
+        bid_dict, queries.BID_FIELDS, queries.BID_VERSION_FIELDS
     )
-    with Session(orm.engine) as session:
+    # ответ по ключу сохраняется в транзакции записи, поэтому мимо пачки
+    if setings.bid_group_commit and not idempotency_key:
         try:
-            result = session.execute(stmt_tender)
-            res = result.fetchone()
-            res_id, res_time, res_vers = [str(item) for item in res]
-            stmt_version = insert(orm.BidVersion).values(
-                **dict_for_version, bid_id=res_id
-            )
-            session.execute(stmt_version)
-            logger.debug(
-                dict(
-                    **dict_for_bid,
-                    **dict_for_version,
-                    **{
-                        "id": res_id,
-                        "created_at": res_time,
-                        "active_version": res_vers,
-                    },
-                )
+            res = coalescer.bid_writer.submit(dict_for_bid, dict_for_version)
+        except coalescer.BidNotWritten as e:
+            # строка точно не записана, повтор не создаст дубль
+            return Response(
+                status_code=503, content=ErrorResponse(reason=str(e)).model_dump_json()
             )
-            tender = Bid(
-                **dict_for_bid,
-                **dict_for_version,
-                **{"id": res_id, "created_at": res_time, "active_version": res_vers},
+        except coalescer.BidOutcomeUnknown as e:
+            # строка могла быть записана: ее видно в /api/bids/my
+            return Response(
+                status_code=504, content=ErrorResponse(reason=str(e)).model_dump_json()
             )
         except Exception as e:
             logger.error(str(e))
-            session.rollback()
             return Response(
                 status_code=403, content=ErrorResponse(reason=str(e)).model_dump_json()
             )
-        session.commit()
+        res_id, res_time, res_vers = [str(item) for item in res]
+        routing.mark_write(body.creatorUsername)
+        return Bid(
+            **dict_for_bid,
+            **dict_for_version,
+            **{"id": res_id, "created_at": res_time, "active_version": res_vers},
+        )
+    stmt_tender = queries.create_bid(dict_for_bid, dict_for_version)
+    username = body.creatorUsername
+    try:
+        if idempotency_key:
+            replay = idempotency.begin(
+                session, "bids/new", username, idempotency_key, body, setings.idempotency_ttl
+            )
+            if replay is not None:
+                return replay
+        res = session.execute(stmt_tender).one()
+        res_id, res_time, res_vers = [str(item) for item in res]
+        logger.debug(
+            dict(
+                **dict_for_bid,
+                **dict_for_version,
+                **{
+                    "id": res_id,
+                    "created_at": res_time,
+                    "active_version": res_vers,
+                },
+            )
+        )
+        tender = Bid(
+            **dict_for_bid,
+            **dict_for_version,
+            **{"id": res_id, "created_at": res_time, "active_version": res_vers},
+        )
+        if idempotency_key:
+            idempotency.save(
+                session,
+                "bids/new",
+                username,
+                idempotency_key,
+                body,
+                200,
+                tender.model_dump_json(by_alias=True),
+            )
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=403, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
+    routing.mark_write(username)
     return tender
 
 
@@ -174,88 +326,53 @@ def create_bid(body: BidsNewPostRequest) -> Union[Bid, ErrorResponse]:
 )
 def edit_bid(
     bid_id: BidId = Path(..., alias="bidId"),
-    username: Username = ...,
+    username: Username = Body(...),
     body: BidsBidIdEditPatchRequest = ...,
+    session: Session = Depends(write_session),
 ) -> Union[Bid, ErrorResponse]:
-    with Session(orm.engine) as session:
-        try:
-            if not username.root:
-                    return Response(
-                    status_code=401,
-                    content=ErrorResponse(
-                        reason="None username"
-                    ).model_dump_json(),
-                    )
-            user_check = session.query(orm.Bid.creator_username).where(orm.Bid.id == bid_id.root).one()[0]
-            if not user_check:
+    try:
+        if not username:
                 return Response(
-                    status_code=404,
-                    content=ErrorResponse(
-                        reason="page not found"
-                    ).model_dump_json(),
-                    )
-            if user_check != username.root:
-                return Response(
-                    status_code=403,
-                    content=ErrorResponse(
-                        reason="invalid authentication"
-                    ).model_dump_json(),
-                    )
-            old_bid = (
-                    session.query(
-                        orm.Bid.id,
-                        orm.BidVersion.name,
-                        orm.BidVersion.description,
-                        orm.Bid.status,
-                        orm.Bid.tender_id,
-                        orm.Bid.creator_username,
-                        orm.Bid.active_version,
-                        orm.Bid.created_at,
-                    )
-                    .join(
-                        orm.BidVersion,
-                        (orm.Bid.id == orm.BidVersion.bid_id)
-                        & (orm.BidVersion.version == orm.Bid.active_version),
-                    )
-                    .where(orm.Bid.id == bid_id.root)
-                    .one()
+                status_code=401,
+                content=ErrorResponse(
+                    reason="None username"
+                ).model_dump_json(),
                 )
-            if not body.name:
-                body.name = old_bid[1] #плохо читаемый код, но быстрый в разработке тестового задания.
-            if not body.description:
-                body.description = old_bid[2]
-            max_version = session.query(func.max(orm.BidVersion.version)).where(orm.BidVersion.bid_id == bid_id.root).one()[0]
-            new_version = orm.BidVersion(bid_id = old_bid[0], 
-                                        version = max_version + 1, 
-                                        name = body.name.root,
-                                        description = body.description.root
-                                        )
-            # max_version = session.query(func.max(orm.BidVersion.version)).where(orm.BidVersion.bid_id == bid_id.root)
-            # stmnt_new_version = insert(orm.BidVersion).values(new_version)
-            session.add(new_version)
-            session.query(orm.Bid).filter(orm.Bid.id == bid_id.root).update({"active_version": max_version + 1})
-            resp = Bid(**{
-                        "id": str(old_bid[0]),
-                        "name": body.name,
-                        "description": body.description,
-                        "status": old_bid[3],
-                        "tender_id": str(old_bid[4]),
-                        "creator_username": old_bid[5],
-                        "active_version": max_version + 1,
-                        "created_at": str(old_bid[7]),
-                    })
-            session.commit()
-            return resp
-        except Exception as e:
-            logger.error(str(e))
-            session.rollback()
+        row = session.execute(
+            queries.edit_bid(bid_id, username, body.name or None, body.description or None)
+        ).one_or_none()
+        if row is None:
             return Response(
-                status_code=500, content=ErrorResponse(reason='Server error').model_dump_json()
-            )
-
-        
-    
-        
+                status_code=404,
+                content=ErrorResponse(
+                    reason="page not found"
+                ).model_dump_json(),
+                )
+        if not row[8]:
+            return Response(
+                status_code=403,
+                content=ErrorResponse(
+                    reason="invalid authentication"
+                ).model_dump_json(),
+                )
+        resp = Bid(**{
+                    "id": str(row[0]),
+                    "name": row[1],
+                    "description": row[2],
+                    "status": row[3],
+                    "tender_id": str(row[4]),
+                    "creator_username": row[5],
+                    "active_version": row[6],
+                    "created_at": str(row[7]),
+                })
+        routing.mark_write(username)
+        return resp
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=500, content=ErrorResponse(reason='Server error').model_dump_json()
+        )
 
 
 # @router.put(
@@ -293,50 +410,32 @@ def rollback_bid(
     bid_id: BidId = Path(..., alias="bidId"),
     version: conint(ge=1) = ...,
     username=Annotated[Username, None],
+    session: Session = Depends(write_session),
 ) -> Union[Bid, ErrorResponse]:
-    with Session(orm.engine) as session:
-        try:
-            new_bid = (
-                        session.query(
-                            orm.Bid.id,
-                            orm.BidVersion.name,
-                            orm.BidVersion.description,
-                            orm.Bid.status,
-                            orm.Bid.tender_id,
-                            orm.Bid.creator_username,
-                            orm.Bid.active_version,
-                            orm.Bid.created_at,
-                        )
-                        .join(
-                            orm.BidVersion,
-                            (orm.Bid.id == orm.BidVersion.bid_id)
-                        )
-                        .where(orm.Bid.id == bid_id.root and orm.BidVersion.version == version and orm.Bid.creator_username == username.root)
-                        .first())
-            if not new_bid:
-                    return Response(status_code=401, content=ErrorResponse(reason='No Bid for query').model_dump_json())
-            session.query(orm.Bid).filter(orm.Bid.id == bid_id.root).update({"active_version": version})
-            resp = Bid(**{
-                            "id": str(new_bid[0]),
-                            "name": new_bid[1],
-                            "description": new_bid[2],
-                            "status": new_bid[3],
-                            "tender_id": str(new_bid[4]),
-                            "creator_username": new_bid[5],
-                            "active_version": version,
-                            "created_at": str(new_bid[7]),
-                        })
-            return resp
-        except Exception as e:
-            logger.error(str(e))
-            session.rollback()
-            return Response(
-                status_code=500, content=ErrorResponse(reason='Server error').model_dump_json()
-            )
-        
-
-
-        
+    try:
+        new_bid = session.execute(
+            queries.rollback_bid(bid_id, version, username)
+        ).first()
+        if not new_bid:
+                return Response(status_code=401, content=ErrorResponse(reason='No Bid for query').model_dump_json())
+        resp = Bid(**{
+                        "id": str(new_bid[0]),
+                        "name": new_bid[1],
+                        "description": new_bid[2],
+                        "status": new_bid[3],
+                        "tender_id": str(new_bid[4]),
+                        "creator_username": new_bid[5],
+                        "active_version": version,
+                        "created_at": str(new_bid[7]),
+                    })
+        routing.mark_write(username)
+        return resp
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=500, content=ErrorResponse(reason='Server error').model_dump_json()
+        )
 
 
 @router.get(
@@ -351,35 +450,30 @@ def rollback_bid(
 def get_bid_status(
     username=Annotated[Username, ""],
     bid_id: BidId = Path(..., alias="bidId"),
+    session: Session = Depends(read_session),
 ) -> Union[BidStatus, ErrorResponse]:
-    with Session(orm.engine) as session:
-        try:
-            if not username or (
-                username
-                != session.query(orm.Bid.creator_username)
-                .where(orm.Bid.id == bid_id.root)
-                .one()[0]
-            ):
-                return Response(
-                status_code=403,
-                content=ErrorResponse(
-                    reason="invalid authentication"
-                ).model_dump_json(),
-                )
-            result = (
-                session.query(
-                    orm.Bid.status
-                )
-                .where(orm.Bid.id == bid_id.root)
-                .one()[0]
-            )
-            return result
-        except Exception as e:
-            logger.error(str(e))
-            session.rollback()
+    try:
+        creator, current = execute_pipelined(
+            session, queries.bid_creator(bid_id), queries.bid_status(bid_id)
+        )
+        if not username or (
+            username
+            != creator.one()[0]
+        ):
             return Response(
-                status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+            status_code=403,
+            content=ErrorResponse(
+                reason="invalid authentication"
+            ).model_dump_json(),
             )
+        result = current.one()[0]
+        return result
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
 
 
 @router.put(
@@ -395,7 +489,7 @@ def get_bid_status(
 def update_bid_status(
     bid_id: BidId = Path(..., alias="bidId"),
     status: BidStatus = ...,
-    username: Username = ...,
+    username: Username = Body(...),
 ) -> Union[Bid, ErrorResponse]:
     """
     Изменение статуса предложения
@@ -416,7 +510,7 @@ def update_bid_status(
 def submit_bid_decision(
     bid_id: BidId = Path(..., alias="bidId"),
     decision: BidDecision = ...,
-    username: Username = ...,
+    username: Username = Body(...),
 ) -> Union[Bid, ErrorResponse]:
     """
     Отправка решения по предложению
@@ -439,63 +533,45 @@ def get_bids_for_tender(
     username=Annotated[Username, ""],
     limit: Optional[conint(ge=0, le=50)] = 5,
     offset: Optional[conint(ge=0)] = 0,
+    session: Session = Depends(read_session),
 ) -> Union[BidsTenderIdListGetResponse, ErrorResponse]:
-    with Session(orm.engine) as session:
-        try:
-            if not username or (
-                username
-                != session.query(orm.Tender.creator_username)
-                .where(orm.Tender.id == tender_id.root)
-                .one()[0]
-            ):
-                return Response(
-                status_code=403,
-                content=ErrorResponse(
-                    reason="invalid authentication"
-                ).model_dump_json(),
-                )
-            results = (
-                session.query(
-                    orm.Bid.id,
-                    orm.BidVersion.name,
-                    orm.BidVersion.description,
-                    orm.Bid.status,
-                    orm.Bid.tender_id,
-                    orm.Bid.creator_username,
-                    orm.Bid.active_version,
-                    orm.Bid.created_at,
-                )
-                .join(
-                    orm.BidVersion,
-                    (orm.Bid.id == orm.BidVersion.bid_id)
-                    & (orm.BidVersion.version == orm.Bid.active_version),
-                )
-                .where(orm.Bid.tender_id == tender_id.root)
-                .limit(limit)
-                .offset(offset)
-                .all()
-            )
-            return BidsTenderIdListGetResponse(
-                [
-                    {
-                        "id": str(row[0]),
-                        "name": row[1],
-                        "description": row[2],
-                        "status": row[3],
-                        "tender_id": str(row[4]),
-                        "creator_username": row[5],
-                        "active_version": row[6],
-                        "created_at": str(row[7]),
-                    }
-                    for row in results
-                ]
-            )
-        except Exception as e:
-            logger.error(str(e))
-            session.rollback()
+    try:
+        creator, results = execute_pipelined(
+            session,
+            queries.tender_creator(tender_id),
+            queries.bids_for_tender(tender_id, limit, offset),
+        )
+        if not username or (
+            username
+            != creator.one()[0]
+        ):
             return Response(
-                status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+            status_code=403,
+            content=ErrorResponse(
+                reason="invalid authentication"
+            ).model_dump_json(),
             )
+        return BidsTenderIdListGetResponse(
+            [
+                {
+                    "id": str(row[0]),
+                    "name": row[1],
+                    "description": row[2],
+                    "status": row[3],
+                    "tender_id": str(row[4]),
+                    "creator_username": row[5],
+                    "active_version": row[6],
+                    "created_at": str(row[7]),
+                }
+                for row in results
+            ]
+        )
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
 
 
 # @router.get(
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import uuid
+from typing import List, Optional
+
+import database.queries as queries
+import database.routing as routing
+from config import setings
+from database.driver import execute_pipelined
+from fastapi import APIRouter, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from models import ErrorResponse
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from tracing import TracedRoute
+
+router = APIRouter(prefix="/api", tags=["events"], route_class=TracedRoute)
+
+logger = logging.getLogger("uvicorn_main")
+
+
+def organizations_of(username: str) -> set | None:
+    """Организации, за которые отвечает username; None - такого пользователя нет"""
+    # своя короткая сессия: поток событий не должен держать соединение
+    with Session(routing.read_engine(username)) as session:
+        employee, organizations = execute_pipelined(
+            session, queries.employee_id(username), queries.memberships(username)
+        )
+        if employee.one_or_none() is None:
+            return None
+        return {str(row[0]) for row in organizations}
+
+
+async def event_stream(broker, subscriber):
+    try:
+        yield f"retry: {setings.events_retry_ms}\n\n".encode()
+        while True:
+            try:
+                frame = await asyncio.wait_for(
+                    subscriber.queue.get(), setings.events_heartbeat_interval
+                )
+            except asyncio.TimeoutError:
+                # комментарий SSE не дает прокси закрыть молчащее соединение
+                yield b": ping\n\n"
+                continue
+            if frame is None:
+                return
+            yield frame
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+@router.get(
+    "/events",
+    responses={
+        "200": {"content": {"text/event-stream": {}}},
+        "400": {"model": ErrorResponse},
+        "401": {"model": ErrorResponse},
+        "403": {"model": ErrorResponse},
+        "503": {"model": ErrorResponse},
+    },
+)
+async def get_events(
+    request: Request,
+    username: Optional[str] = None,
+    tender_id: Optional[List[str]] = Query(None, alias="tenderId"),
+    organization_id: Optional[str] = Query(None, alias="organizationId"),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Поток изменений статуса и версии тендеров и предложений (server-sent
+    events), можно ограничить списком тендеров или организацией. Приходят
+    только события организаций, за которые отвечает username, - те же, что
+    видны ему через batch_status; членство читается при подписке. Событие
+    reset означает, что часть изменений могла быть пропущена и статусы нужно
+    перечитать через batch_status
+    """
+    if not username:
+        return Response(
+            status_code=401, content=ErrorResponse(reason="None username field").model_dump_json()
+        )
+    try:
+        tender_ids = {str(uuid.UUID(item)) for item in tender_id or []}
+        if organization_id:
+            organization_id = str(uuid.UUID(organization_id))
+    except ValueError:
+        return Response(
+            status_code=400, content=ErrorResponse(reason="invalid id in filter").model_dump_json()
+        )
+    try:
+        organizations = await run_in_threadpool(organizations_of, username)
+    except Exception as e:
+        logger.error(str(e))
+        return Response(
+            status_code=500, content=ErrorResponse(reason="Server error").model_dump_json()
+        )
+    if organizations is None:
+        return Response(
+            status_code=401, content=ErrorResponse(reason="invalid authentication").model_dump_json()
+        )
+    if organization_id and organization_id not in organizations:
+        return Response(
+            status_code=403, content=ErrorResponse(reason="invalid authentication").model_dump_json()
+        )
+    broker = request.app.state.events
+    subscriber = broker.subscribe(organizations, tender_ids, organization_id, last_event_id)
+    if subscriber is None:
+        return Response(
+            status_code=503, content=ErrorResponse(reason="too many subscribers").model_dump_json()
+        )
+    return StreamingResponse(
+        event_stream(broker, subscriber),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
@@ -0,0 +1,169 @@
+import logging
+from typing import Union
+
+import database.queries as queries
+from config import setings
+from database.session import write_session
+from fastapi import APIRouter, BackgroundTasks, Depends, Path, Response
+from jobs import JOBS, job_runner
+from models import ErrorResponse, Job, JobId, JobsPostRequest, JobStatus, Username
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from tracing import TracedRoute
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"], route_class=TracedRoute)
+
+logger = logging.getLogger("uvicorn_main")
+
+
+def job_response(row) -> Job:
+    return Job(
+        id=str(row[0]),
+        kind=row[1],
+        status=row[2],
+        done=row[3],
+        total=row[4],
+        result=row[5],
+        error=row[6],
+        cancelRequested=row[7],
+        createdAt=str(row[8]),
+        startedAt=None if row[9] is None else str(row[9]),
+        finishedAt=None if row[10] is None else str(row[10]),
+    )
+
+
+def find_job(session, job_id, username):
+    """Строка задачи или ответ 404/403"""
+    job_uuid = queries.parse_ids([job_id])[job_id]
+    row = None
+    if job_uuid is not None:
+        row = session.execute(queries.job_by_id(job_uuid)).one_or_none()
+    if row is None:
+        return None, Response(
+            status_code=404, content=ErrorResponse(reason="page not found").model_dump_json()
+        )
+    if row[11] != username:
+        return None, Response(
+            status_code=403, content=ErrorResponse(reason="invalid authentication").model_dump_json()
+        )
+    return row, None
+
+
+@router.post(
+    "",
+    response_model=Job,
+    responses={
+        "400": {"model": ErrorResponse},
+        "401": {"model": ErrorResponse},
+        "403": {"model": ErrorResponse},
+        "500": {"model": ErrorResponse},
+    },
+)
+def create_job(
+    body: JobsPostRequest,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(write_session),
+) -> Union[Job, ErrorResponse]:
+    """
+    Постановка фоновой задачи в очередь. Прогресс - GET /api/jobs/{jobId}.
+    Задачи над всей базой ставят только пользователи из JOBS_ADMINS
+    """
+    spec = JOBS[body.kind.value]
+    if spec.admin_only and body.creatorUsername not in setings.jobs_admins:
+        return Response(
+            status_code=403, content=ErrorResponse(reason="invalid authentication").model_dump_json()
+        )
+    unknown = set(body.params) - set(spec.params)
+    if unknown:
+        return Response(
+            status_code=400,
+            content=ErrorResponse(
+                reason=f"unknown params for {body.kind.value}: {', '.join(sorted(unknown))}"
+            ).model_dump_json(),
+        )
+    try:
+        row = session.execute(
+            queries.create_job(body.kind.value, body.params, body.creatorUsername)
+        ).one()
+    except IntegrityError:
+        session.rollback()
+        return Response(
+            status_code=401, content=ErrorResponse(reason="invalid authentication").model_dump_json()
+        )
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=500, content=ErrorResponse(reason="Server error").model_dump_json()
+        )
+    # после коммита, иначе воркер задачу еще не увидит
+    background_tasks.add_task(job_runner.notify)
+    return job_response(row)
+
+
+@router.get(
+    "/{jobId}",
+    response_model=Job,
+    responses={
+        "401": {"model": ErrorResponse},
+        "403": {"model": ErrorResponse},
+        "404": {"model": ErrorResponse},
+        "500": {"model": ErrorResponse},
+    },
+)
+def get_job(
+    username: Username,
+    job_id: JobId = Path(..., alias="jobId"),
+    session: Session = Depends(write_session),
+) -> Union[Job, ErrorResponse]:
+    """
+    Статус и прогресс задачи. Видна только автору
+    """
+    # прогресс пишется на основной сервер, реплика может отставать
+    try:
+        row, error = find_job(session, job_id, username)
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=500, content=ErrorResponse(reason="Server error").model_dump_json()
+        )
+    return error or job_response(row)
+
+
+@router.post(
+    "/{jobId}/cancel",
+    response_model=Job,
+    responses={
+        "401": {"model": ErrorResponse},
+        "403": {"model": ErrorResponse},
+        "404": {"model": ErrorResponse},
+        "500": {"model": ErrorResponse},
+    },
+)
+def cancel_job(
+    username: Username,
+    job_id: JobId = Path(..., alias="jobId"),
+    session: Session = Depends(write_session),
+) -> Union[Job, ErrorResponse]:
+    """
+    Отмена задачи. Задача из очереди отменяется сразу, выполняющаяся - на
+    ближайшей отметке прогресса; завершенная возвращается как есть
+    """
+    try:
+        row, error = find_job(session, job_id, username)
+        if error is not None:
+            return error
+        if row[2] in (JobStatus.Queued.value, JobStatus.Running.value):
+            # задача могла завершиться между чтением и отменой
+            row = (
+                session.execute(queries.cancel_job(row[0])).one_or_none()
+                or session.execute(queries.job_by_id(row[0])).one()
+            )
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=500, content=ErrorResponse(reason="Server error").model_dump_json()
+        )
+    return job_response(row)
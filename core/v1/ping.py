@@ -1,10 +1,15 @@
 import logging
 
-from fastapi import APIRouter, Response, status
+from fastapi import APIRouter, Request, Response, status
+from tracing import TracedRoute
 
-router = APIRouter(prefix="/api", tags=["ping"])
+router = APIRouter(prefix="/api", tags=["ping"], route_class=TracedRoute)
 
 
 @router.get("/ping", response_model=str)
-def check_server() -> str:
+def check_server(request: Request) -> str:
+    if not request.app.state.ready:
+        return Response(content="warming up", status_code=503)
+    if request.app.state.admission.saturated:
+        return Response(content="overloaded", status_code=503)
     return Response(content="ok", status_code=200)
@@ -1,11 +1,20 @@
 from __future__ import annotations
 
 import logging
-from typing import Optional, Union, Annotated
+from typing import List, Optional, Union, Annotated
 
-import database.orm as orm
-from fastapi import APIRouter, FastAPI, Path, Query, Response, status
+import database.idempotency as idempotency
+import database.queries as queries
+import database.routing as routing
+from config import setings
+from database.driver import execute_pipelined
+from database.session import read_session, write_session
+from fastapi import APIRouter, BackgroundTasks, Body, Depends, FastAPI, Header, Path, Query, Response, status
+from listcache import list_cache
 from models import (
+    BatchGetRequest,
+    BatchItemError,
+    BatchStatusRequest,
     Bid,
     BidDecision,
     BidFeedback,
@@ -17,13 +26,17 @@ from models import (
     BidsTenderIdListGetResponse,
     BidsTenderIdReviewsGetResponse,
     ErrorResponse,
-    ServiceType,
     Tender,
     TenderId,
+    TenderBatchItem,
+    TendersBatchGetResponse,
+    TendersBatchStatusResponse,
     TendersGetResponse,
     TendersMyGetResponse,
     TendersNewPostRequest,
     TenderStatus,
+    TenderServiceType,
+    TenderSummary,
     TendersTenderIdEditPatchRequest,
     Username,
 )
@@ -34,8 +47,9 @@ from sqlalchemy import (  # с точки зрения инъекций, это
     update,
 )
 from sqlalchemy.orm import Session
+from tracing import TracedRoute
 
-router = APIRouter(prefix="/api/tenders", tags=["tenders"])
+router = APIRouter(prefix="/api/tenders", tags=["tenders"], route_class=TracedRoute)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn_main")
@@ -47,79 +61,71 @@ logger = logging.getLogger("uvicorn_main")
     responses={"400": {"model": ErrorResponse}},
 )
 def get_tenders(
-    service_type=Annotated[Optional[ServiceType], None],
+    background_tasks: BackgroundTasks,
+    service_type: Annotated[Optional[List[TenderServiceType]], Query()] = None,
+    username: Optional[Username] = None,
     limit: Optional[conint(ge=0, le=50)] = 5,
     offset: Optional[conint(ge=0)] = 0,
+    session: Session = Depends(read_session),
 ) -> Union[TendersGetResponse, ErrorResponse]:
-    with Session(orm.engine) as session:
-        try:
-            if str(service_type):
-                results = (
-                    session.query(
-                        orm.Tender.id,
-                        orm.TenderVersion.name,
-                        orm.TenderVersion.description,
-                        orm.Tender.status,
-                        orm.TenderVersion.service_type,
-                        orm.Tender.organization_id,
-                        orm.Tender.creator_username,
-                        orm.Tender.active_version,
-                        orm.Tender.created_at,
-                    )
-                    .join(
-                        orm.TenderVersion,
-                        (orm.Tender.id == orm.TenderVersion.tender_id)
-                        & (orm.TenderVersion.version == orm.Tender.active_version),
-                    )
-                    .where(orm.TenderVersion.service_type == str(service_type))
-                    .limit(limit)
-                    .offset(offset)
-                    .all()
-                    )
-            else:
-                results = (
-                    session.query(
-                        orm.Tender.id,
-                        orm.TenderVersion.name,
-                        orm.TenderVersion.description,
-                        orm.Tender.status,
-                        orm.TenderVersion.service_type,
-                        orm.Tender.organization_id,
-                        orm.Tender.creator_username,
-                        orm.Tender.active_version,
-                        orm.Tender.created_at,
-                    )
-                    .join(
-                        orm.TenderVersion,
-                        (orm.Tender.id == orm.TenderVersion.tender_id)
-                        & (orm.TenderVersion.version == orm.Tender.active_version),
-                    )
-                    .limit(limit)
-                    .offset(offset)
-                    .all()
-                    )
-            return TendersGetResponse(
-                [
-                    {
-                        "id": str(row[0]),
-                        "name": row[1],
-                        "description": row[2],
-                        "status": str(row[3]),
-                        "service_type": str(row[4]),
-                        "organization_id": str(row[5]),
-                        "creator_username": row[6],
-                        "active_version": row[7],
-                        "created_at": str(row[8]),
-                    }
-                    for row in results
-                ]
-            )
-        except Exception as e:
-            logger.error(str(e))
-            session.rollback()
-            return Response(
-                status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
-            )
+    # страницы без username одинаковы для всех и отдаются из кэша
+    cached = list_cache.enabled and not username
+    if cached:
+        key = list_cache.key(service_type, limit, offset)
+        body, revalidate = list_cache.get(key)
+        if body is not None:
+            if revalidate:
+                background_tasks.add_task(refresh_tenders_page, key, service_type, limit, offset)
+            return Response(content=body, media_type="application/json")
+        generations = list_cache.generations(key)
+    try:
+        page = tenders_page(session, service_type, username, limit, offset)
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
+    if cached:
+        body = page.model_dump_json(by_alias=True).encode()
+        list_cache.put(key, body, generations)
+        return Response(content=body, media_type="application/json")
+    return page
+
+
+def tenders_page(session, service_type, username, limit, offset) -> TendersGetResponse:
+    results = session.execute(
+        queries.tenders_page(service_type, username, limit, offset)
+    ).all()
+    return TendersGetResponse(
+        [
+            {
+                "id": str(row[0]),
+                "name": row[1],
+                "description": row[2],
+                "status": str(row[3]),
+                "service_type": str(row[4]),
+                "organization_id": str(row[5]),
+                "creator_username": row[6],
+                "active_version": row[7],
+                "created_at": str(row[8]),
+            }
+            for row in results
+        ]
+    )
+
+
+def refresh_tenders_page(key, service_type, limit, offset) -> None:
+    """Пересчет устаревшей страницы кэша после ответа"""
+    try:
+        generations = list_cache.generations(key)
+        with Session(routing.read_engine(None)) as session:
+            page = tenders_page(session, service_type, None, limit, offset)
+        list_cache.put(key, page.model_dump_json(by_alias=True).encode(), generations)
+    except Exception as e:
+        logger.error(str(e))
+    finally:
+        list_cache.refreshed(key)
 
 
 @router.get(
@@ -131,38 +137,85 @@ def get_user_tenders(
     username=Annotated[Username, ""],
     limit: Optional[conint(ge=0, le=50)] = 5,
     offset: Optional[conint(ge=0)] = 0,
+    session: Session = Depends(read_session),
 ) -> Union[TendersMyGetResponse, ErrorResponse]:
     if not username:
             return Response(
                 status_code=401, content=ErrorResponse(reason="None username field").model_dump_json()
             )
-    with Session(orm.engine) as session:
+    try:
+        results = session.execute(
+            queries.tenders_by_creator(username, limit, offset)
+        ).all()
+        return TendersMyGetResponse(
+            [
+                {
+                    "id": str(row[0]),
+                    "name": row[1],
+                    "description": row[2],
+                    "status": row[3],
+                    "service_type": row[4],
+                    "organization_id": str(row[5]),
+                    "creator_username": row[6],
+                    "active_version": row[7],
+                    "created_at": str(row[8]),
+                }
+                for row in results
+            ]
+        )
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
+
+@router.post(
+    "/batch_get",
+    response_model=TendersBatchGetResponse,
+    responses={"400": {"model": ErrorResponse}},
+)
+def batch_get_tenders(
+    body: BatchGetRequest,
+    username: Optional[str] = None,
+    session: Session = Depends(read_session),
+) -> Union[TendersBatchGetResponse, ErrorResponse]:
+    """
+    Текущие версии тендеров по списку id одним запросом. Отсутствующие и
+    недоступные пользователю тендеры отмечаются в ответе, а не ломают весь запрос
+    """
+    if len(body.ids) > setings.batch_get_max_ids:
+        return Response(
+            status_code=400,
+            content=ErrorResponse(
+                reason=f"too many ids, max {setings.batch_get_max_ids}"
+            ).model_dump_json(),
+        )
+    ids = queries.parse_ids(body.ids)
+    valid_ids = list({item for item in ids.values() if item is not None})
+    results = []
+    if valid_ids:
         try:
-            results = (
-                session.query(
-                    orm.Tender.id,
-                    orm.TenderVersion.name,
-                    orm.TenderVersion.description,
-                    orm.Tender.status,
-                    orm.TenderVersion.service_type,
-                    orm.Tender.organization_id,
-                    orm.Tender.creator_username,
-                    orm.Tender.active_version,
-                    orm.Tender.created_at,
-                )
-                .join(
-                    orm.TenderVersion,
-                    (orm.Tender.id == orm.TenderVersion.tender_id)
-                    & (orm.TenderVersion.version == orm.Tender.active_version),
-                )
-                .where(orm.Tender.creator_username == str(username))
-                .limit(limit)
-                .offset(offset)
-                .all()
+            results = session.execute(queries.tenders_by_ids(valid_ids, username)).all()
+        except Exception as e:
+            logger.error(str(e))
+            session.rollback()
+            return Response(
+                status_code=400, content=ErrorResponse(reason=str(e)).model_dump_json()
             )
-            return TendersMyGetResponse(
-                [
-                    {
+    found = {row[0]: row for row in results}
+    items = []
+    for item in body.ids:
+        row = found.get(ids[item])
+        if row is None:
+            items.append(TenderBatchItem(id=item, error=BatchItemError.NotFound))
+        elif not row[9]:
+            items.append(TenderBatchItem(id=item, error=BatchItemError.Forbidden))
+        else:
+            items.append(
+                TenderBatchItem(
+                    id=item,
+                    tender={
                         "id": str(row[0]),
                         "name": row[1],
                         "description": row[2],
@@ -172,16 +225,74 @@ def get_user_tenders(
                         "creator_username": row[6],
                         "active_version": row[7],
                         "created_at": str(row[8]),
-                    }
-                    for row in results
-                ]
+                    },
+                )
             )
+    return TendersBatchGetResponse(items=items)
+
+
+@router.post(
+    "/batch_status",
+    response_model=TendersBatchStatusResponse,
+    responses={"400": {"model": ErrorResponse}, "401": {"model": ErrorResponse}},
+)
+def batch_status_tenders(
+    body: BatchStatusRequest,
+    username: Optional[str] = None,
+    session: Session = Depends(read_session),
+) -> Union[TendersBatchStatusResponse, ErrorResponse]:
+    """
+    Статусы тендеров по списку id одним запросом. С токеном since в ответ попадают
+    только статусы, изменившиеся после него
+    """
+    if not username:
+        return Response(
+            status_code=401, content=ErrorResponse(reason="None username field").model_dump_json()
+        )
+    if len(body.ids) > setings.batch_status_max_ids:
+        return Response(
+            status_code=400,
+            content=ErrorResponse(
+                reason=f"too many ids, max {setings.batch_status_max_ids}"
+            ).model_dump_json(),
+        )
+    try:
+        since = queries.parse_since(body.since)
+    except ValueError:
+        return Response(
+            status_code=400, content=ErrorResponse(reason="invalid since token").model_dump_json()
+        )
+    ids = queries.parse_ids(body.ids)
+    valid_ids = list({item for item in ids.values() if item is not None})
+    results = []
+    if valid_ids:
+        try:
+            results = session.execute(
+                queries.tender_statuses(valid_ids, username, since)
+            ).all()
         except Exception as e:
             logger.error(str(e))
             session.rollback()
             return Response(
-                status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+                status_code=400, content=ErrorResponse(reason=str(e)).model_dump_json()
             )
+    found = {row[0]: row for row in results}
+    statuses, errors = {}, {}
+    for item in body.ids:
+        row = found.get(ids[item])
+        if row is None:
+            errors[item] = BatchItemError.NotFound
+        elif not row[2]:
+            errors[item] = BatchItemError.Forbidden
+        elif since is None or row[3]:
+            statuses[item] = row[1]
+    token = body.since
+    if results:
+        # данные с реплики могут отставать еще на допустимую задержку
+        grace = setings.status_since_grace + routing.max_staleness()
+        token = queries.since_token(results[0][4], grace)
+    return TendersBatchStatusResponse(statuses=statuses, errors=errors, since=token)
+
 
 @router.post(
     "/new",
@@ -189,45 +300,53 @@ def get_user_tenders(
     responses={"401": {"model": ErrorResponse}, "403": {"model": ErrorResponse}},
 )
 def create_tender(
-    response: Response, body: TendersNewPostRequest
+    response: Response,
+    background_tasks: BackgroundTasks,
+    body: TendersNewPostRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    session: Session = Depends(write_session),
 ) -> Union[Tender, ErrorResponse]:
     tender_dict = body.model_dump(mode="json", by_alias=True)
-    dict_for_version = {
-        item: tender_dict[item]
-        for item in tender_dict
-        if item in ["name", "description", "service_type"]
-    }
-    dict_for_tender = {
-        item: tender_dict[item]
-        for item in tender_dict
-        if item in ["organization_id", "creator_username", "status"]
-    }
-    stmt_tender = (
-        insert(orm.Tender)
-        .returning(orm.Tender.id, orm.Tender.created_at, orm.Tender.active_version)
-        .values(**dict_for_tender)
+    dict_for_tender, dict_for_version = queries.split_fields(
+        tender_dict, queries.TENDER_FIELDS, queries.TENDER_VERSION_FIELDS
     )
-    with Session(orm.engine) as session:
-        try:
-            result = session.execute(stmt_tender)
-            res = result.fetchone()
-            res_id, res_time, res_vers = [str(item) for item in res]
-            stmt_version = insert(orm.TenderVersion).values(
-                **dict_for_version, tender_id=res_id
+    stmt_tender = queries.create_tender(dict_for_tender, dict_for_version)
+    username = body.creatorUsername
+    try:
+        if idempotency_key:
+            replay = idempotency.begin(
+                session, "tenders/new", username, idempotency_key, body, setings.idempotency_ttl
             )
-            session.execute(stmt_version)
-            tender = Tender(
-                **dict_for_tender,
-                **dict_for_version,
-                **{"id": res_id, "created_at": res_time, "active_version": res_vers},
+            if replay is not None:
+                return replay
+        res = session.execute(stmt_tender).one()
+        res_id, res_time, res_vers = [str(item) for item in res]
+        tender = Tender(
+            **dict_for_tender,
+            **dict_for_version,
+            **{"id": res_id, "created_at": res_time, "active_version": res_vers},
+        )
+        if idempotency_key:
+            idempotency.save(
+                session,
+                "tenders/new",
+                username,
+                idempotency_key,
+                body,
+                200,
+                tender.model_dump_json(by_alias=True),
             )
-        except Exception as e:
-            logger.error(str(e))
-            session.rollback()
-            return Response(
-                status_code=403, content=ErrorResponse(reason=str(e)).model_dump_json()
-            )
-        session.commit()
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=403, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
+    routing.mark_write(username)
+    if body.status == TenderStatus.Published:
+        # после коммита, иначе параллельный промах закэширует страницу без
+        # этого тендера с новым поколением; созданные в кэшируемых списках не видны
+        background_tasks.add_task(list_cache.bump, body.serviceType.value)
     return tender
 
 
@@ -243,7 +362,7 @@ def create_tender(
 )
 def edit_tender(
     tender_id: TenderId = Path(..., alias="tenderId"),
-    username: Username = ...,
+    username: Username = Body(...),
     body: TendersTenderIdEditPatchRequest = ...,
 ) -> Union[Tender, ErrorResponse]:
     """
@@ -265,7 +384,7 @@ def edit_tender(
 def rollback_tender(
     tender_id: TenderId = Path(..., alias="tenderId"),
     version: conint(ge=1) = ...,
-    username: Username = ...,
+    username: Username = Body(...),
 ) -> Union[Tender, ErrorResponse]:
     """
     Откат версии тендера
@@ -273,6 +392,54 @@ def rollback_tender(
     pass
 
 
+@router.get(
+    "/{tenderId}/summary",
+    response_model=TenderSummary,
+    responses={
+        "401": {"model": ErrorResponse},
+        "403": {"model": ErrorResponse},
+        "404": {"model": ErrorResponse},
+    },
+)
+def get_tender_summary(
+    tender_id: TenderId = Path(..., alias="tenderId"),
+    username: Optional[Username] = None,
+    session: Session = Depends(read_session),
+) -> Union[TenderSummary, ErrorResponse]:
+    """
+    Число предложений тендера по статусам и решениям
+    """
+    tender_uuid = queries.parse_ids([tender_id])[tender_id]
+    try:
+        row = None
+        if tender_uuid is not None:
+            row = session.execute(queries.tender_summary(tender_uuid, username)).one_or_none()
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
+    if row is None:
+        return Response(
+            status_code=404, content=ErrorResponse(reason="page not found").model_dump_json()
+        )
+    created, published, canceled, approved, rejected, visible = row
+    if not visible:
+        return Response(
+            status_code=403, content=ErrorResponse(reason="invalid authentication").model_dump_json()
+        )
+    return TenderSummary(
+        tenderId=tender_id,
+        bids={
+            BidStatus.Created: created,
+            BidStatus.Published: published,
+            BidStatus.Canceled: canceled,
+        },
+        decisions={BidDecision.Approved: approved, BidDecision.Rejected: rejected},
+    )
+
+
 @router.get(
     "/{tenderId}/status",
     response_model=TenderStatus,
@@ -284,36 +451,31 @@ def rollback_tender(
 )
 def get_tender_status(
     tender_id: TenderId = Path(..., alias="tenderId"),
-    username = Annotated[Optional[Username], None]
+    username = Annotated[Optional[Username], None],
+    session: Session = Depends(read_session),
 ) -> Union[TenderStatus, ErrorResponse]:
-       with Session(orm.engine) as session:
-        try:
-            if not username or (
-                username
-                != session.query(orm.Tender.creator_username)
-                .where(orm.Tender.id == tender_id.root)
-                .one()[0]
-            ):
-                return Response(
-                status_code=403,
-                content=ErrorResponse(
-                    reason="invalid authentication"
-                ).model_dump_json(),
-                )
-            result = (
-                session.query(
-                    orm.Tender.status
-                )
-                .where(orm.Tender.id == tender_id.root)
-                .one()[0]
-            )
-            return result
-        except Exception as e:
-            logger.error(str(e))
-            session.rollback()
+    try:
+        creator, current = execute_pipelined(
+            session, queries.tender_creator(tender_id), queries.tender_status(tender_id)
+        )
+        if not username or (
+            username
+            != creator.one()[0]
+        ):
             return Response(
-                status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+            status_code=403,
+            content=ErrorResponse(
+                reason="invalid authentication"
+            ).model_dump_json(),
             )
+        result = current.one()[0]
+        return result
+    except Exception as e:
+        logger.error(str(e))
+        session.rollback()
+        return Response(
+            status_code=401, content=ErrorResponse(reason=str(e)).model_dump_json()
+        )
 
 
 
@@ -330,7 +492,7 @@ def get_tender_status(
 def update_tender_status(
     tender_id: TenderId = Path(..., alias="tenderId"),
     status: TenderStatus = ...,
-    username: Username = ...,
+    username: Username = Body(...),
 ) -> Union[Tender, ErrorResponse]:
     """
     Изменение статуса тендера
@@ -0,0 +1,200 @@
+"""
+Прогрев воркера перед приемом трафика: открываем минимальный набор соединений
+пула, выполняем горячие запросы core/v1 в откатываемой транзакции READ ONLY
+(так они попадают в кэш компиляции, а запись не выполняется) и прогоняем
+модели ответов.
+Пока прогрев не завершен, /api/ping отвечает 503.
+"""
+
+import asyncio
+import logging
+import uuid
+
+import database.orm as orm
+import database.queries as queries
+import database.routing as routing
+from config import setings
+from fastapi import FastAPI
+from models import (
+    Bid,
+    BidsMyGetResponse,
+    BidsNewPostRequest,
+    BidsTenderIdListGetResponse,
+    ErrorResponse,
+    Tender,
+    TendersGetResponse,
+    TendersMyGetResponse,
+    TendersNewPostRequest,
+    TenderServiceType,
+)
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("uvicorn_main")
+
+SAMPLE_ID = str(uuid.UUID(int=0))
+SAMPLE_TIME = "2006-01-02 15:04:05"
+
+
+def open_pool_connections(engine, size: int) -> int:
+    """
+    Берем из пула size соединений одновременно, чтобы пул создал их все,
+    и возвращаем обратно. Первое соединение заодно инициализирует диалект
+    """
+    size = min(size, engine.pool.size())
+    connections = []
+    try:
+        for _ in range(size):
+            conn = engine.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
+
+
+def sample_bodies():
+    tender_body = TendersNewPostRequest(
+        name="warmup",
+        description="warmup",
+        serviceType="Construction",
+        status="Created",
+        organizationId=SAMPLE_ID,
+        creatorUsername="warmup",
+    ).model_dump(mode="json", by_alias=True)
+    bid_body = BidsNewPostRequest(
+        name="warmup",
+        description="warmup",
+        status="Created",
+        tenderId=SAMPLE_ID,
+        organizationId=SAMPLE_ID,
+        creatorUsername="warmup",
+    ).model_dump(mode="json", by_alias=True)
+    return tender_body, bid_body
+
+
+def hot_statements() -> list:
+    """Те же формы запросов, что выполняют обработчики core/v1"""
+    tender_body, bid_body = sample_bodies()
+    dict_for_tender, dict_for_tender_version = queries.split_fields(
+        tender_body, queries.TENDER_FIELDS, queries.TENDER_VERSION_FIELDS
+    )
+    dict_for_bid, dict_for_bid_version = queries.split_fields(
+        bid_body, queries.BID_FIELDS, queries.BID_VERSION_FIELDS
+    )
+    return [
+        queries.tenders_page(None, None, 5, 0),
+        queries.tenders_page([TenderServiceType.Construction], None, 5, 0),
+        queries.tenders_page(None, "warmup", 5, 0),
+        queries.tenders_page([TenderServiceType.Construction], "warmup", 5, 0),
+        queries.tenders_by_creator("warmup", 5, 0),
+        queries.tenders_by_ids([uuid.UUID(SAMPLE_ID)], "warmup"),
+        queries.tender_statuses([uuid.UUID(SAMPLE_ID)], "warmup", None),
+        queries.tender_summary(uuid.UUID(SAMPLE_ID), "warmup"),
+        queries.tender_creator(SAMPLE_ID),
+        queries.tender_status(SAMPLE_ID),
+        queries.create_tender(dict_for_tender, dict_for_tender_version),
+        queries.bids_by_creator("warmup", 5, 0),
+        queries.bids_for_tender(SAMPLE_ID, 5, 0),
+        queries.bids_by_ids([uuid.UUID(SAMPLE_ID)], "warmup"),
+        queries.bid_statuses([uuid.UUID(SAMPLE_ID)], "warmup", None),
+        queries.bid_creator(SAMPLE_ID),
+        queries.bid_status(SAMPLE_ID),
+        queries.create_bid(dict_for_bid, dict_for_bid_version),
+        queries.edit_bid(SAMPLE_ID, "warmup", "warmup", None),
+        queries.rollback_bid(SAMPLE_ID, 1, "warmup"),
+    ]
+
+
+def precompile(engine, statements: list) -> int:
+    """
+    Выполняет каждый запрос один раз в транзакции READ ONLY, которая затем
+    откатывается. Connection.execute кладет скомпилированный запрос в кэш
+    движка до отправки в базу, а запись база отклоняет еще до выполнения:
+    строки не меняются, триггеры и последовательности не трогаются. Запрос,
+    упавший по любой другой причине, пропускается и готовности не мешает
+    """
+    compiled = 0
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+            for stmt in statements:
+                savepoint = conn.begin_nested()
+                try:
+                    conn.execute(stmt).close()
+                    compiled += 1
+                except DBAPIError as e:
+                    # запись в транзакции READ ONLY, пустые id
+                    logger.debug("warm-up statement rejected: %s", e.orig)
+                    compiled += 1
+                except Exception as e:
+                    logger.warning("warm-up statement skipped: %s", e)
+                finally:
+                    savepoint.rollback()
+        finally:
+            transaction.rollback()
+    return compiled
+
+
+def prime_models() -> None:
+    tender = {
+        "id": SAMPLE_ID,
+        "name": "warmup",
+        "description": "warmup",
+        "status": "Created",
+        "service_type": "Construction",
+        "organization_id": SAMPLE_ID,
+        "creator_username": "warmup",
+        "active_version": 1,
+        "created_at": SAMPLE_TIME,
+    }
+    bid = {
+        "id": SAMPLE_ID,
+        "name": "warmup",
+        "description": "warmup",
+        "status": "Created",
+        "tender_id": SAMPLE_ID,
+        "creator_username": "warmup",
+        "active_version": 1,
+        "created_at": SAMPLE_TIME,
+    }
+    Tender(**tender).model_dump_json()
+    Bid(**bid).model_dump_json()
+    for response in (TendersGetResponse, TendersMyGetResponse):
+        response([tender]).model_dump_json()
+    for response in (BidsMyGetResponse, BidsTenderIdListGetResponse):
+        response([bid]).model_dump_json()
+    ErrorResponse(reason="warmup").model_dump_json()
+    sample_bodies()
+
+
+def warm_up_sync() -> None:
+    opened = open_pool_connections(orm.engine, setings.pool_min_size)
+    compiled = precompile(orm.engine, hot_statements())
+    # недоступная реплика не мешает готовности: роутер сам уведет чтение с нее
+    for engine in routing.replica_engines:
+        try:
+            opened += open_pool_connections(engine, setings.pool_min_size)
+            precompile(engine, hot_statements())
+        except Exception as e:
+            logger.error("replica %s warm-up failed: %s", engine.url.host, e)
+    prime_models()
+    logger.info("warm-up done: %s connections, %s statements", opened, compiled)
+
+
+async def warm_up(app: FastAPI) -> None:
+    """Прогревает воркер, повторяя попытки, пока база недоступна"""
+    if not setings.warmup:
+        app.state.ready = True
+        return
+    while True:
+        try:
+            await run_in_threadpool(warm_up_sync)
+            break
+        except Exception as e:
+            logger.error("warm-up failed: %s", e)
+            await asyncio.sleep(setings.warmup_retry_interval)
+    app.state.ready = True
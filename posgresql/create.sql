@@ -1,7 +1,29 @@
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
+-- 48 бит миллисекунд поверх случайного uuid4, биты версии 0100 -> 0111
+CREATE OR REPLACE FUNCTION uuid_generate_v7()
+RETURNS uuid AS $$
+    SELECT encode(
+        set_bit(
+            set_bit(
+                overlay(
+                    uuid_send(uuid_generate_v4())
+                    PLACING substring(
+                        int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3
+                    )
+                    FROM 1 FOR 6
+                ),
+                52, 1
+            ),
+            53, 1
+        ),
+        'hex'
+    )::uuid;
+$$
+LANGUAGE sql VOLATILE;
+
 CREATE TABLE employee (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
     username VARCHAR(50) UNIQUE NOT NULL,
     first_name VARCHAR(50),
     last_name VARCHAR(50),
@@ -17,7 +39,7 @@ CREATE TYPE organization_type AS ENUM (
 );
 
 CREATE TABLE organization (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
     name VARCHAR(100) NOT NULL,
     description TEXT,
     type organization_type,
@@ -26,7 +48,7 @@ CREATE TABLE organization (
 );
 
 CREATE TABLE organization_responsible (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
     organization_id UUID REFERENCES organization(id) ON DELETE CASCADE,
     user_id UUID REFERENCES employee(id) ON DELETE CASCADE
 );
@@ -38,12 +60,13 @@ CREATE TYPE tender_status AS ENUM (
 );
 
 CREATE TABLE tender (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
     active_version int CHECK (active_version >= 1) DEFAULT 1,
     status tender_status NOT NULL,
     organization_id UUID REFERENCES organization(id) ON DELETE CASCADE,
     creator_username VARCHAR(50) REFERENCES employee(username),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
 CREATE TABLE tender_version (
@@ -67,14 +90,15 @@ CREATE TYPE bid_desision AS ENUM (
 );
 
 CREATE TABLE bid (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
     status bid_status DEFAULT 'Created',
     desision bid_desision,
     active_version int CHECK (active_version >= 1) DEFAULT 1,
     tender_id UUID REFERENCES tender(id) ON DELETE CASCADE,
     organization_id UUID REFERENCES organization(id),
-    creatorUsername VARCHAR(50) REFERENCES employee(username),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    creator_username VARCHAR(50) REFERENCES employee(username),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
 
 CREATE TABLE bid_version (
@@ -85,18 +109,25 @@ CREATE TABLE bid_version (
     UNIQUE (bid_id, version)
 );
 
+CREATE INDEX organization_responsible_organization_user_idx
+    ON organization_responsible (organization_id, user_id);
+
 CREATE OR REPLACE FUNCTION check_employee_in_organization()
 RETURNS TRIGGER AS $$
-DECLARE
-    employee_count INT;
 BEGIN
-    SELECT COUNT(*)
-    INTO employee_count
-    FROM organization_responsible
-    WHERE organization_id = NEW.organization_id
-      AND user_id = (SELECT id FROM employee WHERE username = NEW.creator_username);
+    IF TG_OP = 'UPDATE'
+       AND NEW.organization_id IS NOT DISTINCT FROM OLD.organization_id
+       AND NEW.creator_username IS NOT DISTINCT FROM OLD.creator_username THEN
+        RETURN NEW;
+    END IF;
 
-    IF employee_count = 0 THEN
+    IF NOT EXISTS (
+        SELECT 1
+        FROM organization_responsible r
+        JOIN employee e ON e.id = r.user_id
+        WHERE r.organization_id = NEW.organization_id
+          AND e.username = NEW.creator_username
+    ) THEN
         RAISE EXCEPTION 'Employee % is not a member of the organization %', NEW.creator_username, NEW.organization_id;
     END IF;
 
@@ -106,12 +137,261 @@ $$
 LANGUAGE plpgsql;
 
 CREATE TRIGGER validate_tender_organization
-BEFORE INSERT OR UPDATE ON tender
+BEFORE INSERT OR UPDATE OF organization_id, creator_username ON tender
 FOR EACH ROW
 EXECUTE FUNCTION check_employee_in_organization();
 
 CREATE TRIGGER validate_bid_organization
-BEFORE INSERT OR UPDATE ON bid
+BEFORE INSERT OR UPDATE OF organization_id, creator_username ON bid
 FOR EACH ROW
 EXECUTE FUNCTION check_employee_in_organization();
 
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status IS DISTINCT FROM OLD.status
+       OR NEW.active_version IS DISTINCT FROM OLD.active_version THEN
+        NEW.updated_at = clock_timestamp()::timestamp;
+    END IF;
+    RETURN NEW;
+END;
+$$
+LANGUAGE plpgsql;
+
+CREATE TRIGGER touch_tender_updated_at
+BEFORE UPDATE OF status, active_version ON tender
+FOR EACH ROW
+EXECUTE FUNCTION touch_updated_at();
+
+CREATE TRIGGER touch_bid_updated_at
+BEFORE UPDATE OF status, active_version ON bid
+FOR EACH ROW
+EXECUTE FUNCTION touch_updated_at();
+
+CREATE SEQUENCE change_event_seq;
+
+CREATE OR REPLACE FUNCTION notify_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    row_json JSONB;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.status IS NOT DISTINCT FROM OLD.status
+       AND NEW.active_version IS NOT DISTINCT FROM OLD.active_version THEN
+        RETURN NULL;
+    END IF;
+    row_json := to_jsonb(NEW);
+    PERFORM pg_notify('tender_changes', json_build_object(
+        'seq', nextval('change_event_seq'),
+        'kind', TG_ARGV[0],
+        'id', NEW.id,
+        'tender_id', COALESCE(row_json->>'tender_id', row_json->>'id'),
+        'organization_id', NEW.organization_id,
+        'status', NEW.status,
+        'version', NEW.active_version
+    )::text);
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+
+CREATE TRIGGER notify_tender_change
+AFTER INSERT OR UPDATE OF status, active_version ON tender
+FOR EACH ROW
+EXECUTE FUNCTION notify_change('tender');
+
+CREATE TRIGGER notify_bid_change
+AFTER INSERT OR UPDATE OF status, active_version ON bid
+FOR EACH ROW
+EXECUTE FUNCTION notify_change('bid');
+
+CREATE TABLE idempotency_key (
+    scope VARCHAR(50) NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code SMALLINT NOT NULL,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, username, key)
+);
+
+CREATE INDEX idempotency_key_created_at_idx ON idempotency_key (created_at);
+
+CREATE TABLE tender_archive (
+    id UUID NOT NULL,
+    active_version int,
+    status tender_status NOT NULL,
+    organization_id UUID,
+    creator_username VARCHAR(50),
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE tender_version_archive (
+    tender_id UUID NOT NULL,
+    version int,
+    name VARCHAR(100),
+    description VARCHAR(500),
+    service_type VARCHAR(20) NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE bid_archive (
+    id UUID NOT NULL,
+    status bid_status,
+    desision bid_desision,
+    active_version int,
+    tender_id UUID,
+    organization_id UUID,
+    creator_username VARCHAR(50),
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE bid_version_archive (
+    bid_id UUID NOT NULL,
+    version int,
+    name VARCHAR(100),
+    description VARCHAR(500),
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX tender_archive_id_idx ON tender_archive (id);
+CREATE INDEX tender_version_archive_tender_id_idx ON tender_version_archive (tender_id, version);
+CREATE INDEX bid_archive_tender_id_idx ON bid_archive (tender_id);
+CREATE INDEX bid_version_archive_bid_id_idx ON bid_version_archive (bid_id, version);
+
+CREATE INDEX tender_closed_updated_at_idx ON tender (updated_at) WHERE status = 'Closed';
+
+CREATE INDEX tender_published_created_at_idx
+    ON tender (created_at, id) WHERE status = 'Published';
+CREATE INDEX tender_unpublished_organization_idx
+    ON tender (organization_id, created_at, id) WHERE status <> 'Published';
+
+CREATE TABLE tender_bid_summary (
+    tender_id UUID REFERENCES tender(id) ON DELETE CASCADE,
+    shard smallint NOT NULL DEFAULT 0,
+    created int NOT NULL DEFAULT 0,
+    published int NOT NULL DEFAULT 0,
+    canceled int NOT NULL DEFAULT 0,
+    approved int NOT NULL DEFAULT 0,
+    rejected int NOT NULL DEFAULT 0,
+    CONSTRAINT tender_bid_summary_pkey PRIMARY KEY (tender_id, shard)
+);
+
+CREATE OR REPLACE FUNCTION create_tender_bid_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO tender_bid_summary (tender_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_bid()
+RETURNS TRIGGER AS $$
+DECLARE
+    -- строка счетчиков своего соединения: параллельные транзакции пишут в
+    -- разные строки тендера, а одна транзакция (пачка группового коммита)
+    -- держит не больше одной строки на тендер
+    bid_shard smallint := pg_backend_pid() % 16;
+    -- строка OLD еще считается в живом тендере
+    old_counted boolean := true;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.status IS NOT DISTINCT FROM OLD.status
+       AND NEW.desision IS NOT DISTINCT FROM OLD.desision
+       AND NEW.tender_id IS NOT DISTINCT FROM OLD.tender_id THEN
+        RETURN NULL;
+    END IF;
+
+    -- тендер удаляется вместе с предложениями, его счетчики не нужны;
+    -- смена статуса внутри тендера (частый случай) тендер не проверяет
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.tender_id IS NULL THEN
+        -- предложение без тендера не считается
+        old_counted := false;
+    ELSIF TG_OP = 'DELETE' THEN
+        old_counted := EXISTS (SELECT 1 FROM tender WHERE id = OLD.tender_id);
+    ELSIF TG_OP = 'UPDATE' AND NEW.tender_id IS DISTINCT FROM OLD.tender_id THEN
+        old_counted := EXISTS (SELECT 1 FROM tender WHERE id = OLD.tender_id);
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') AND old_counted THEN
+        INSERT INTO tender_bid_summary AS s
+            (tender_id, shard, created, published, canceled, approved, rejected)
+        VALUES (
+            OLD.tender_id,
+            bid_shard,
+            -(OLD.status IS NOT DISTINCT FROM 'Created')::int,
+            -(OLD.status IS NOT DISTINCT FROM 'Published')::int,
+            -(OLD.status IS NOT DISTINCT FROM 'Canceled')::int,
+            -(OLD.desision IS NOT DISTINCT FROM 'Approved')::int,
+            -(OLD.desision IS NOT DISTINCT FROM 'Rejected')::int
+        )
+        ON CONFLICT (tender_id, shard) DO UPDATE SET
+            created = s.created + EXCLUDED.created,
+            published = s.published + EXCLUDED.published,
+            canceled = s.canceled + EXCLUDED.canceled,
+            approved = s.approved + EXCLUDED.approved,
+            rejected = s.rejected + EXCLUDED.rejected;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.tender_id IS NOT NULL THEN
+        INSERT INTO tender_bid_summary AS s
+            (tender_id, shard, created, published, canceled, approved, rejected)
+        VALUES (
+            NEW.tender_id,
+            bid_shard,
+            (NEW.status IS NOT DISTINCT FROM 'Created')::int,
+            (NEW.status IS NOT DISTINCT FROM 'Published')::int,
+            (NEW.status IS NOT DISTINCT FROM 'Canceled')::int,
+            (NEW.desision IS NOT DISTINCT FROM 'Approved')::int,
+            (NEW.desision IS NOT DISTINCT FROM 'Rejected')::int
+        )
+        ON CONFLICT (tender_id, shard) DO UPDATE SET
+            created = s.created + EXCLUDED.created,
+            published = s.published + EXCLUDED.published,
+            canceled = s.canceled + EXCLUDED.canceled,
+            approved = s.approved + EXCLUDED.approved,
+            rejected = s.rejected + EXCLUDED.rejected;
+    END IF;
+
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+
+CREATE TRIGGER create_tender_bid_summary
+AFTER INSERT ON tender
+FOR EACH ROW
+EXECUTE FUNCTION create_tender_bid_summary();
+
+CREATE TRIGGER count_bid
+AFTER INSERT OR DELETE OR UPDATE OF status, desision, tender_id ON bid
+FOR EACH ROW
+EXECUTE FUNCTION count_bid();
+
+CREATE TABLE job (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
+    kind VARCHAR(50) NOT NULL,
+    params JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'Queued'
+        CHECK (status IN ('Queued', 'Running', 'Succeeded', 'Failed', 'Canceled')),
+    creator_username VARCHAR(50) NOT NULL REFERENCES employee(username) ON DELETE CASCADE,
+    done BIGINT NOT NULL DEFAULT 0,
+    total BIGINT,
+    result JSONB,
+    error TEXT,
+    cancel_requested BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX job_queued_idx ON job (created_at, id) WHERE status = 'Queued';
+CREATE INDEX job_running_idx ON job (heartbeat_at) WHERE status = 'Running';
+CREATE INDEX job_finished_at_idx ON job (finished_at) WHERE finished_at IS NOT NULL;
@@ -0,0 +1,34 @@
+-- Время последнего изменения статуса или активной версии тендера и предложения.
+-- Нужно для токена since в POST /api/tenders/batch_status и /api/bids/batch_status
+
+BEGIN;
+
+ALTER TABLE tender ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE bid ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.status IS DISTINCT FROM OLD.status
+       OR NEW.active_version IS DISTINCT FROM OLD.active_version THEN
+        -- время изменения, а не начала транзакции: ближе к моменту коммита
+        NEW.updated_at = clock_timestamp()::timestamp;
+    END IF;
+    RETURN NEW;
+END;
+$$
+LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS touch_tender_updated_at ON tender;
+CREATE TRIGGER touch_tender_updated_at
+BEFORE UPDATE OF status, active_version ON tender
+FOR EACH ROW
+EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS touch_bid_updated_at ON bid;
+CREATE TRIGGER touch_bid_updated_at
+BEFORE UPDATE OF status, active_version ON bid
+FOR EACH ROW
+EXECUTE FUNCTION touch_updated_at();
+
+COMMIT;
@@ -0,0 +1,18 @@
+-- Сохраненные ответы для заголовка Idempotency-Key в POST /new
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS idempotency_key (
+    scope VARCHAR(50) NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code SMALLINT NOT NULL,
+    response TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scope, username, key)
+);
+
+CREATE INDEX IF NOT EXISTS idempotency_key_created_at_idx ON idempotency_key (created_at);
+
+COMMIT;
@@ -0,0 +1,60 @@
+-- Проверка членства создателя в организации только при вставке и при смене
+-- organization_id или creator_username. Смена статуса и active_version
+-- (редактирование, откат) больше не выполняет подзапрос по
+-- organization_responsible
+
+BEGIN;
+
+-- в старом create.sql колонка предложения называлась creatorUsername (без
+-- кавычек - creatorusername), и триггер на bid падал на каждой записи
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'bid' AND column_name = 'creatorusername'
+    ) THEN
+        ALTER TABLE bid RENAME COLUMN creatorusername TO creator_username;
+    END IF;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS organization_responsible_organization_user_idx
+    ON organization_responsible (organization_id, user_id);
+
+CREATE OR REPLACE FUNCTION check_employee_in_organization()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.organization_id IS NOT DISTINCT FROM OLD.organization_id
+       AND NEW.creator_username IS NOT DISTINCT FROM OLD.creator_username THEN
+        RETURN NEW;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1
+        FROM organization_responsible r
+        JOIN employee e ON e.id = r.user_id
+        WHERE r.organization_id = NEW.organization_id
+          AND e.username = NEW.creator_username
+    ) THEN
+        RAISE EXCEPTION 'Employee % is not a member of the organization %', NEW.creator_username, NEW.organization_id;
+    END IF;
+
+    RETURN NEW;
+END;
+$$
+LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS validate_tender_organization ON tender;
+CREATE TRIGGER validate_tender_organization
+BEFORE INSERT OR UPDATE OF organization_id, creator_username ON tender
+FOR EACH ROW
+EXECUTE FUNCTION check_employee_in_organization();
+
+DROP TRIGGER IF EXISTS validate_bid_organization ON bid;
+CREATE TRIGGER validate_bid_organization
+BEFORE INSERT OR UPDATE OF organization_id, creator_username ON bid
+FOR EACH ROW
+EXECUTE FUNCTION check_employee_in_organization();
+
+COMMIT;
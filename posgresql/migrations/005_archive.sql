@@ -0,0 +1,55 @@
+-- Архив закрытых тендеров и старых версий (core/database/archive.py).
+-- Внешних ключей нет: архивные строки не мешают удалять организации и сотрудников
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS tender_archive (
+    id UUID NOT NULL,
+    active_version int,
+    status tender_status NOT NULL,
+    organization_id UUID,
+    creator_username VARCHAR(50),
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS tender_version_archive (
+    tender_id UUID NOT NULL,
+    version int,
+    name VARCHAR(100),
+    description VARCHAR(500),
+    service_type VARCHAR(20) NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS bid_archive (
+    id UUID NOT NULL,
+    status bid_status,
+    desision bid_desision,
+    active_version int,
+    tender_id UUID,
+    organization_id UUID,
+    creator_username VARCHAR(50),
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS bid_version_archive (
+    bid_id UUID NOT NULL,
+    version int,
+    name VARCHAR(100),
+    description VARCHAR(500),
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS tender_archive_id_idx ON tender_archive (id);
+CREATE INDEX IF NOT EXISTS tender_version_archive_tender_id_idx ON tender_version_archive (tender_id, version);
+CREATE INDEX IF NOT EXISTS bid_archive_tender_id_idx ON bid_archive (tender_id);
+CREATE INDEX IF NOT EXISTS bid_version_archive_bid_id_idx ON bid_version_archive (bid_id, version);
+
+-- выборка закрытых тендеров для архивации без обхода всей таблицы
+CREATE INDEX IF NOT EXISTS tender_closed_updated_at_idx ON tender (updated_at) WHERE status = 'Closed';
+
+COMMIT;
@@ -0,0 +1,13 @@
+-- Индексы для GET /api/tenders с учетом видимости: опубликованные тендеры
+-- читаются в порядке страницы (created_at, id) без обхода созданных и
+-- закрытых, а неопубликованные - только по организациям пользователя
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS tender_published_created_at_idx
+    ON tender (created_at, id) WHERE status = 'Published';
+
+CREATE INDEX IF NOT EXISTS tender_unpublished_organization_idx
+    ON tender (organization_id, created_at, id) WHERE status <> 'Published';
+
+COMMIT;
@@ -0,0 +1,94 @@
+-- Счетчики предложений тендера по статусам и решениям для
+-- GET /api/tenders/{tenderId}/summary. Строка создается вместе с тендером,
+-- предложения меняют ее на +-1 триггером. Расхождения исправляет
+-- database/summary.py.
+-- Создание предложений одного тендера ждет на его строке счетчиков до коммита
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS tender_bid_summary (
+    tender_id UUID PRIMARY KEY REFERENCES tender(id) ON DELETE CASCADE,
+    created int NOT NULL DEFAULT 0,
+    published int NOT NULL DEFAULT 0,
+    canceled int NOT NULL DEFAULT 0,
+    approved int NOT NULL DEFAULT 0,
+    rejected int NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION create_tender_bid_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO tender_bid_summary (tender_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_bid()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.status IS NOT DISTINCT FROM OLD.status
+       AND NEW.desision IS NOT DISTINCT FROM OLD.desision
+       AND NEW.tender_id IS NOT DISTINCT FROM OLD.tender_id THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE tender_bid_summary SET
+            created = created - (OLD.status IS NOT DISTINCT FROM 'Created')::int,
+            published = published - (OLD.status IS NOT DISTINCT FROM 'Published')::int,
+            canceled = canceled - (OLD.status IS NOT DISTINCT FROM 'Canceled')::int,
+            approved = approved - (OLD.desision IS NOT DISTINCT FROM 'Approved')::int,
+            rejected = rejected - (OLD.desision IS NOT DISTINCT FROM 'Rejected')::int
+        WHERE tender_id = OLD.tender_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE tender_bid_summary SET
+            created = created + (NEW.status IS NOT DISTINCT FROM 'Created')::int,
+            published = published + (NEW.status IS NOT DISTINCT FROM 'Published')::int,
+            canceled = canceled + (NEW.status IS NOT DISTINCT FROM 'Canceled')::int,
+            approved = approved + (NEW.desision IS NOT DISTINCT FROM 'Approved')::int,
+            rejected = rejected + (NEW.desision IS NOT DISTINCT FROM 'Rejected')::int
+        WHERE tender_id = NEW.tender_id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS create_tender_bid_summary ON tender;
+CREATE TRIGGER create_tender_bid_summary
+AFTER INSERT ON tender
+FOR EACH ROW
+EXECUTE FUNCTION create_tender_bid_summary();
+
+DROP TRIGGER IF EXISTS count_bid ON bid;
+CREATE TRIGGER count_bid
+AFTER INSERT OR DELETE OR UPDATE OF status, desision, tender_id ON bid
+FOR EACH ROW
+EXECUTE FUNCTION count_bid();
+
+-- триггеры уже заблокировали запись в tender и bid до конца транзакции,
+-- поэтому начальные значения согласованы с ними
+INSERT INTO tender_bid_summary (tender_id, created, published, canceled, approved, rejected)
+SELECT
+    t.id,
+    count(b.id) FILTER (WHERE b.status = 'Created'),
+    count(b.id) FILTER (WHERE b.status = 'Published'),
+    count(b.id) FILTER (WHERE b.status = 'Canceled'),
+    count(b.id) FILTER (WHERE b.desision = 'Approved'),
+    count(b.id) FILTER (WHERE b.desision = 'Rejected')
+FROM tender t
+LEFT JOIN bid b ON b.tender_id = t.id
+GROUP BY t.id
+ON CONFLICT (tender_id) DO UPDATE SET
+    created = EXCLUDED.created,
+    published = EXCLUDED.published,
+    canceled = EXCLUDED.canceled,
+    approved = EXCLUDED.approved,
+    rejected = EXCLUDED.rejected;
+
+COMMIT;
@@ -0,0 +1,36 @@
+-- Первичные ключи UUID версии 7: новые строки дописываются в правую часть
+-- индекса первичного ключа. Приложение генерирует id само
+-- (core/database/ids.py), значение по умолчанию нужно для вставок мимо него.
+-- Существующие ключи не меняются
+
+BEGIN;
+
+-- 48 бит миллисекунд поверх случайного uuid4, биты версии 0100 -> 0111
+CREATE OR REPLACE FUNCTION uuid_generate_v7()
+RETURNS uuid AS $$
+    SELECT encode(
+        set_bit(
+            set_bit(
+                overlay(
+                    uuid_send(uuid_generate_v4())
+                    PLACING substring(
+                        int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3
+                    )
+                    FROM 1 FOR 6
+                ),
+                52, 1
+            ),
+            53, 1
+        ),
+        'hex'
+    )::uuid;
+$$
+LANGUAGE sql VOLATILE;
+
+ALTER TABLE employee ALTER COLUMN id SET DEFAULT uuid_generate_v7();
+ALTER TABLE organization ALTER COLUMN id SET DEFAULT uuid_generate_v7();
+ALTER TABLE organization_responsible ALTER COLUMN id SET DEFAULT uuid_generate_v7();
+ALTER TABLE tender ALTER COLUMN id SET DEFAULT uuid_generate_v7();
+ALTER TABLE bid ALTER COLUMN id SET DEFAULT uuid_generate_v7();
+
+COMMIT;
@@ -0,0 +1,30 @@
+-- Фоновые задачи POST /api/jobs (core/jobs.py). Воркер забирает задачу в
+-- статусе Queued с SKIP LOCKED и пока выполняет ее, обновляет heartbeat_at;
+-- задачу без обновлений дольше JOBS_STALE_AFTER секунд считает потерянной
+-- любой другой воркер
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS job (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v7(),
+    kind VARCHAR(50) NOT NULL,
+    params JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'Queued'
+        CHECK (status IN ('Queued', 'Running', 'Succeeded', 'Failed', 'Canceled')),
+    creator_username VARCHAR(50) NOT NULL REFERENCES employee(username) ON DELETE CASCADE,
+    done BIGINT NOT NULL DEFAULT 0,
+    total BIGINT,
+    result JSONB,
+    error TEXT,
+    cancel_requested BOOLEAN NOT NULL DEFAULT false,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS job_queued_idx ON job (created_at, id) WHERE status = 'Queued';
+CREATE INDEX IF NOT EXISTS job_running_idx ON job (heartbeat_at) WHERE status = 'Running';
+CREATE INDEX IF NOT EXISTS job_finished_at_idx ON job (finished_at) WHERE finished_at IS NOT NULL;
+
+COMMIT;
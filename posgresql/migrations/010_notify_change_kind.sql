@@ -0,0 +1,45 @@
+-- Вид события (tender или bid) передается аргументом триггера: у секций
+-- секционированной таблицы (core/database/partitioning.py) TG_TABLE_NAME -
+-- имя секции, например bid_p3, а не bid
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    row_json JSONB;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.status IS NOT DISTINCT FROM OLD.status
+       AND NEW.active_version IS NOT DISTINCT FROM OLD.active_version THEN
+        RETURN NULL;
+    END IF;
+    -- через jsonb, потому что у тендера нет колонки tender_id
+    row_json := to_jsonb(NEW);
+    PERFORM pg_notify('tender_changes', json_build_object(
+        'seq', nextval('change_event_seq'),
+        'kind', TG_ARGV[0],
+        'id', NEW.id,
+        'tender_id', COALESCE(row_json->>'tender_id', row_json->>'id'),
+        'organization_id', NEW.organization_id,
+        'status', NEW.status,
+        'version', NEW.active_version
+    )::text);
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS notify_tender_change ON tender;
+CREATE TRIGGER notify_tender_change
+AFTER INSERT OR UPDATE OF status, active_version ON tender
+FOR EACH ROW
+EXECUTE FUNCTION notify_change('tender');
+
+DROP TRIGGER IF EXISTS notify_bid_change ON bid;
+CREATE TRIGGER notify_bid_change
+AFTER INSERT OR UPDATE OF status, active_version ON bid
+FOR EACH ROW
+EXECUTE FUNCTION notify_change('bid');
+
+COMMIT;
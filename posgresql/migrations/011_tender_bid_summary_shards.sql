@@ -0,0 +1,91 @@
+-- Счетчики предложений тендера разбиты на строки (tender_id, shard): триггер
+-- count_bid прибавляет к строке pg_backend_pid() % 16 и создает ее при первой
+-- записи. Создание предложений одного тендера из разных соединений больше не
+-- ждет на одной строке до коммита, а пачка группового коммита блокирует по
+-- одной строке на тендер в порядке tender_id. Значение - сумма строк тендера,
+-- database/summary.py сворачивает строки обратно в shard 0.
+--
+-- Цена: чтение счетчиков - не одна строка по первичному ключу, а до 16
+-- строк одного диапазона индекса (tender_id, shard) и сумма по ним; после
+-- сверки строка снова одна
+
+BEGIN;
+
+ALTER TABLE tender_bid_summary ADD COLUMN IF NOT EXISTS shard smallint NOT NULL DEFAULT 0;
+ALTER TABLE tender_bid_summary DROP CONSTRAINT IF EXISTS tender_bid_summary_pkey;
+ALTER TABLE tender_bid_summary ADD CONSTRAINT tender_bid_summary_pkey PRIMARY KEY (tender_id, shard);
+
+CREATE OR REPLACE FUNCTION count_bid()
+RETURNS TRIGGER AS $$
+DECLARE
+    -- строка счетчиков своего соединения: параллельные транзакции пишут в
+    -- разные строки тендера, а одна транзакция (пачка группового коммита)
+    -- держит не больше одной строки на тендер
+    bid_shard smallint := pg_backend_pid() % 16;
+    -- строка OLD еще считается в живом тендере
+    old_counted boolean := true;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND NEW.status IS NOT DISTINCT FROM OLD.status
+       AND NEW.desision IS NOT DISTINCT FROM OLD.desision
+       AND NEW.tender_id IS NOT DISTINCT FROM OLD.tender_id THEN
+        RETURN NULL;
+    END IF;
+
+    -- тендер удаляется вместе с предложениями, его счетчики не нужны;
+    -- смена статуса внутри тендера (частый случай) тендер не проверяет
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.tender_id IS NULL THEN
+        -- предложение без тендера не считается
+        old_counted := false;
+    ELSIF TG_OP = 'DELETE' THEN
+        old_counted := EXISTS (SELECT 1 FROM tender WHERE id = OLD.tender_id);
+    ELSIF TG_OP = 'UPDATE' AND NEW.tender_id IS DISTINCT FROM OLD.tender_id THEN
+        old_counted := EXISTS (SELECT 1 FROM tender WHERE id = OLD.tender_id);
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') AND old_counted THEN
+        INSERT INTO tender_bid_summary AS s
+            (tender_id, shard, created, published, canceled, approved, rejected)
+        VALUES (
+            OLD.tender_id,
+            bid_shard,
+            -(OLD.status IS NOT DISTINCT FROM 'Created')::int,
+            -(OLD.status IS NOT DISTINCT FROM 'Published')::int,
+            -(OLD.status IS NOT DISTINCT FROM 'Canceled')::int,
+            -(OLD.desision IS NOT DISTINCT FROM 'Approved')::int,
+            -(OLD.desision IS NOT DISTINCT FROM 'Rejected')::int
+        )
+        ON CONFLICT (tender_id, shard) DO UPDATE SET
+            created = s.created + EXCLUDED.created,
+            published = s.published + EXCLUDED.published,
+            canceled = s.canceled + EXCLUDED.canceled,
+            approved = s.approved + EXCLUDED.approved,
+            rejected = s.rejected + EXCLUDED.rejected;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.tender_id IS NOT NULL THEN
+        INSERT INTO tender_bid_summary AS s
+            (tender_id, shard, created, published, canceled, approved, rejected)
+        VALUES (
+            NEW.tender_id,
+            bid_shard,
+            (NEW.status IS NOT DISTINCT FROM 'Created')::int,
+            (NEW.status IS NOT DISTINCT FROM 'Published')::int,
+            (NEW.status IS NOT DISTINCT FROM 'Canceled')::int,
+            (NEW.desision IS NOT DISTINCT FROM 'Approved')::int,
+            (NEW.desision IS NOT DISTINCT FROM 'Rejected')::int
+        )
+        ON CONFLICT (tender_id, shard) DO UPDATE SET
+            created = s.created + EXCLUDED.created,
+            published = s.published + EXCLUDED.published,
+            canceled = s.canceled + EXCLUDED.canceled,
+            approved = s.approved + EXCLUDED.approved,
+            rejected = s.rejected + EXCLUDED.rejected;
+    END IF;
+
+    RETURN NULL;
+END;
+$$
+LANGUAGE plpgsql;
+
+COMMIT;
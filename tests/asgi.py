@@ -0,0 +1,53 @@
+"""Вызов ASGI-приложения без сервера: ответ собирается из отправленных сообщений"""
+
+import asyncio
+
+
+class Response:
+    def __init__(self, messages: list):
+        start = messages[0]
+        self.status = start["status"]
+        self.headers = {key.decode(): value.decode() for key, value in start.get("headers", [])}
+        self.chunks = [message.get("body", b"") for message in messages[1:]]
+        self.body = b"".join(self.chunks)
+
+
+async def call(app, method="GET", path="/", query_string=b"", headers=(), body=b"") -> Response:
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # клиент не отключается
+        await asyncio.Event().wait()
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return Response(messages)
+
+
+def body_app(chunks, content_type=b"application/json", status=200):
+    """Приложение, отвечающее частями chunks"""
+
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type)]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        for i, chunk in enumerate(chunks):
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1}
+            )
+
+    return app
@@ -0,0 +1,86 @@
+import asyncio
+
+from admission import AdmissionControl, AdmissionMiddleware
+from asgi import body_app, call
+
+
+def control(read_limit=1, write_limit=1, queue_timeout=0.05):
+    return AdmissionControl(
+        read_limit=read_limit,
+        write_limit=write_limit,
+        queue_timeout=queue_timeout,
+        read_paths=["/api/tenders/batch_get"],
+    )
+
+
+def test_gate_by_method_and_read_paths():
+    admission = control()
+    assert admission.gate("GET") is admission.reads
+    assert admission.gate("HEAD") is admission.reads
+    assert admission.gate("POST", "/api/tenders/batch_get") is admission.reads
+    assert admission.gate("POST", "/api/tenders/new") is admission.writes
+    assert admission.gate("PUT", "/api/bids/1/edit") is admission.writes
+
+
+def test_rejects_with_retry_after_when_queue_times_out():
+    admission = control()
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow(scope, receive, send):
+            await release.wait()
+            await body_app([b"{}"])(scope, receive, send)
+
+        middleware = AdmissionMiddleware(slow, admission, retry_after=7)
+        first = asyncio.create_task(call(middleware, path="/api/tenders"))
+        await asyncio.sleep(0)
+        assert admission.reads.in_flight == 1
+        rejected = await call(middleware, path="/api/tenders")
+        release.set()
+        return await first, rejected
+
+    first, rejected = asyncio.run(scenario())
+    assert first.status == 200
+    assert rejected.status == 503
+    assert rejected.headers["retry-after"] == "7"
+    assert b"server is overloaded" in rejected.body
+    assert admission.reads.rejected == 1
+    assert admission.reads.in_flight == 0
+    assert admission.writes.rejected == 0
+
+
+def test_waiting_request_is_admitted_after_release_and_marks_saturation():
+    admission = control(queue_timeout=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow(scope, receive, send):
+            await release.wait()
+            await body_app([b"{}"])(scope, receive, send)
+
+        middleware = AdmissionMiddleware(slow, admission, retry_after=1)
+        first = asyncio.create_task(call(middleware, method="POST", path="/api/tenders/new"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(call(middleware, method="POST", path="/api/tenders/new"))
+        await asyncio.sleep(0)
+        saturated = admission.saturated
+        release.set()
+        return saturated, await first, await second
+
+    saturated, first, second = asyncio.run(scenario())
+    assert saturated
+    assert (first.status, second.status) == (200, 200)
+    assert not admission.saturated
+    assert admission.writes.in_flight == 0
+
+
+def test_exempt_paths_bypass_the_gate():
+    admission = control(read_limit=0)
+    middleware = AdmissionMiddleware(
+        body_app([b"ok"], b"text/plain"), admission, retry_after=1, exempt_paths=["/api/ping"]
+    )
+    response = asyncio.run(call(middleware, path="/api/ping"))
+    assert response.status == 200
+    assert admission.reads.in_flight == 0
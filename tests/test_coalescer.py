@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+from database.coalescer import (
+    ABANDONED,
+    CLAIMED,
+    QUEUED,
+    BidCoalescer,
+    BidNotWritten,
+    BidOutcomeUnknown,
+    PendingBid,
+)
+from deadline import RequestDeadline, current_deadline
+
+
+class FakeCoalescer(BidCoalescer):
+    """Пачка «записывается» без базы: flush ждет release и выдает номера строк"""
+
+    def __init__(self, **timeouts):
+        timeouts = {"wait_timeout": 1, "claimed_timeout": 1, **timeouts}
+        super().__init__(None, window=0.01, max_batch=10, statement_timeout=1, **timeouts)
+        self.release = threading.Event()
+        self.release.set()
+        self.flushing = threading.Event()
+        self.flushed = []
+
+    def flush(self, batch: list) -> None:
+        self.flushing.set()
+        self.release.wait()
+        for pending in batch:
+            if pending.values.get("fail"):
+                pending.error = ValueError("bad row")
+            else:
+                pending.result = (pending.values["n"],)
+        self.flushed.append([pending.values["n"] for pending in batch])
+
+
+def pending(n=0, deadline=None):
+    return PendingBid({"n": n}, {}, deadline)
+
+
+def test_claim_takes_queued_rows_and_drops_given_up_ones():
+    coalescer = FakeCoalescer()
+    expired = RequestDeadline(time.monotonic() - 1)
+    disconnected = RequestDeadline(None)
+    disconnected.disconnected = True
+    alive = RequestDeadline(time.monotonic() + 60)
+    abandoned = pending(4)
+    assert coalescer.abandon(abandoned)
+    batch = [pending(0), pending(1, expired), pending(2, disconnected), pending(3, alive), abandoned]
+
+    claimed = coalescer.claim(batch)
+
+    assert claimed == [batch[0], batch[3]]
+    assert [row.state for row in batch] == [CLAIMED, ABANDONED, ABANDONED, CLAIMED, ABANDONED]
+    for row in batch[1:3]:
+        assert row.done.is_set()
+        assert isinstance(row.error, BidNotWritten)
+    assert coalescer.abandoned == 3
+
+
+def test_abandon_only_queued_rows():
+    coalescer = FakeCoalescer()
+    row = pending()
+    assert row.state == QUEUED
+    coalescer.claim([row])
+    assert not coalescer.abandon(row)
+    assert row.state == CLAIMED
+    assert coalescer.abandoned == 0
+
+
+def test_submit_returns_row_or_its_error():
+    coalescer = FakeCoalescer()
+    assert coalescer.submit({"n": 7}, {}) == (7,)
+    with pytest.raises(ValueError, match="bad row"):
+        coalescer.submit({"n": 8, "fail": True}, {})
+    stats = coalescer.stats()
+    assert (stats["batches"], stats["rows"], stats["alive"]) == (2, 2, True)
+
+
+def test_row_not_claimed_in_time_is_abandoned_and_never_written():
+    coalescer = FakeCoalescer(wait_timeout=0.05)
+    coalescer.release.clear()
+    first = threading.Thread(target=coalescer.submit, args=({"n": 1}, {}))
+    first.start()
+    coalescer.flushing.wait()
+    # поток пачек занят первой строкой, вторая ждет в очереди
+    with pytest.raises(BidNotWritten):
+        coalescer.submit({"n": 2}, {})
+    coalescer.release.set()
+    first.join()
+    # брошенная строка доходит до потока пачек и отбрасывается в claim
+    coalescer.submit({"n": 3}, {})
+    assert coalescer.flushed == [[1], [3]]
+    assert coalescer.abandoned == 1
+
+
+def test_request_deadline_caps_the_queue_wait():
+    coalescer = FakeCoalescer(wait_timeout=60)
+    coalescer.release.clear()
+    threading.Thread(target=coalescer.submit, args=({"n": 1}, {}), daemon=True).start()
+    coalescer.flushing.wait()
+    token = current_deadline.set(RequestDeadline(time.monotonic() + 0.05))
+    try:
+        started = time.monotonic()
+        with pytest.raises(BidNotWritten):
+            coalescer.submit({"n": 2}, {})
+        assert time.monotonic() - started < 1
+    finally:
+        current_deadline.reset(token)
+        coalescer.release.set()
+
+
+def test_claimed_row_that_outlives_claimed_timeout_is_unknown():
+    coalescer = FakeCoalescer(wait_timeout=0.05, claimed_timeout=0.05)
+    coalescer.release.clear()
+    try:
+        with pytest.raises(BidOutcomeUnknown):
+            coalescer.submit({"n": 1}, {})
+        assert coalescer.unknown == 1
+        assert coalescer.abandoned == 0
+    finally:
+        coalescer.release.set()
+
+
+def test_batch_thread_survives_errors():
+    coalescer = FakeCoalescer()
+    collect = coalescer.collect
+
+    def broken():
+        coalescer.collect = collect
+        raise RuntimeError("boom")
+
+    coalescer.collect = broken
+    coalescer.start()
+    assert coalescer.submit({"n": 3}, {}) == (3,)
+    assert coalescer.stats()["alive"]
@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+
+import compression
+from asgi import body_app, call
+from compression import CompressionMiddleware, compressible, negotiate
+
+
+def test_negotiate_picks_highest_q():
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("identity") is None
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("gzip;q=0.5, *;q=0.1") == "gzip"
+    assert negotiate("GZIP ; q=0.8") == "gzip"
+    assert negotiate("gzip;q=abc") is None
+
+
+def test_negotiate_prefers_server_order_on_equal_q(monkeypatch):
+    encoders = {"zstd": None, "br": None, "gzip": None}
+    monkeypatch.setattr(compression, "ENCODERS", encoders)
+    assert negotiate("gzip, br, zstd") == "zstd"
+    assert negotiate("gzip, br;q=0.9") == "gzip"
+    assert negotiate("*") == "zstd"
+    assert negotiate("*, zstd;q=0") == "br"
+
+
+def test_compressible():
+    assert compressible([(b"content-type", b"application/json")])
+    assert compressible([(b"Content-Type", b"text/plain; charset=utf-8")])
+    assert not compressible([(b"content-type", b"text/event-stream")])
+    assert not compressible([(b"content-type", b"image/png")])
+    assert not compressible(
+        [(b"content-type", b"application/json"), (b"content-encoding", b"gzip")]
+    )
+
+
+def compress(
+    chunks,
+    accept="gzip",
+    min_size=100,
+    level=6,
+    method="GET",
+    content_type=b"application/json",
+    route_levels=None,
+):
+    app = CompressionMiddleware(body_app(chunks, content_type), min_size, level, route_levels)
+    headers = [("accept-encoding", accept)]
+    return asyncio.run(call(app, method=method, path="/api/tenders", headers=headers))
+
+
+def test_small_body_is_sent_as_is():
+    response = compress([b"{", b"}"])
+    assert response.body == b"{}"
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "accept-encoding"
+
+
+def test_body_over_min_size_is_gzipped():
+    chunks = [b"[" + b"1," * 100, b"1]"]
+    response = compress(chunks)
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(response.body) == b"".join(chunks)
+
+
+def test_streamed_parts_after_threshold_are_flushed_separately():
+    chunks = [b"x" * 60, b"y" * 60, b"z" * 60]
+    response = compress(chunks, content_type=b"text/plain")
+    # первые две части ушли одним сжатым блоком, третья - отдельным
+    assert len(response.chunks) == 2
+    assert gzip.decompress(response.body) == b"".join(chunks)
+
+
+def test_skipped_without_accept_or_level_or_for_head():
+    body = [b"a" * 200]
+    assert "content-encoding" not in compress(body, accept="identity").headers
+    assert "content-encoding" not in compress(body, level=0).headers
+    assert "content-encoding" not in compress(body, route_levels={"/api/tenders": 0}).headers
+    assert "content-encoding" not in compress(body, method="HEAD").headers
+    assert "content-encoding" not in compress(body, content_type=b"image/png").headers
+
+
+def test_optional_encoders_round_trip():
+    chunks = [b"[" + b"1," * 100, b"1]"]
+    if compression.brotli is not None:
+        response = compress(chunks, accept="br")
+        assert response.headers["content-encoding"] == "br"
+        assert compression.brotli.decompress(response.body) == b"".join(chunks)
+    if compression.zstandard is not None:
+        response = compress(chunks, accept="zstd")
+        assert response.headers["content-encoding"] == "zstd"
+        decompressor = compression.zstandard.ZstdDecompressor().decompressobj()
+        assert decompressor.decompress(response.body) == b"".join(chunks)
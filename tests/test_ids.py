@@ -0,0 +1,42 @@
+import time
+from types import SimpleNamespace
+
+import database.ids as ids
+
+
+def frozen_clock(monkeypatch, ms):
+    monkeypatch.setattr(ids, "time", SimpleNamespace(time_ns=lambda: ms * 1_000_000))
+
+
+def test_uuid7_layout():
+    before = time.time()
+    value = ids.uuid7()
+    assert value.version == 7
+    assert value.variant == "specified in RFC 4122"
+    assert before - 0.001 <= ids.timestamp(value) <= time.time() + 0.001
+    assert len(str(value)) == 36
+
+
+def test_uuid7_is_strictly_increasing():
+    values = [ids.uuid7() for _ in range(10_000)]
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+
+
+def test_uuid7_survives_clock_going_back(monkeypatch):
+    frozen_clock(monkeypatch, 2_000_000_000_000)
+    first = ids.uuid7()
+    frozen_clock(monkeypatch, 1_000_000_000_000)
+    second = ids.uuid7()
+    assert second > first
+    assert ids.timestamp(second) == ids.timestamp(first)
+
+
+def test_uuid7_takes_next_millisecond_when_counter_is_exhausted(monkeypatch):
+    frozen_clock(monkeypatch, 3_000_000_000_000)
+    first = ids.uuid7()
+    monkeypatch.setattr(ids, "_counter", 0xFFF)
+    second = ids.uuid7()
+    assert second > first
+    assert second.int >> 80 == (first.int >> 80) + 1
+    assert (second.int >> 64) & 0xFFF == 0
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+from listcache import ListCache
+from models import TenderServiceType
+
+CONSTRUCTION = TenderServiceType.Construction
+DELIVERY = TenderServiceType.Delivery
+
+
+def store(cache, key, body, now=0):
+    cache.put(key, body, cache.generations(key), now=now)
+
+
+def test_key_normalizes_service_types():
+    assert ListCache.key([DELIVERY, CONSTRUCTION, DELIVERY], 5, 0) == (
+        ("Construction", "Delivery"),
+        5,
+        0,
+    )
+    assert ListCache.key(None, 5, 10) == ((), 5, 10)
+
+
+def test_hit_until_ttl():
+    cache = ListCache(max_bytes=100, ttl=10)
+    key = cache.key(None, 5, 0)
+    assert cache.get(key, now=0) == (None, False)
+    store(cache, key, b"page")
+    assert cache.get(key, now=9) == (b"page", False)
+    assert cache.get(key, now=10) == (None, False)
+    assert cache.stats() == {"pages": 0, "bytes": 0, "hits": 1, "stale_hits": 0, "misses": 2}
+
+
+def test_type_bump_invalidates_only_matching_pages():
+    cache = ListCache(max_bytes=100, ttl=10)
+    construction = cache.key([CONSTRUCTION], 5, 0)
+    delivery = cache.key([DELIVERY], 5, 0)
+    unfiltered = cache.key(None, 5, 0)
+    for key in (construction, delivery, unfiltered):
+        store(cache, key, b"page")
+    cache.bump("Construction")
+    assert cache.get(construction, now=1)[0] is None
+    assert cache.get(delivery, now=1)[0] == b"page"
+    assert cache.get(unfiltered, now=1)[0] is None
+
+
+def test_change_events_bump_all_pages():
+    cache = ListCache(max_bytes=100, ttl=10)
+    key = cache.key([DELIVERY], 5, 0)
+    store(cache, key, b"page")
+    cache.on_change(SimpleNamespace(kind="bid"))
+    assert cache.get(key, now=1)[0] == b"page"
+    cache.on_change(SimpleNamespace(kind="tender"))
+    assert cache.get(key, now=1)[0] is None
+    store(cache, key, b"page", now=1)
+    # события терялись
+    cache.on_change(None)
+    assert cache.get(key, now=1)[0] is None
+
+
+def test_generations_taken_before_a_write_make_the_page_stale():
+    cache = ListCache(max_bytes=100, ttl=10)
+    key = cache.key(None, 5, 0)
+    generations = cache.generations(key)
+    cache.bump("Delivery")
+    cache.put(key, b"page", generations, now=0)
+    assert cache.get(key, now=0)[0] is None
+
+
+def test_evicts_least_recently_read_pages_over_max_bytes():
+    cache = ListCache(max_bytes=10, ttl=10)
+    keys = [cache.key(None, 5, offset) for offset in range(3)]
+    store(cache, keys[0], b"aaaa")
+    store(cache, keys[1], b"bbbb")
+    cache.get(keys[0], now=0)
+    store(cache, keys[2], b"cccc")
+    assert list(cache.pages) == [keys[0], keys[2]]
+    assert cache.size == 8
+    # тело больше всего кэша не кладется
+    store(cache, keys[1], b"x" * 11)
+    assert keys[1] not in cache.pages
+
+
+def test_stale_page_is_served_while_one_caller_revalidates():
+    cache = ListCache(max_bytes=100, ttl=10, stale_while_revalidate=5)
+    key = cache.key(None, 5, 0)
+    store(cache, key, b"old")
+    assert cache.get(key, now=11) == (b"old", True)
+    assert cache.get(key, now=12) == (b"old", False)
+    cache.refreshed(key)
+    assert cache.get(key, now=13) == (b"old", True)
+    # stale_while_revalidate отсчитывается от момента устаревания
+    assert cache.get(key, now=15) == (None, False)
+    assert cache.stats()["stale_hits"] == 3
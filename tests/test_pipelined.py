@@ -0,0 +1,95 @@
+"""Нужна база со схемой posgresql/create.sql: TEST_POSTGRES_CONN=postgresql+psycopg://..."""
+
+import os
+import uuid
+
+import database.queries as queries
+import pytest
+from database.driver import connect_args, execute_pipelined
+from models import TenderServiceType
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+URL = os.environ.get("TEST_POSTGRES_CONN")
+
+pytestmark = pytest.mark.skipif(
+    not URL or not URL.startswith("postgresql+psycopg://"),
+    reason="TEST_POSTGRES_CONN with psycopg 3 is not set",
+)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine(URL, connect_args=connect_args(URL))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    """Сессия с тендером и предложением; все откатывается в конце"""
+    ids = {
+        "organization": uuid.uuid4(),
+        "tender": uuid.uuid4(),
+        "bid": uuid.uuid4(),
+        "username": f"test_{uuid.uuid4().hex[:8]}",
+    }
+    with Session(engine) as session:
+        for statement in (
+            "INSERT INTO organization (id, name) VALUES (:organization, 'test')",
+            "INSERT INTO employee (username) VALUES (:username)",
+            "INSERT INTO organization_responsible (organization_id, user_id) "
+            "SELECT :organization, id FROM employee WHERE username = :username",
+            "INSERT INTO tender (id, status, organization_id, creator_username) "
+            "VALUES (:tender, 'Published', :organization, :username)",
+            "INSERT INTO tender_version (tender_id, name, description, service_type) "
+            "VALUES (:tender, 'test', 'test', 'Delivery')",
+            "INSERT INTO bid (id, tender_id, organization_id, creator_username) "
+            "VALUES (:bid, :tender, :organization, :username)",
+            "INSERT INTO bid_version (bid_id, name, description) VALUES (:bid, 'test', 'test')",
+        ):
+            session.execute(text(statement), ids)
+        session.info["ids"] = ids
+        yield session
+        session.rollback()
+
+
+def hot_statements(ids: dict) -> list:
+    return [
+        queries.tender_creator(ids["tender"]),
+        queries.tenders_by_ids([ids["tender"], uuid.uuid4()], ids["username"]),
+        queries.tenders_page([TenderServiceType.Delivery], ids["username"], 5, 0),
+        queries.bids_for_tender(ids["tender"], 5, 0),
+        queries.bid_status(ids["bid"]),
+        queries.memberships(ids["username"]),
+    ]
+
+
+def test_rows_match_session_execute(session):
+    statements = hot_statements(session.info["ids"])
+    expected = [session.execute(statement).all() for statement in statements]
+
+    rows = [result.all() for result in execute_pipelined(session, *statements)]
+
+    assert rows == expected
+    assert all(expected)
+    # те же типы, что после обработки SQLAlchemy
+    for pipelined, plain in zip(rows, expected):
+        assert [type(value) for value in pipelined[0]] == [type(value) for value in plain[0]]
+
+
+def test_uses_the_engine_compiled_cache(session, engine):
+    statements = hot_statements(session.info["ids"])
+    execute_pipelined(session, *statements)
+    cached = len(engine._compiled_cache)
+    # другие значения параметров - те же скомпилированные запросы
+    execute_pipelined(session, *hot_statements(session.info["ids"]))
+    assert len(engine._compiled_cache) == cached
+
+
+def test_driver_errors_are_wrapped(session):
+    with pytest.raises(DBAPIError):
+        execute_pipelined(
+            session, queries.bid_status(session.info["ids"]["bid"]), select(text("1/0"))
+        )
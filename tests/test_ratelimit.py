@@ -0,0 +1,87 @@
+import asyncio
+
+from asgi import body_app, call
+from ratelimit import RateLimiter, RateLimitMiddleware, parse_quota, query_param
+
+
+def test_bucket_spends_and_refills():
+    limiter = RateLimiter(2, 10)
+    assert limiter.check("alice", now=0) == (True, 1, 5)
+    assert limiter.check("alice", now=0) == (True, 0, 10)
+    assert limiter.check("alice", now=0) == (False, 0, 5)
+    assert limiter.check("alice", now=4)[0] is False
+    assert limiter.check("alice", now=5) == (True, 0, 10)
+    # пополнение не превышает limit
+    assert limiter.check("alice", now=1000) == (True, 1, 5)
+
+
+def test_keys_have_separate_buckets():
+    limiter = RateLimiter(1, 1)
+    assert limiter.check("alice", now=0)[0]
+    assert not limiter.check("alice", now=0)[0]
+    assert limiter.check("bob", now=0)[0]
+
+
+def test_evicts_least_recent_keys_over_max_keys():
+    limiter = RateLimiter(1, 1, max_keys=2)
+    limiter.check("a", now=0)
+    limiter.check("b", now=0)
+    limiter.check("a", now=0)
+    limiter.check("c", now=0)
+    assert list(limiter.buckets) == ["a", "c"]
+
+
+def test_evicts_idle_keys():
+    limiter = RateLimiter(1, 1, idle_ttl=10)
+    limiter.check("a", now=0)
+    limiter.check("b", now=5)
+    limiter.check("c", now=12)
+    assert list(limiter.buckets) == ["b", "c"]
+
+
+def test_parse_quota_and_query_param():
+    assert parse_quota("20/10") == (20, 10.0)
+    assert parse_quota("5") == (5, 1.0)
+    assert query_param(b"limit=5&username=user%201", b"username") == "user 1"
+    assert query_param(b"limit=5", b"username") is None
+
+
+def middleware():
+    return RateLimitMiddleware(
+        body_app([b"{}"]), {"/api/bids": "1/60", "/api/bids/new": "2/60"}, max_keys=10, idle_ttl=600
+    )
+
+
+def test_rejects_with_429_and_retry_after():
+    app = middleware()
+
+    async def scenario():
+        first = await call(app, path="/api/bids/my", query_string=b"username=alice")
+        second = await call(app, path="/api/bids/my", query_string=b"username=alice")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.status == 200
+    assert first.headers["ratelimit-limit"] == "1"
+    assert first.headers["ratelimit-remaining"] == "0"
+    assert second.status == 429
+    assert second.headers["retry-after"] == "60"
+    assert b"rate limit exceeded" in second.body
+
+
+def test_longest_prefix_wins_and_anonymous_requests_pass():
+    app = middleware()
+
+    async def scenario():
+        new = [
+            await call(app, method="POST", path="/api/bids/new", query_string=b"username=alice")
+            for _ in range(2)
+        ]
+        anonymous = [await call(app, path="/api/bids/my") for _ in range(3)]
+        return new, anonymous
+
+    new, anonymous = asyncio.run(scenario())
+    assert [response.status for response in new] == [200, 200]
+    assert new[0].headers["ratelimit-limit"] == "2"
+    assert [response.status for response in anonymous] == [200, 200, 200]
+    assert "ratelimit-limit" not in anonymous[0].headers
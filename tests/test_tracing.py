@@ -0,0 +1,30 @@
+import pytest
+from tracing import parse_traceparent
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+
+
+def test_parses_sampled_and_unsampled():
+    assert parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-01") == (TRACE_ID, SPAN_ID, True)
+    assert parse_traceparent(f" 00-{TRACE_ID}-{SPAN_ID}-00 ") == (TRACE_ID, SPAN_ID, False)
+    # будущие версии могут дописывать поля
+    assert parse_traceparent(f"01-{TRACE_ID}-{SPAN_ID}-03-extra") == (TRACE_ID, SPAN_ID, True)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        "",
+        f"00-{TRACE_ID}-{SPAN_ID}",
+        f"00-{TRACE_ID[:-1]}-{SPAN_ID}-01",
+        f"00-{TRACE_ID}-{SPAN_ID}0-01",
+        f"00-{TRACE_ID[:-1]}x-{SPAN_ID}-01",
+        f"00-{TRACE_ID}-{SPAN_ID}-zz",
+        f"00-{'0' * 32}-{SPAN_ID}-01",
+        f"00-{TRACE_ID}-{'0' * 16}-01",
+    ],
+)
+def test_rejects_invalid(value):
+    assert parse_traceparent(value) is None